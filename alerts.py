@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Los errores iguales dentro de la ventana se mandan como uno solo con el contador
+ALERT_WINDOW_SECONDS = float(os.getenv('ALERT_WINDOW_SECONDS', '60'))
+# Máximo de alertas distintas pendientes; al pasarlo se descartan las de menor prioridad
+ALERT_MAX_PENDING = int(os.getenv('ALERT_MAX_PENDING', '100'))
+# Máximo de alertas por mensaje al webhook
+ALERT_BATCH_SIZE = int(os.getenv('ALERT_BATCH_SIZE', '20'))
+
+_lock = threading.Lock()
+_flush_now = threading.Event()
+# fingerprint → {'text', 'priority', 'count', 'first_seen'}
+_pending = {}
+_dispatcher = None
+_counters = {
+    'received': 0,
+    'aggregated': 0,
+    'dropped': 0,
+    'sent_batches': 0,
+    'send_errors': 0
+}
+
+def fingerprint(text):
+    # Los números (status codes, ids, timestamps) no distinguen a un error de otro
+    normalized = re.sub(r'\d+', '#', text)[:300]
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def _ensure_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _lock:
+            if _dispatcher is None:
+                _dispatcher = threading.Thread(target=_dispatch_loop, name='alert-dispatcher', daemon=True)
+                _dispatcher.start()
+
+def dispatch(text, priority=PRIORITY_NORMAL):
+    """Encola la alerta sin bloquear. Se envía agrupada en el próximo flush"""
+    _ensure_dispatcher()
+    key = fingerprint(text)
+    with _lock:
+        _counters['received'] += 1
+        entry = _pending.get(key)
+        if entry:
+            entry['count'] += 1
+            entry['priority'] = min(entry['priority'], priority)
+            _counters['aggregated'] += 1
+        else:
+            if len(_pending) >= ALERT_MAX_PENDING:
+                # Sobrecarga: desplazar una alerta de menor prioridad, o descartar la nueva
+                lowest_key = max(_pending, key=lambda k: _pending[k]['priority'])
+                if _pending[lowest_key]['priority'] <= priority:
+                    _counters['dropped'] += 1
+                    return
+                del _pending[lowest_key]
+                _counters['dropped'] += 1
+            _pending[key] = {'text': text, 'priority': priority, 'count': 1, 'first_seen': time.time()}
+
+    if priority == PRIORITY_HIGH:
+        _flush_now.set()
+
+def _format(entry):
+    if entry['count'] == 1:
+        return entry['text']
+    elapsed = max(1, round(time.time() - entry['first_seen']))
+    return f"{entry['text']} ×{entry['count']} en los últimos {elapsed}s"
+
+def flush():
+    """Envía todas las alertas pendientes, de mayor a menor prioridad"""
+    from utils import post_to_webhook
+
+    with _lock:
+        entries = sorted(_pending.values(), key=lambda e: (e['priority'], e['first_seen']))
+        _pending.clear()
+
+    for start in range(0, len(entries), ALERT_BATCH_SIZE):
+        batch = entries[start:start + ALERT_BATCH_SIZE]
+        try:
+            post_to_webhook("\n".join(_format(entry) for entry in batch))
+            with _lock:
+                _counters['sent_batches'] += 1
+        except Exception as e:
+            with _lock:
+                _counters['send_errors'] += 1
+            logging.error("Error enviando alertas al webhook: %s", e)
+
+def _dispatch_loop():
+    while True:
+        _flush_now.wait(ALERT_WINDOW_SECONDS)
+        _flush_now.clear()
+        try:
+            flush()
+        except Exception as e:
+            logging.error("Error en el dispatcher de alertas: %s", e)
+
+def get_stats():
+    with _lock:
+        return {
+            **_counters,
+            'pending': len(_pending)
+        }
@@ -1,21 +1,52 @@
 import os, logging
-import requests
+import asyncio
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+import http_client
 from datetime import datetime
 from utils import send_slack
+import asana_users
+import asana_invariants
+import log_pipeline
+import metrics
 #from dotenv import load_dotenv
 
 #load_dotenv()
 
 ASANA_PAT = os.getenv('ASANA_PERSONAL_ACCESS_TOKEN')
 
-def create_asana_task(name, assignee_email, project_id, due_on=None, description=None, subtasks=None):
-    logging.info("Args received:")
-    logging.info(f"name={name}, assignee_email={assignee_email}, project_id={project_id}, due_on={due_on}, description={description}, subtasks={subtasks}")
-    headers = {
+# Cómo se crean las subtareas: 'batch' usa el endpoint /batch de Asana, 'parallel' un pool de threads.
+# En los dos casos Asana las crea en paralelo; el orden se corrige después (ver _restore_order)
+ASANA_SUBTASK_MODE = os.getenv('ASANA_SUBTASK_MODE', 'batch')
+ASANA_SUBTASK_WORKERS = int(os.getenv('ASANA_SUBTASK_WORKERS', '4'))
+# Asana acepta como máximo 10 acciones por request a /batch
+ASANA_BATCH_MAX_ACTIONS = 10
+
+class AsanaError(Exception):
+    """Respuesta de error de la API de Asana. retryable es False para los 4xx (salvo 429):
+    el mismo request va a volver a fallar, job_queue no lo reintenta"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = status_code == 429 or status_code >= 500
+
+def _json_headers():
+    return {
         'Authorization': f'Bearer {ASANA_PAT}',
         'Content-Type': 'application/json'
     }
-    
+
+def _log_create(project_id, assignee_email, due_on, subtasks, assignee_gid):
+    logging.info("create_asana_task", extra=log_pipeline.fields(
+        project_id=project_id,
+        assignee_gid=assignee_gid,
+        has_assignee_email=bool(assignee_email),
+        due_on=due_on,
+        subtask_count=len(subtasks.splitlines()) if subtasks else 0
+    ))
+
+def _task_payload(name, project_id, due_on, description, assignee_gid):
     task_data = {
         'data': {
             'name': name,
@@ -27,15 +58,8 @@ def create_asana_task(name, assignee_email, project_id, due_on=None, description
     if description:
         task_data['data']['notes'] = description
     
-    assignee_gid = None
-    if assignee_email:
-        logging.info(f"Buscando usuario en Asana con email: {assignee_email}")
-        assignee_gid = get_user_by_email(assignee_email)
-        if assignee_gid:
-            logging.info(f"Usuario encontrado en Asana: {assignee_gid}")
-            task_data['data']['assignee'] = assignee_gid
-        else:
-            logging.warning(f"Usuario NO encontrado en Asana con email: {assignee_email}")
+    if assignee_gid:
+        task_data['data']['assignee'] = assignee_gid
     
     if due_on:
         try:
@@ -45,111 +69,353 @@ def create_asana_task(name, assignee_email, project_id, due_on=None, description
         except:
             pass
     
-    response = requests.post(
-        'https://app.asana.com/api/1.0/tasks',
-        headers=headers,
-        json=task_data
+    return task_data
+
+def _resolve_assignee(assignee_email):
+    # El email no se loguea: alcanza con saber si se encontró el usuario
+    assignee_gid = get_user_by_email(assignee_email)
+    if assignee_gid:
+        logging.info("Usuario encontrado en Asana", extra=log_pipeline.fields(assignee_gid=assignee_gid))
+    else:
+        logging.warning("Usuario NO encontrado en Asana por email")
+    return assignee_gid
+
+def _subtask_names(subtasks):
+    return [s.strip() for s in subtasks.split('\n') if s.strip()] if subtasks else []
+
+def _report_subtask_failures(task_gid, subtask_list, subtask_failures):
+    if subtask_failures:
+        details = "\n".join(f"- {subtask_name}: {error}" for subtask_name, error in subtask_failures)
+        logging.error("Error creating %s/%s subtasks of %s:\n%s", len(subtask_failures), len(subtask_list), task_gid,
+                      details)
+        send_slack(f"Error creating {len(subtask_failures)}/{len(subtask_list)} subtasks of {task_gid}:\n{details}")
+
+def _task_result(project_id, task_gid, assignee_gid, subtask_failures):
+    return {
+        'gid': task_gid,
+        'url': f"https://app.asana.com/0/{project_id}/{task_gid}",
+        'assignee_found': assignee_gid is not None,
+        'subtask_failures': [subtask_name for subtask_name, _ in subtask_failures]
+    }
+
+def _created_result(project_id, task_gid, assignee_gid, subtasks):
+    """Resultado de una tarea recién creada cuyas subtareas todavía no se crearon"""
+    return {
+        **_task_result(project_id, task_gid, assignee_gid, []),
+        'subtasks_incomplete': bool(_subtask_names(subtasks))
+    }
+
+def create_asana_task(name, assignee_email, project_id, due_on=None, description=None, subtasks=None, assignee_gid=None,
+                      on_created=None):
+    """Crea la tarea y sus subtareas. on_created(resultado parcial) se llama apenas existe la tarea,
+    antes de las subtareas, para que el llamador la registre y un reintento no la duplique"""
+    _log_create(project_id, assignee_email, due_on, subtasks, assignee_gid)
+    
+    # assignee_gid puede venir ya resuelto por el llamador (ej. tabla Slack→Asana de slack_users)
+    if not assignee_gid and assignee_email:
+        assignee_gid = _resolve_assignee(assignee_email)
+    
+    response = http_client.post(
+        f'{http_client.ASANA_API_URL}/tasks',
+        headers=_json_headers(),
+        json=_task_payload(name, project_id, due_on, description, assignee_gid)
     )
     
     if response.status_code == 201:
         task = response.json()['data']
         task_gid = task['gid']
+        if on_created:
+            on_created(_created_result(project_id, task_gid, assignee_gid, subtasks))
         
         # Crear subtareas si existen
-        if subtasks:
-            subtask_list = [s.strip() for s in subtasks.split('\n') if s.strip()]
-            for subtask_name in subtask_list:
-                create_subtask(task_gid, subtask_name, assignee_gid)
+        subtask_list = _subtask_names(subtasks)
+        subtask_failures = create_subtasks(task_gid, subtask_list, assignee_gid)
+        _report_subtask_failures(task_gid, subtask_list, subtask_failures)
         
-        return {
-            'url': f"https://app.asana.com/0/{project_id}/{task_gid}",
-            'assignee_found': assignee_gid is not None
-        }
+        return _task_result(project_id, task_gid, assignee_gid, subtask_failures)
     else:
-        raise Exception(f"Error creating Asana task: {response.status_code} - {response.text}")
+        raise AsanaError(f"Error creating Asana task: {response.status_code} - {response.text}", response.status_code)
 
-def create_subtask(parent_task_gid, name, assignee_gid=None):
-    headers = {
-        'Authorization': f'Bearer {ASANA_PAT}',
-        'Content-Type': 'application/json'
-    }
+async def create_asana_task_async(name, assignee_email, project_id, due_on=None, description=None, subtasks=None,
+                                  assignee_gid=None, on_created=None):
+    """Versión async de create_asana_task; las subtareas se crean concurrentemente en el event loop.
+    on_created es sync y corre en un thread"""
+    _log_create(project_id, assignee_email, due_on, subtasks, assignee_gid)
+    
+    if not assignee_gid and assignee_email:
+        # El directorio de asana_users es sync (y casi siempre está en memoria)
+        assignee_gid = await asyncio.to_thread(_resolve_assignee, assignee_email)
+    
+    response = await http_client.post_async(
+        f'{http_client.ASANA_API_URL}/tasks',
+        headers=_json_headers(),
+        json=_task_payload(name, project_id, due_on, description, assignee_gid)
+    )
     
+    if response.status_code == 201:
+        task_gid = response.json()['data']['gid']
+        if on_created:
+            await asyncio.to_thread(on_created, _created_result(project_id, task_gid, assignee_gid, subtasks))
+        subtask_list = _subtask_names(subtasks)
+        subtask_failures = await create_subtasks_async(task_gid, subtask_list, assignee_gid)
+        _report_subtask_failures(task_gid, subtask_list, subtask_failures)
+        
+        return _task_result(project_id, task_gid, assignee_gid, subtask_failures)
+    else:
+        raise AsanaError(f"Error creating Asana task: {response.status_code} - {response.text}", response.status_code)
+
+def _subtask_data(name, assignee_gid=None):
     subtask_data = {
-        'data': {
-            'name': name,
-            'parent': parent_task_gid
-        }
+        'name': name
     }
     
     if assignee_gid:
-        subtask_data['data']['assignee'] = assignee_gid
-    
-    response = requests.post(
-        'https://app.asana.com/api/1.0/tasks',
-        headers=headers,
-        json=subtask_data
-    )
+        subtask_data['assignee'] = assignee_gid
     
+    return subtask_data
+
+def _created(response):
+    """(gid, None) si la subtarea se creó, (None, error) si no"""
     if response.status_code != 201:
-        logging.error(f"Error creating subtask: {response.status_code} - {response.text}")
-        send_slack(f"Error creating subtask: {response.status_code} - {response.text}")
+        return None, f"{response.status_code} - {response.text}"
+    return response.json()['data']['gid'], None
+
+def create_subtask(parent_task_gid, name, assignee_gid=None):
+    """Crea una subtarea. Devuelve (gid, None) si salió bien o (None, mensaje de error)"""
+    try:
+        response = http_client.post(
+            f'{http_client.ASANA_API_URL}/tasks/{parent_task_gid}/subtasks',
+            headers=_json_headers(),
+            json={'data': _subtask_data(name, assignee_gid)}
+        )
+    except Exception as e:
+        return None, str(e)
+    return _created(response)
+
+async def create_subtask_async(parent_task_gid, name, assignee_gid=None):
+    try:
+        response = await http_client.post_async(
+            f'{http_client.ASANA_API_URL}/tasks/{parent_task_gid}/subtasks',
+            headers=_json_headers(),
+            json={'data': _subtask_data(name, assignee_gid)}
+        )
+    except Exception as e:
+        return None, str(e)
+    return _created(response)
+
+def _batch_body(parent_task_gid, chunk, assignee_gid):
+    actions = [
+        {
+            'method': 'post',
+            'relative_path': f'/tasks/{parent_task_gid}/subtasks',
+            'data': _subtask_data(name, assignee_gid)
+        }
+        for name in chunk
+    ]
+    return {'data': {'actions': actions}}
+
+def _batch_results(response, chunk):
+    if response.status_code != 200:
+        return [(None, f"{response.status_code} - {response.text}") for _ in chunk]
+    
+    # Asana devuelve un resultado por acción en el orden del request, aunque las ejecute en paralelo
+    results = []
+    for result in response.json()['data']:
+        if result.get('status_code') == 201:
+            results.append((result['body']['data']['gid'], None))
+        else:
+            results.append((None, f"{result.get('status_code')} - {result.get('body')}"))
+    results.extend((None, "Sin respuesta en el batch") for _ in chunk[len(results):])
+    return results[:len(chunk)]
+
+def _chunks(names):
+    return [names[start:start + ASANA_BATCH_MAX_ACTIONS] for start in range(0, len(names), ASANA_BATCH_MAX_ACTIONS)]
+
+def _create_subtasks_batch(parent_task_gid, names, assignee_gid=None):
+    """Crea las subtareas con /batch, de a ASANA_BATCH_MAX_ACTIONS. Devuelve (gid, error) por subtarea"""
+    results = []
+    for chunk in _chunks(names):
+        try:
+            response = http_client.post(
+                f'{http_client.ASANA_API_URL}/batch',
+                headers=_json_headers(),
+                json=_batch_body(parent_task_gid, chunk, assignee_gid)
+            )
+        except Exception as e:
+            results.extend((None, str(e)) for _ in chunk)
+            continue
+        results.extend(_batch_results(response, chunk))
+    
+    return results
+
+async def _create_batch_chunk_async(parent_task_gid, chunk, assignee_gid):
+    try:
+        response = await http_client.post_async(
+            f'{http_client.ASANA_API_URL}/batch',
+            headers=_json_headers(),
+            json=_batch_body(parent_task_gid, chunk, assignee_gid)
+        )
+    except Exception as e:
+        return [(None, str(e)) for _ in chunk]
+    return _batch_results(response, chunk)
+
+def _subtasks_url(parent_task_gid):
+    return f'{http_client.ASANA_API_URL}/tasks/{parent_task_gid}/subtasks'
+
+def _subtask_params(offset=None):
+    params = {'opt_fields': 'gid', 'limit': 100}
+    if offset:
+        params['offset'] = offset
+    return params
+
+def _page(response):
+    """(gids, offset de la página siguiente) de GET /tasks/{gid}/subtasks"""
+    if response.status_code != 200:
+        raise Exception(f"Error reading Asana subtasks: {response.status_code} - {response.text}")
+    body = response.json()
+    next_page = body.get('next_page') or {}
+    return [subtask['gid'] for subtask in body['data']], next_page.get('offset')
+
+def _in_place(ranks):
+    """Posiciones de una subsecuencia creciente más larga de ranks: lo que no hace falta mover"""
+    tails = []
+    tail_positions = []
+    previous = [None] * len(ranks)
+    for position, rank in enumerate(ranks):
+        i = bisect.bisect_left(tails, rank)
+        previous[position] = tail_positions[i - 1] if i else None
+        if i == len(tails):
+            tails.append(rank)
+            tail_positions.append(position)
+        else:
+            tails[i] = rank
+            tail_positions[i] = position
+    keep = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        keep.add(position)
+        position = previous[position]
+    return keep
+
+def _order_moves(current, desired):
+    """Movimientos (gid, {'insert_after'|'insert_before': gid}) que llevan current al orden de desired.
+    Se deja quieta la subsecuencia ya ordenada más larga y se mueve el resto; hay que aplicarlos en orden"""
+    rank = {gid: i for i, gid in enumerate(desired)}
+    order = [gid for gid in current if gid in rank]
+    keep = {order[position] for position in _in_place([rank[gid] for gid in order])}
+    present = set(order)
+    moves = []
+    previous = None
+    for gid in desired:
+        if gid not in present:
+            continue
+        if gid not in keep:
+            moves.append((gid, {'insert_after': previous} if previous else {'insert_before': order[0]}))
+        previous = gid
+    return moves
+
+def _set_parent_body(parent_task_gid, position):
+    return {'data': {'parent': parent_task_gid, **position}}
+
+def _restore_order(parent_task_gid, gids):
+    """/batch y el modo parallel crean las subtareas en paralelo y Asana las deja en el orden en que
+    terminaron. Se lee el orden real (un GET) y se corrige con setParent sólo lo que quedó fuera de lugar"""
+    if len(gids) < 2:
+        return
+    try:
+        current, offset = _page(http_client.get(_subtasks_url(parent_task_gid), headers=_json_headers(),
+                                                params=_subtask_params()))
+        while offset:
+            page, offset = _page(http_client.get(_subtasks_url(parent_task_gid), headers=_json_headers(),
+                                                 params=_subtask_params(offset)))
+            current.extend(page)
+        for gid, position in _order_moves(current, gids):
+            # Mover a la misma posición dos veces da lo mismo: se puede reintentar
+            response = http_client.post(f'{http_client.ASANA_API_URL}/tasks/{gid}/setParent', headers=_json_headers(),
+                                        json=_set_parent_body(parent_task_gid, position), idempotent=True)
+            if response.status_code != 200:
+                raise Exception(f"Error moving subtask {gid}: {response.status_code} - {response.text}")
+    except Exception as e:
+        # Las subtareas existen igual; sólo queda mal el orden
+        logging.warning("No se pudo ordenar las subtareas de %s: %s", parent_task_gid, e)
+
+async def _restore_order_async(parent_task_gid, gids):
+    if len(gids) < 2:
+        return
+    try:
+        current, offset = _page(await http_client.get_async(_subtasks_url(parent_task_gid), headers=_json_headers(),
+                                                            params=_subtask_params()))
+        while offset:
+            page, offset = _page(await http_client.get_async(_subtasks_url(parent_task_gid), headers=_json_headers(),
+                                                             params=_subtask_params(offset)))
+            current.extend(page)
+        # Cada movimiento depende del anterior: van uno por uno
+        for gid, position in _order_moves(current, gids):
+            response = await http_client.post_async(f'{http_client.ASANA_API_URL}/tasks/{gid}/setParent',
+                                                    headers=_json_headers(),
+                                                    json=_set_parent_body(parent_task_gid, position),
+                                                    idempotent=True)
+            if response.status_code != 200:
+                raise Exception(f"Error moving subtask {gid}: {response.status_code} - {response.text}")
+    except Exception as e:
+        logging.warning("No se pudo ordenar las subtareas de %s: %s", parent_task_gid, e)
+
+def create_subtasks(parent_task_gid, names, assignee_gid=None):
+    """Crea todas las subtareas en el orden de names y devuelve [(nombre, error)] de las que fallaron"""
+    if not names:
+        return []
+    
+    if ASANA_SUBTASK_MODE == 'parallel':
+        with ThreadPoolExecutor(max_workers=min(ASANA_SUBTASK_WORKERS, len(names))) as executor:
+            results = list(executor.map(lambda name: create_subtask(parent_task_gid, name, assignee_gid), names))
+    else:
+        results = _create_subtasks_batch(parent_task_gid, names, assignee_gid)
+    
+    _restore_order(parent_task_gid, [gid for gid, _ in results if gid])
+    return [(name, error) for name, (_, error) in zip(names, results) if error]
+
+async def create_subtasks_async(parent_task_gid, names, assignee_gid=None):
+    """Versión async de create_subtasks: los chunks de /batch (o las subtareas en modo parallel) van a la vez"""
+    if not names:
+        return []
+    
+    if ASANA_SUBTASK_MODE == 'parallel':
+        limit = asyncio.Semaphore(ASANA_SUBTASK_WORKERS)
+        
+        async def create(name):
+            async with limit:
+                return await create_subtask_async(parent_task_gid, name, assignee_gid)
+        
+        results = await asyncio.gather(*(create(name) for name in names))
+    else:
+        chunk_results = await asyncio.gather(*(_create_batch_chunk_async(parent_task_gid, chunk, assignee_gid)
+                                               for chunk in _chunks(names)))
+        results = [result for chunk in chunk_results for result in chunk]
+    
+    await _restore_order_async(parent_task_gid, [gid for gid, _ in results if gid])
+    return [(name, error) for name, (_, error) in zip(names, results) if error]
 
 def get_user_by_email(email):
     if not email:
         logging.warning("No se proporcionó email")
         return None
-        
-    headers = {
-        'Authorization': f'Bearer {ASANA_PAT}'
-    }
     
     try:
-        workspace_gid = get_workspace_gid()
+        with metrics.span('asana_get_user_by_email'):
+            user_gid = asana_users.get_gid_by_email(email)
     except Exception as e:
-        logging.error(f"Error obteniendo workspace: {e}")
-        send_slack(f"Error obteniendo workspace: {e}")
+        logging.error("Error cargando usuarios de Asana: %s", e)
+        send_slack(f"Error cargando usuarios de Asana: {e}")
         return None
     
-    # Intentar buscar por email exacto
-    response = requests.get(
-        f'https://app.asana.com/api/1.0/workspaces/{workspace_gid}/users',
-        headers=headers
-    )
-    
-    if response.status_code == 200:
-        all_users = response.json()['data']
-        logging.info(f"Total usuarios en workspace: {len(all_users)}")
-        
-        # Buscar coincidencia exacta por email
-        for user in all_users:
-            user_detail = requests.get(
-                f'https://app.asana.com/api/1.0/users/{user["gid"]}',
-                headers=headers
-            )
-            if user_detail.status_code == 200:
-                user_data = user_detail.json()['data']
-                if user_data.get('email', '').lower() == email.lower():
-                    logging.info(f"Usuario encontrado: {user_data.get('name')} - {user_data.get('email')}")
-                    return user['gid']
-    logging.warning(f"No se encontró usuario con email: {email}")
+    if user_gid:
+        return user_gid
+    logging.warning("No se encontró usuario de Asana con ese email")
     return None
 
 def get_workspace_gid():
-    headers = {
-        'Authorization': f'Bearer {ASANA_PAT}'
-    }
-    
-    response = requests.get(
-        'https://app.asana.com/api/1.0/workspaces',
-        headers=headers
-    )
-    
-    if response.status_code == 200:
-        workspaces = response.json()['data']
-        if workspaces:
-            return workspaces[0]['gid']
-    
-    raise Exception("No workspace found")
+    # Se resuelve una vez por proceso (ver asana_invariants.refresh)
+    return asana_invariants.get_workspace_gid()
 
 def parse_date(date_str):
     date_formats = [
@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+import http_client
+
+ASANA_PAT = os.getenv('ASANA_PERSONAL_ACCESS_TOKEN')
+# Workspace fijo: si está definido no hace falta preguntarle a Asana
+ASANA_WORKSPACE_GID = os.getenv('ASANA_WORKSPACE_GID')
+
+# Datos de Asana que no cambian durante la vida del proceso. Se resuelven una vez (en warm() o en
+# el primer uso) y sólo se vuelven a pedir con refresh()
+_lock = threading.Lock()
+# Una sola resolución en vuelo: los demás threads esperan y usan el resultado
+_resolve_lock = threading.Lock()
+_me = None
+_workspace_gid = ASANA_WORKSPACE_GID
+_counters = {
+    'hits': 0,
+    'fetches': 0,
+    'refreshes': 0
+}
+
+def _headers():
+    return {
+        'Authorization': f'Bearer {ASANA_PAT}'
+    }
+
+def _get_data(path, params=None):
+    """GET a la API de Asana devolviendo 'data', siguiendo la paginación si la hay"""
+    params = dict(params or {})
+    data = None
+    while True:
+        response = http_client.get(f'{http_client.ASANA_API_URL}/{path}', headers=_headers(), params=params)
+        if response.status_code != 200:
+            raise Exception(f"Error reading Asana {path}: {response.status_code} - {response.text}")
+        body = response.json()
+        with _lock:
+            _counters['fetches'] += 1
+        if not isinstance(body['data'], list):
+            return body['data']
+        data = (data or []) + body['data']
+        next_page = body.get('next_page')
+        if not next_page or not next_page.get('offset'):
+            return data
+        params['offset'] = next_page['offset']
+
+def get_me():
+    """Usuario dueño del token (/users/me), con sus workspaces"""
+    global _me
+    me = _me
+    if me is not None:
+        with _lock:
+            _counters['hits'] += 1
+        return me
+    with _resolve_lock:
+        if _me is None:
+            me = _get_data('users/me', {'opt_fields': 'name,workspaces.name'})
+            with _lock:
+                _me = me
+    return _me
+
+def get_workspace_gid():
+    """Workspace donde se crean las tareas: el primero del usuario del token, como antes con /workspaces"""
+    global _workspace_gid
+    workspace_gid = _workspace_gid
+    if workspace_gid is not None:
+        with _lock:
+            _counters['hits'] += 1
+        return workspace_gid
+    workspaces = get_me().get('workspaces') or []
+    if not workspaces:
+        raise Exception("No workspace found")
+    with _lock:
+        _workspace_gid = workspaces[0]['gid']
+    return _workspace_gid
+
+def warm():
+    """Resuelve todo al arrancar: usuario del token y workspace"""
+    if not ASANA_PAT:
+        return
+    get_workspace_gid()
+    get_me()
+    logging.info("Invariantes de Asana resueltas: workspace %s", _workspace_gid)
+
+def refresh():
+    """Descarta lo resuelto para que se vuelva a pedir"""
+    global _me, _workspace_gid
+    with _lock:
+        _me = None
+        _workspace_gid = ASANA_WORKSPACE_GID
+        _counters['refreshes'] += 1
+
+def get_stats():
+    with _lock:
+        return {
+            **_counters,
+            'workspace_resolved': _workspace_gid is not None,
+            'user_resolved': _me is not None
+        }
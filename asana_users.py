@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import threading
+import http_client
+
+ASANA_PAT = os.getenv('ASANA_PERSONAL_ACCESS_TOKEN')
+
+# Segundos que el índice de usuarios se considera vigente
+ASANA_USERS_TTL = int(os.getenv('ASANA_USERS_TTL', '3600'))
+# Mínimo de segundos entre recargas disparadas por un email no encontrado
+ASANA_USERS_MISS_RELOAD_INTERVAL = int(os.getenv('ASANA_USERS_MISS_RELOAD_INTERVAL', '300'))
+# Archivo opcional donde se guarda el índice para no recorrer el workspace en cada arranque
+ASANA_USERS_SNAPSHOT = os.getenv('ASANA_USERS_SNAPSHOT')
+ASANA_USERS_PAGE_SIZE = 100
+
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_email_index = {}
+_loaded_at = 0.0
+_last_miss_reload = 0.0
+_counters = {
+    'hits': 0,
+    'misses': 0,
+    'reloads': 0,
+    'miss_reloads': 0,
+    'snapshot_loads': 0
+}
+
+def _fetch_all_users():
+    """Trae todos los usuarios del workspace con su email, paginando de a ASANA_USERS_PAGE_SIZE"""
+    from asana_client import get_workspace_gid
+
+    headers = {
+        'Authorization': f'Bearer {ASANA_PAT}'
+    }
+    workspace_gid = get_workspace_gid()
+    params = {
+        'opt_fields': 'email,name',
+        'limit': ASANA_USERS_PAGE_SIZE
+    }
+
+    index = {}
+    while True:
+        response = http_client.get(
+            f'{http_client.ASANA_API_URL}/workspaces/{workspace_gid}/users',
+            headers=headers,
+            params=params
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error listing Asana users: {response.status_code} - {response.text}")
+
+        body = response.json()
+        for user in body['data']:
+            email = (user.get('email') or '').lower()
+            if email:
+                index[email] = user['gid']
+
+        next_page = body.get('next_page')
+        if not next_page or not next_page.get('offset'):
+            break
+        params['offset'] = next_page['offset']
+
+    return index
+
+def _load_snapshot():
+    if not ASANA_USERS_SNAPSHOT:
+        return None
+    try:
+        with open(ASANA_USERS_SNAPSHOT, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        return snapshot['loaded_at'], snapshot['users']
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, KeyError) as e:
+        logging.warning("Snapshot de usuarios de Asana inválido, se ignora: %s", e)
+        return None
+
+def _save_snapshot(index, loaded_at):
+    if not ASANA_USERS_SNAPSHOT:
+        return
+    tmp_path = ASANA_USERS_SNAPSHOT + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'loaded_at': loaded_at, 'users': index}, f)
+        os.replace(tmp_path, ASANA_USERS_SNAPSHOT)
+    except OSError as e:
+        logging.warning("No se pudo guardar el snapshot de usuarios de Asana: %s", e)
+
+def reload():
+    """Recarga el índice email→gid desde la API de Asana"""
+    global _email_index, _loaded_at, _last_miss_reload
+    index = _fetch_all_users()
+    loaded_at = time.time()
+    with _lock:
+        _email_index = index
+        _loaded_at = loaded_at
+        # Un índice recién cargado ya refleja a los usuarios nuevos
+        _last_miss_reload = loaded_at
+        _counters['reloads'] += 1
+    _save_snapshot(index, loaded_at)
+    logging.info("Directorio de usuarios de Asana cargado: %s usuarios", len(index))
+
+def _is_fresh():
+    return bool(_email_index) and time.time() - _loaded_at < ASANA_USERS_TTL
+
+def _ensure_loaded():
+    global _email_index, _loaded_at
+    if _is_fresh():
+        return
+
+    # Un solo thread recarga; el resto espera y usa el resultado
+    with _reload_lock:
+        if _is_fresh():
+            return
+
+        # En frío, probar primero con el snapshot en disco
+        if not _email_index:
+            snapshot = _load_snapshot()
+            if snapshot and time.time() - snapshot[0] < ASANA_USERS_TTL:
+                with _lock:
+                    _loaded_at, _email_index = snapshot
+                    _counters['snapshot_loads'] += 1
+                return
+
+        reload()
+
+def get_gid_by_email(email, reload_on_miss=True):
+    """Devuelve el gid de Asana para el email, o None si no existe en el workspace"""
+    global _last_miss_reload
+    if not email:
+        return None
+    email = email.lower()
+
+    _ensure_loaded()
+    gid = _email_index.get(email)
+    if gid:
+        with _lock:
+            _counters['hits'] += 1
+        return gid
+    if not reload_on_miss:
+        with _lock:
+            _counters['misses'] += 1
+        return None
+
+    # Un miss puede ser un usuario nuevo: recargar una sola vez por intervalo
+    with _lock:
+        should_reload = time.time() - _last_miss_reload >= ASANA_USERS_MISS_RELOAD_INTERVAL
+        if should_reload:
+            _last_miss_reload = time.time()
+    if should_reload:
+        with _lock:
+            _counters['miss_reloads'] += 1
+        reload()
+        gid = _email_index.get(email)
+
+    with _lock:
+        _counters['hits' if gid else 'misses'] += 1
+    return gid
+
+def get_stats():
+    with _lock:
+        return {
+            **_counters,
+            'users': len(_email_index),
+            'age_seconds': round(time.time() - _loaded_at) if _loaded_at else None
+        }
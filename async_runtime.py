@@ -0,0 +1,77 @@
+import os
+import asyncio
+import threading
+
+# 'threads' (por defecto): los workers de las colas bloquean un thread por llamada externa.
+# 'async': los workers corren como corrutinas en un único event loop, con httpx.AsyncClient.
+EXECUTION_MODE = os.getenv('EXECUTION_MODE', 'threads')
+# Conexiones simultáneas del cliente async (entre todos los hosts)
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '200'))
+HTTP_ASYNC_MAX_KEEPALIVE = int(os.getenv('HTTP_ASYNC_MAX_KEEPALIVE', '50'))
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+_client = None
+_counters = {
+    'submitted': 0,
+    'completed': 0,
+    'failed': 0
+}
+
+def is_async():
+    return EXECUTION_MODE == 'async'
+
+def get_loop():
+    """Event loop compartido, en un thread daemon. Se crea en el primer uso para sobrevivir al fork de gunicorn"""
+    global _loop, _thread
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _thread = threading.Thread(target=loop.run_forever, name='async-runtime', daemon=True)
+                _thread.start()
+                _loop = loop
+    return _loop
+
+def get_client():
+    """httpx.AsyncClient compartido. Sólo se puede usar desde el loop de get_loop()"""
+    global _client
+    if _client is None:
+        # httpx sólo hace falta en modo async
+        import httpx
+        _client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_ASYNC_MAX_KEEPALIVE
+        ))
+    return _client
+
+def _on_done(future):
+    with _lock:
+        if future.cancelled() or future.exception() is not None:
+            _counters['failed'] += 1
+        else:
+            _counters['completed'] += 1
+
+def submit(coro):
+    """Agenda la corrutina en el loop compartido desde cualquier thread. Devuelve un concurrent.futures.Future"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    with _lock:
+        _counters['submitted'] += 1
+    future.add_done_callback(_on_done)
+    return future
+
+def run(coro, timeout=None):
+    """Corre la corrutina en el loop compartido y espera el resultado (no llamar desde el propio loop)"""
+    return submit(coro).result(timeout)
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        'mode': EXECUTION_MODE,
+        'in_flight': counters['submitted'] - counters['completed'] - counters['failed'],
+        'loop_running': bool(_loop and _loop.is_running()),
+        'max_connections': HTTP_ASYNC_MAX_CONNECTIONS
+    }
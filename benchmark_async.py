@@ -0,0 +1,147 @@
+"""
+Compara EXECUTION_MODE=threads contra EXECUTION_MODE=async con muchas llamadas al LLM en vuelo.
+
+Uso:
+    python benchmark_async.py
+    python benchmark_async.py --inflight 8,64,256,512 --latency 1.0
+
+Para cada nivel N se lanzan N evaluaciones a la vez contra el OpenAI falso de
+fake_services.py (con --latency segundos de demora): en modo threads con un
+ThreadPoolExecutor de N threads, en modo async con asyncio.gather en el loop de
+async_runtime. Cada corrida es un proceso aparte para que la memoria no se mezcle.
+
+Se reporta el tiempo total, cuántos requests llegaron a estar en vuelo a la vez
+en el servidor, y el RSS extra por request en vuelo (pico menos la base).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import fake_services
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+class PeakRss:
+    """Muestrea el RSS en un thread mientras dura el bloque"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+def run_child(mode, inflight):
+    """Corre dentro del subproceso, con EXECUTION_MODE y las URLs del servidor falso ya en el entorno"""
+    import llm_evaluator
+    import async_runtime
+
+    prompts = [llm_evaluator._single_prompt(f"Mensaje {i}: <@U1> mañana te mando el informe") for i in range(inflight)]
+
+    if mode == 'async':
+        import asyncio
+
+        async def evaluate_all(batch):
+            return await asyncio.gather(*(llm_evaluator.evaluate_with_openai_async(p) for p in batch))
+
+        # Calentar loop, cliente y conexiones antes de medir la base
+        async_runtime.run(evaluate_all(prompts[:1]))
+        baseline = rss_bytes()
+        start = time.perf_counter()
+        with PeakRss() as peak:
+            results = async_runtime.run(evaluate_all(prompts))
+        elapsed = time.perf_counter() - start
+        threads = threading.active_count()
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        llm_evaluator.evaluate_with_openai(prompts[0])
+        baseline = rss_bytes()
+        start = time.perf_counter()
+        with PeakRss() as peak:
+            with ThreadPoolExecutor(max_workers=inflight) as executor:
+                results = list(executor.map(llm_evaluator.evaluate_with_openai, prompts))
+                threads = threading.active_count()
+        elapsed = time.perf_counter() - start
+
+    ok = sum(1 for result in results if isinstance(result, dict))
+    return {
+        'mode': mode,
+        'inflight': inflight,
+        'ok': ok,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(inflight / elapsed, 1),
+        'threads': threads,
+        'baseline_rss_mb': round(baseline / 2**20, 1),
+        'peak_rss_mb': round(peak.peak / 2**20, 1),
+        'rss_per_inflight_kb': round(max(peak.peak - baseline, 0) / inflight / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Llamadas en vuelo y memoria: modo threads contra modo async')
+    parser.add_argument('--inflight', default='8,64,256', help='Niveles de concurrencia separados por coma')
+    parser.add_argument('--latency', type=float, default=1.0, help='Latencia del LLM falso en segundos')
+    parser.add_argument('--modes', default='threads,async')
+    parser.add_argument('--output', help='Archivo donde guardar el resultado en JSON')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'INFLIGHT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], int(args.child[1]))))
+        return 0
+
+    # Latencia fija: así el tiempo total refleja la concurrencia y no el azar
+    services = fake_services.FakeServices(latency={'openai': args.latency}, jitter=0)
+    server, base_url = fake_services.start(services)
+
+    env = {
+        **os.environ,
+        **fake_services.env_for(base_url),
+        'OPENAI_API_KEY': 'benchmark',
+        'HTTP_POOL_SIZE': str(max(int(level) for level in args.inflight.split(','))),
+        'HTTP_ASYNC_MAX_CONNECTIONS': str(max(int(level) for level in args.inflight.split(',')))
+    }
+    results = []
+    for level in (int(level) for level in args.inflight.split(',')):
+        for mode in args.modes.split(','):
+            services.reset_in_flight()
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, str(level)],
+                env={**env, 'EXECUTION_MODE': mode}, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result['server_max_inflight'] = services.get_stats()['max_in_flight']
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    text = json.dumps({'llm_latency_seconds': args.latency, 'results': results}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
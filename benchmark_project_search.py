@@ -0,0 +1,137 @@
+"""
+Latencia de project_search con catálogos grandes de proyectos.
+
+Uso:
+    python benchmark_project_search.py
+    python benchmark_project_search.py --projects 10000,50000 --queries 5000 --output resultado.json
+
+Genera N nombres de proyecto sintéticos (con acentos, mayúsculas y varias palabras)
+y un channel_map con --channels canales, arma el índice y mide:
+
+- el tiempo de armado del índice,
+- la latencia de search() por tipo de consulta (vacía, prefijo de 1 a 3 letras,
+  prefijo largo, sin acentos, varias palabras, subcadena y sin resultados),
+  con percentiles p50/p95/p99 y máximo en milisegundos.
+
+Slack corta el pedido de opciones a los 3 segundos; el número que importa es el
+p99 contra ese límite (más lo que tarden la red y la verificación de la firma).
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import project_search
+
+WORDS = (
+    'Campaña', 'Migración', 'Diseño', 'Análisis', 'Auditoría', 'Estrategia', 'Optimización', 'Lanzamiento',
+    'Investigación', 'Producción', 'Logística', 'Gestión', 'Comunicación', 'Capacitación', 'Operación',
+    'SEO', 'Contenidos', 'Redes', 'Ventas', 'Marketing', 'Clientes', 'Soporte', 'Finanzas', 'Legales',
+    'Web', 'App', 'Tienda', 'Portal', 'Plataforma', 'Integración', 'Automatización', 'Reportes',
+    'Q1', 'Q2', 'Q3', 'Q4', '2024', '2025', 'Interno', 'Externo', 'Piloto', 'Fase', 'Revisión'
+)
+CLIENTS = (
+    'Acmé', 'Nómada', 'Peñalolén', 'Córdoba', 'Bahía', 'Río', 'Lumen', 'Orión', 'Quetzal', 'Ñandú',
+    'Zafiro', 'Cóndor', 'Pampa', 'Andes', 'Atlántico', 'Pacífico', 'Boreal', 'Austral', 'Delta', 'Sigma'
+)
+
+def strip_accents(text):
+    return project_search.normalize(text)
+
+def make_catalog(count, channels, rng):
+    projects = {}
+    while len(projects) < count:
+        name = f"{rng.choice(CLIENTS)} - {' '.join(rng.sample(WORDS, rng.randint(1, 3)))} {rng.randint(1, 999)}"
+        projects[str(1200000000000000 + len(projects))] = name
+    gids = list(projects)
+    channel_map = {f"C{i:08d}": rng.choice(gids) for i in range(channels)}
+    return projects, channel_map
+
+def make_queries(projects, count, rng):
+    names = list(projects.values())
+    kinds = {
+        'vacia': lambda name: '',
+        'prefijo_1': lambda name: name[:1],
+        'prefijo_3': lambda name: name[:3],
+        'prefijo_largo': lambda name: name[:12],
+        'sin_acentos': lambda name: strip_accents(name.split(' - ')[-1])[:6],
+        'varias_palabras': lambda name: ' '.join(word[:3] for word in name.split(' - ')[-1].split()[:2]),
+        'subcadena': lambda name: strip_accents(name)[4:8],
+        'sin_resultados': lambda name: 'zzqx' + name[:2]
+    }
+    queries = []
+    for i in range(count):
+        kind = list(kinds)[i % len(kinds)]
+        queries.append((kind, kinds[kind](rng.choice(names))))
+    return queries
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def run(count, args, rng):
+    projects, channel_map = make_catalog(count, args.channels, rng)
+    start = time.perf_counter()
+    index = project_search.ProjectIndex(projects, channel_map, version=1)
+    build_seconds = time.perf_counter() - start
+
+    # Un poco de historial de uso, como en producción
+    channels = list(channel_map)
+    for gid in rng.sample(list(projects), min(200, count)):
+        project_search.record_use(gid, rng.choice(channels))
+
+    latencies = {}
+    results = {}
+    for kind, query in make_queries(projects, args.queries, rng):
+        channel = rng.choice(channels)
+        start = time.perf_counter()
+        options = project_search.search(query, channel, index=index)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        results.setdefault(kind, []).append(len(options))
+
+    def summary(values):
+        return {
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(max(values) * 1000, 3)
+        }
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'projects': count,
+        'words': len(index.words),
+        'build_ms': round(build_seconds * 1000, 1),
+        'queries': len(all_latencies),
+        'overall': summary(all_latencies),
+        'by_kind': {
+            kind: {**summary(values), 'avg_results': round(sum(results[kind]) / len(results[kind]), 1)}
+            for kind, values in latencies.items()
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia de búsqueda de proyectos con catálogos grandes')
+    parser.add_argument('--projects', default='1000,10000,50000', help='Tamaños de catálogo separados por coma')
+    parser.add_argument('--queries', type=int, default=4000, help='Consultas por tamaño')
+    parser.add_argument('--channels', type=int, default=300, help='Canales en el channel_map sintético')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Archivo donde guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for count in (int(value) for value in args.projects.split(',')):
+        result = run(count, args, rng)
+        results.append(result)
+        print(json.dumps({k: result[k] for k in ('projects', 'build_ms', 'overall')}), file=sys.stderr)
+
+    text = json.dumps({'results': results}, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
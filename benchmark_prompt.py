@@ -0,0 +1,190 @@
+"""
+Compara configuraciones de evaluación con el LLM sobre un corpus fijo de mensajes.
+
+Uso:
+    python benchmark_prompt.py --fake
+    python benchmark_prompt.py --config provider=openai,model=gpt-4o-mini,format=json_schema \
+                               --config provider=openai,model=gpt-4o-mini,format=json_object,normalize=0
+    python benchmark_prompt.py --corpus mensajes.jsonl --batch 8 --output resultado.json
+
+Cada --config es una lista clave=valor: provider (openai|claude), model, format
+(json_schema|json_object, sólo OpenAI), normalize (1|0), max_chars y max_tokens.
+Sin --config se corren las configuraciones por defecto de ambos proveedores.
+
+Por configuración se reportan tokens de entrada y salida (los que informa la API
+en 'usage'), latencia p50/p95 por llamada y tasa de fallas de parseo (respuestas
+que no son el JSON esperado o batches con otra cantidad de veredictos).
+
+Con --fake las llamadas van a fake_services.py: sirve para probar el script sin
+gastar tokens, pero la latencia y los tokens son sintéticos. Para números reales
+hay que tener OPENAI_API_KEY / CLAUDE_API_KEY en el entorno.
+
+El corpus es un JSONL con un campo 'text' por línea (el de evaluate_prefilter.py
+sirve); sin --corpus se usa CORPUS, que tiene el markup típico de Slack.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+CORPUS = [
+    "<@U02ABCDEF|martin> te mando el informe de ventas el viernes :+1:",
+    "Dale, yo me encargo de actualizar el deck para la reunión con <#C01SALES|ventas> :muscle:",
+    "jajaja buenísimo :joy::joy:",
+    "<!here> recuerden que mañana no hay daily",
+    "¿Alguien sabe dónde quedó el link del dashboard? <https://grafana.example.com/d/abc123/ventas?orgId=1&from=now-7d|dashboard>",
+    "<@U03XYZ123> ¿podés revisar el PR antes del jueves? <https://github.com/acme/app/pull/4412>",
+    "Gracias!! :pray:",
+    "Me comprometo a cerrar los tickets de soporte pendientes esta semana",
+    "Quedamos así entonces: <@U04QWERTY|sofi> arma la propuesta y <@U05ASDFG|nico> la revisa el lunes",
+    "ok",
+    "Subí el archivo acá <https://drive.google.com/file/d/1AbCdEf/view?usp=sharing|presupuesto Q3> :paperclip:",
+    "Yo después le escribo al cliente para confirmar la fecha de entrega",
+    "<!subteam^S0123ABC|@diseño> ¿quién puede hacer los mockups de la landing para el 15?",
+    "Lo veo la semana que viene, ahora estoy a full con el cierre :sweat_smile:",
+    "Perfecto, mañana a primera hora migro la base de staging y les aviso por <#C02INFRA|infra>",
+    "buen día a todos :sunny:",
+    ("Resumen de la reunión: 1) <@U02ABCDEF|martin> arma el cronograma, 2) <@U03XYZ123> consigue los accesos, "
+     "3) yo preparo la demo para el cliente. Los detalles están en <https://docs.example.com/acta/2024-05-10|el acta>. "
+     "Cualquier cosa avisen por acá o por <#C01SALES|ventas>. :rocket: :rocket: ") * 3,
+    "¿Se cayó la VPN o soy yo?",
+    "Te debo la respuesta, lo chequeo con finanzas y te confirmo antes del cierre de mes",
+    "<@U04QWERTY|sofi> genial, gracias :heart:"
+]
+
+DEFAULT_CONFIGS = [
+    'provider=openai,format=json_schema',
+    'provider=openai,format=json_schema,normalize=0,max_chars=0',
+    'provider=openai,format=json_object',
+    'provider=claude',
+    'provider=claude,normalize=0,max_chars=0'
+]
+
+def parse_config(text):
+    config = dict(item.split('=', 1) for item in text.split(',') if item)
+    if config.get('provider') not in ('openai', 'claude'):
+        raise argparse.ArgumentTypeError(f"provider inválido en '{text}' (openai|claude)")
+    return config
+
+def load_corpus(path):
+    if not path:
+        return CORPUS
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)['text'] for line in f if line.strip()]
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def apply_config(llm_evaluator, config):
+    """Ajusta los parámetros del módulo para la configuración; devuelve la función de evaluación"""
+    llm_evaluator.LLM_NORMALIZE_MARKUP = config.get('normalize', '1') != '0'
+    llm_evaluator.LLM_MAX_MESSAGE_CHARS = int(config.get('max_chars', os.getenv('LLM_MAX_MESSAGE_CHARS', '600')))
+    llm_evaluator.LLM_MAX_OUTPUT_TOKENS = int(config.get('max_tokens', os.getenv('LLM_MAX_OUTPUT_TOKENS', '120')))
+    if config['provider'] == 'openai':
+        llm_evaluator.OPENAI_MODEL = config.get('model', os.getenv('OPENAI_MODEL', 'gpt-4o-mini'))
+        llm_evaluator.OPENAI_RESPONSE_FORMAT = config.get('format', 'json_schema')
+        return llm_evaluator.evaluate_with_openai, llm_evaluator.OPENAI_MODEL
+    llm_evaluator.CLAUDE_MODEL = config.get('model', os.getenv('CLAUDE_MODEL', 'claude-3-5-haiku-20241022'))
+    return llm_evaluator.evaluate_with_claude, llm_evaluator.CLAUDE_MODEL
+
+def run_config(llm_evaluator, config, corpus, batch, repeat):
+    evaluate, model = apply_config(llm_evaluator, config)
+    provider = config['provider']
+    before = llm_evaluator.get_stats()['usage'].get(provider, {})
+
+    groups = [corpus[i:i + batch] for i in range(0, len(corpus), batch)] if batch > 1 else [[text] for text in corpus]
+    latencies = []
+    invalid = 0
+    prompt_chars = 0
+    for _ in range(repeat):
+        for group in groups:
+            prompt = llm_evaluator._batch_prompt(group) if batch > 1 else llm_evaluator._single_prompt(group[0])
+            prompt_chars += len(prompt['system']) + len(prompt['user'])
+            start = time.perf_counter()
+            result = evaluate(prompt)
+            latencies.append(time.perf_counter() - start)
+            # Además de JSON inválido, un batch con otra cantidad de veredictos tampoco sirve
+            if batch > 1:
+                invalid += int(not llm_evaluator._batch_validator(len(group))(result))
+            else:
+                invalid += int(not isinstance(result, dict) or 'es_compromiso' not in result)
+
+    after = llm_evaluator.get_stats()['usage'].get(provider, {})
+    calls = len(latencies)
+    input_tokens = after.get('input_tokens', 0) - before.get('input_tokens', 0)
+    output_tokens = after.get('output_tokens', 0) - before.get('output_tokens', 0)
+    messages = len(corpus) * repeat
+    return {
+        'config': config,
+        'model': model,
+        'calls': calls,
+        'messages': messages,
+        'prompt_chars_per_message': round(prompt_chars / messages, 1),
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'input_tokens_per_message': round(input_tokens / messages, 1),
+        'output_tokens_per_message': round(output_tokens / messages, 1),
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'latency_p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'parse_failures': after.get('parse_failures', 0) - before.get('parse_failures', 0),
+        'invalid_results': invalid,
+        'parse_failure_rate': round(invalid / calls, 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Tokens, latencia y fallas de parseo por configuración de evaluación')
+    parser.add_argument('--config', action='append', type=parse_config,
+                        help='provider=openai|claude,model=...,format=...,normalize=1|0,max_chars=N,max_tokens=N')
+    parser.add_argument('--corpus', help='JSONL con un campo text por línea (por defecto, el corpus incluido)')
+    parser.add_argument('--batch', type=int, default=1, help='Mensajes por llamada (1 = un prompt por mensaje)')
+    parser.add_argument('--repeat', type=int, default=1, help='Veces que se recorre el corpus')
+    parser.add_argument('--fake', action='store_true', help='Usar fake_services en vez de las APIs reales')
+    parser.add_argument('--output', help='Archivo donde guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    if args.fake:
+        import fake_services
+        services = fake_services.FakeServices(commitment_ratio=0.4, seed=1)
+        server, base_url = fake_services.start(services)
+        # http_client lee las URLs base al importarse
+        os.environ.update(fake_services.env_for(base_url))
+        os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+        os.environ.setdefault('CLAUDE_API_KEY', 'benchmark')
+
+    import llm_evaluator
+
+    configs = args.config or [parse_config(text) for text in DEFAULT_CONFIGS]
+    configs = [config for config in configs
+               if (llm_evaluator.OPENAI_API_KEY if config['provider'] == 'openai' else llm_evaluator.CLAUDE_API_KEY)]
+    if not configs:
+        print("No hay API keys para los proveedores pedidos (OPENAI_API_KEY / CLAUDE_API_KEY), o usar --fake",
+              file=sys.stderr)
+        return 1
+
+    corpus = load_corpus(args.corpus)
+    results = []
+    for config in configs:
+        result = run_config(llm_evaluator, config, corpus, args.batch, args.repeat)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    text = json.dumps({
+        'fake': args.fake,
+        'batch': args.batch,
+        'corpus_messages': len(corpus),
+        'results': results
+    }, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.fake:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Compromisos detectados. El botón y el modal llevan el ID y el hilo (ver reference); el resto se busca acá
+COMMITMENT_STORE_SIZE = int(os.getenv('COMMITMENT_STORE_SIZE', '10000'))
+COMMITMENT_STORE_DB = os.getenv('COMMITMENT_STORE_DB', os.path.join(tempfile.gettempdir(), 'tracker_commitments.db'))
+
+STATUS_OFFERED = 'offered'
+STATUS_TASK_CREATED = 'task_created'
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_db = None
+_counters = {
+    'saved': 0,
+    'memory_hits': 0,
+    'persistent_hits': 0,
+    'misses': 0,
+    'legacy_payloads': 0,
+    'reference_fallbacks': 0,
+    'db_errors': 0
+}
+
+def is_persistent():
+    """False si COMMITMENT_STORE_DB está en el directorio temporal (en Cloud Run /tmp es memoria y se pierde al reiniciar)"""
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    return os.path.commonpath([os.path.realpath(COMMITMENT_STORE_DB), temp_dir]) != temp_dir
+
+def _warn_if_not_persistent():
+    if is_persistent():
+        return
+    message = ("COMMITMENT_STORE_DB (%s) está en el directorio temporal: los compromisos se pierden si la "
+               "instancia se reinicia y los modales se abren sin el mensaje original. Configurar "
+               "COMMITMENT_STORE_DB en un volumen persistente")
+    # K_SERVICE sólo existe en Cloud Run, donde /tmp es memoria
+    if os.getenv('K_SERVICE'):
+        logging.error(message, COMMITMENT_STORE_DB)
+    else:
+        logging.warning(message, COMMITMENT_STORE_DB)
+
+def _get_db():
+    global _db
+    if _db is None:
+        _warn_if_not_persistent()
+        _db = sqlite3.connect(COMMITMENT_STORE_DB, timeout=10, isolation_level=None, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("""
+            CREATE TABLE IF NOT EXISTS commitments (
+                id TEXT PRIMARY KEY,
+                channel TEXT NOT NULL,
+                thread_ts TEXT,
+                message_ts TEXT,
+                original_message TEXT,
+                commitment_data TEXT NOT NULL,
+                status TEXT NOT NULL,
+                task_gid TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        _db.execute("CREATE INDEX IF NOT EXISTS commitments_channel_created ON commitments (channel, created_at)")
+        _db.execute("CREATE INDEX IF NOT EXISTS commitments_created ON commitments (created_at)")
+    return _db
+
+def make_id(channel, message_ts, commitment_data):
+    """ID corto y estable: el mismo compromiso del mismo mensaje siempre da el mismo ID (reintentos incluidos)"""
+    raw = "\n".join((
+        channel,
+        str(message_ts),
+        str(commitment_data.get('asignado_a', '')).strip().lower(),
+        str(commitment_data.get('descripcion', '')).strip().lower()
+    ))
+    digest = hashlib.blake2b(raw.encode('utf-8'), digest_size=9).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii')
+
+def _remember(record):
+    _memory[record['id']] = record
+    _memory.move_to_end(record['id'])
+    while len(_memory) > COMMITMENT_STORE_SIZE:
+        _memory.popitem(last=False)
+
+def _from_row(row):
+    return {
+        'id': row[0],
+        'channel': row[1],
+        'thread_ts': row[2],
+        'message_ts': row[3],
+        'original_message': row[4],
+        'commitment_data': json.loads(row[5]),
+        'status': row[6],
+        'task_gid': row[7],
+        'created_at': row[8],
+        'updated_at': row[9]
+    }
+
+_COLUMNS = "id, channel, thread_ts, message_ts, original_message, commitment_data, status, task_gid, created_at, updated_at"
+
+def save(channel, thread_ts, message_ts, original_message, commitment_data):
+    """Guarda el compromiso detectado y devuelve el registro (con su ID en 'id')"""
+    now = time.time()
+    record = {
+        'id': make_id(channel, message_ts, commitment_data),
+        'channel': channel,
+        'thread_ts': thread_ts,
+        'message_ts': message_ts,
+        'original_message': original_message,
+        'commitment_data': commitment_data,
+        'status': STATUS_OFFERED,
+        'task_gid': None,
+        'created_at': now,
+        'updated_at': now
+    }
+    with _lock:
+        _remember(record)
+        _counters['saved'] += 1
+        try:
+            # Si el evento se reprocesa no se pisa el estado (puede que la tarea ya exista)
+            _get_db().execute(
+                f"INSERT OR IGNORE INTO commitments ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record['id'], channel, thread_ts, message_ts, original_message,
+                 json.dumps(commitment_data, ensure_ascii=False), STATUS_OFFERED, None, now, now)
+            )
+        except sqlite3.Error as e:
+            # Queda en memoria: el botón sigue funcionando mientras no se desaloje
+            _counters['db_errors'] += 1
+            logging.error("Error guardando el compromiso %s: %s", record['id'], e)
+    return record
+
+def get(commitment_id):
+    """Devuelve el compromiso (dict con commitment_data, original_message, channel, thread_ts, ...) o None"""
+    with _lock:
+        record = _memory.get(commitment_id)
+        if record is not None:
+            _memory.move_to_end(commitment_id)
+            _counters['memory_hits'] += 1
+            return record
+        try:
+            row = _get_db().execute(f"SELECT {_COLUMNS} FROM commitments WHERE id = ?", (commitment_id,)).fetchone()
+        except sqlite3.Error as e:
+            _counters['db_errors'] += 1
+            logging.error("Error leyendo el compromiso %s: %s", commitment_id, e)
+            row = None
+        if row is None:
+            _counters['misses'] += 1
+            return None
+        record = _from_row(row)
+        _remember(record)
+        _counters['persistent_hits'] += 1
+        return record
+
+def reference(commitment):
+    """Value del botón y private_metadata del modal: el ID más lo necesario para crear la tarea
+    aunque el compromiso no esté en este store (otra instancia o un reinicio)"""
+    return json.dumps({
+        'id': commitment['id'],
+        'channel': commitment['channel'],
+        'thread_ts': commitment['thread_ts'],
+        'message_ts': commitment['message_ts']
+    }, separators=(',', ':'))
+
+def resolve(value):
+    """Compromiso a partir del value del botón o el private_metadata del modal, o None.
+
+    Acepta lo que arma reference, el ID corto solo y el JSON completo que se mandaba antes
+    (botones y modales ya publicados). Si el ID no está en el store se devuelve el hilo que
+    trae la referencia, sin commitment_data ni mensaje original.
+    """
+    if not value.startswith('{'):
+        return get(value)
+    try:
+        data = json.loads(value)
+    except ValueError:
+        return None
+    if 'commitment_data' in data:
+        with _lock:
+            _counters['legacy_payloads'] += 1
+        return {'id': data.get('commitment_id'), **data}
+    record = get(data.get('id'))
+    if record is not None:
+        return record
+    if not (data.get('channel') and data.get('thread_ts')):
+        return None
+    with _lock:
+        _counters['reference_fallbacks'] += 1
+    return {
+        **data,
+        'original_message': None,
+        'commitment_data': {},
+        'status': None,
+        'task_gid': None
+    }
+
+def mark_task_created(commitment_id, task_gid):
+    if not commitment_id:
+        return
+    now = time.time()
+    with _lock:
+        record = _memory.get(commitment_id)
+        if record is not None:
+            _memory[commitment_id] = {**record, 'status': STATUS_TASK_CREATED, 'task_gid': task_gid, 'updated_at': now}
+        try:
+            _get_db().execute(
+                "UPDATE commitments SET status = ?, task_gid = ?, updated_at = ? WHERE id = ?",
+                (STATUS_TASK_CREATED, task_gid, now, commitment_id)
+            )
+        except sqlite3.Error as e:
+            _counters['db_errors'] += 1
+            logging.error("Error actualizando el compromiso %s: %s", commitment_id, e)
+
+def query(channel=None, status=None, since=None, until=None, limit=100):
+    """Compromisos registrados, del más nuevo al más viejo"""
+    conditions = []
+    params = []
+    if channel:
+        conditions.append("channel = ?")
+        params.append(channel)
+    if status:
+        conditions.append("status = ?")
+        params.append(status)
+    if since is not None:
+        conditions.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _lock:
+        rows = _get_db().execute(
+            f"SELECT {_COLUMNS} FROM commitments {where} ORDER BY created_at DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+    return [_from_row(row) for row in rows]
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+        size = len(_memory)
+    lookups = counters['memory_hits'] + counters['persistent_hits'] + counters['misses']
+    return {
+        **counters,
+        'persistent': is_persistent(),
+        'memory_size': size,
+        'memory_hit_rate': round(counters['memory_hits'] / lookups, 4) if lookups else None
+    }
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CHANNEL_MAP_PATH = os.path.join(CURRENT_DIR, 'channel_map.json')
+ASANA_PROJECTS_PATH = os.path.join(CURRENT_DIR, 'asana_pj.json')
+
+# Cada cuántos segundos se revisa el mtime de los archivos
+CONFIG_CHECK_INTERVAL = float(os.getenv('CONFIG_CHECK_INTERVAL', '5'))
+# Slack permite como máximo 100 opciones y 75 caracteres por opción
+MAX_PROJECT_OPTIONS = 100
+MAX_OPTION_TEXT = 75
+
+class ConfigSnapshot:
+    """Configuración ya parseada e indexada. No se modifica: una recarga crea un snapshot nuevo"""
+
+    __slots__ = ('channel_map', 'project_names', 'project_options', 'option_by_project', 'version')
+
+    def __init__(self, channel_map, project_names, version):
+        # canal de Slack → gid del proyecto de Asana
+        self.channel_map = MappingProxyType(dict(channel_map))
+        # gid del proyecto → nombre
+        self.project_names = MappingProxyType(dict(project_names))
+        # Opciones del selector de proyectos, ya ordenadas y truncadas. No modificar los dicts.
+        self.project_options = tuple(
+            {
+                "text": {
+                    "type": "plain_text",
+                    "text": project_name[:MAX_OPTION_TEXT]
+                },
+                "value": project_id
+            }
+            for project_id, project_name in sorted(project_names.items(), key=lambda item: item[1])[:MAX_PROJECT_OPTIONS]
+        )
+        self.option_by_project = MappingProxyType({opt["value"]: opt for opt in self.project_options})
+        self.version = version
+
+_lock = threading.Lock()
+_snapshot = None
+_mtimes = None
+_last_check = 0.0
+_reloads = 0
+# gid → nombre publicado por project_catalog; mientras sea None se usa asana_pj.json
+_catalog = None
+
+def _get_mtimes():
+    mtimes = []
+    for path in (CHANNEL_MAP_PATH, ASANA_PROJECTS_PATH):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+def _load_channel_map():
+    try:
+        with open(CHANNEL_MAP_PATH, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise Exception(f"channel_map.json not found at {CHANNEL_MAP_PATH}")
+    except json.JSONDecodeError:
+        raise Exception("channel_map.json contains invalid JSON")
+
+def _load_asana_projects():
+    try:
+        with open(ASANA_PROJECTS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning("No se pudo leer asana_pj.json: %s", e)
+        return {}
+
+def _project_names():
+    if _catalog is not None:
+        return _catalog
+    return {gid: name for name, gid in _load_asana_projects().items()}
+
+def reload():
+    """Vuelve a leer channel_map.json y asana_pj.json y reemplaza el snapshot"""
+    global _snapshot, _mtimes, _last_check, _reloads
+    with _lock:
+        mtimes = _get_mtimes()
+        _snapshot = ConfigSnapshot(_load_channel_map(), _project_names(), _reloads + 1)
+        _mtimes = mtimes
+        _last_check = time.monotonic()
+        _reloads += 1
+    logging.info("Configuración cargada: %s canales, %s proyectos", len(_snapshot.channel_map),
+                 len(_snapshot.project_names))
+    return _snapshot
+
+def set_projects(project_names):
+    """Reemplaza los proyectos (gid → nombre) por los del catálogo de Asana, con un snapshot nuevo.
+    Los lectores siguen usando el snapshot anterior hasta el swap: nunca esperan"""
+    global _snapshot, _catalog, _reloads
+    with _lock:
+        _catalog = dict(project_names)
+        channel_map = _snapshot.channel_map if _snapshot is not None else _load_channel_map()
+        _snapshot = ConfigSnapshot(channel_map, _catalog, _reloads + 1)
+        _reloads += 1
+    return _snapshot
+
+def get_config():
+    """Devuelve el snapshot actual, recargando sólo si cambió el mtime de algún archivo"""
+    global _last_check
+    snapshot = _snapshot
+    if snapshot is None:
+        return reload()
+
+    now = time.monotonic()
+    if now - _last_check < CONFIG_CHECK_INTERVAL:
+        return snapshot
+
+    _last_check = now
+    if _get_mtimes() != _mtimes:
+        try:
+            return reload()
+        except Exception as e:
+            # Si el archivo nuevo está roto seguimos con la última configuración válida
+            logging.error("Error recargando configuración, se mantiene la anterior: %s", e)
+    return snapshot
+
+def get_stats():
+    snapshot = _snapshot
+    return {
+        'reloads': _reloads,
+        'channels': len(snapshot.channel_map) if snapshot else 0,
+        'projects': len(snapshot.project_names) if snapshot else 0,
+        'project_source': 'catalog' if _catalog is not None else 'asana_pj.json'
+    }
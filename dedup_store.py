@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+
+# 'memory' (por proceso), 'sqlite' (compartido entre procesos de la misma máquina) o 'firebase' (entre instancias)
+DEDUP_BACKEND = os.getenv('DEDUP_BACKEND', 'memory')
+# Segundos que se recuerda un evento. Slack reintenta durante ~1 hora como máximo
+DEDUP_WINDOW_SECONDS = float(os.getenv('DEDUP_WINDOW_SECONDS', '3600'))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', '50000'))
+DEDUP_DB = os.getenv('DEDUP_DB', os.path.join(tempfile.gettempdir(), 'tracker_dedup.db'))
+DEDUP_FIREBASE_PATH = os.getenv('DEDUP_FIREBASE_PATH', '/dedup')
+# Cada cuántos segundos se borran de Firebase las claves vencidas, y cuántas como máximo por pasada
+DEDUP_FIREBASE_PURGE_INTERVAL = float(os.getenv('DEDUP_FIREBASE_PURGE_INTERVAL', '300'))
+DEDUP_FIREBASE_PURGE_BATCH = int(os.getenv('DEDUP_FIREBASE_PURGE_BATCH', '1000'))
+
+class MemoryDedupStore:
+    """Ventana temporal en memoria: ring buffer con los vencimientos + dict para lookup O(1)"""
+
+    def __init__(self, window_seconds, max_entries):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.expirations = deque()
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def _evict(self, now):
+        # Se sacan sólo los vencidos (o los más viejos si se pasa del máximo), nunca todo junto
+        while self.expirations and (self.expirations[0][0] <= now or len(self.expirations) > self.max_entries):
+            expires_at, key = self.expirations.popleft()
+            if self.keys.get(key) == expires_at:
+                del self.keys[key]
+
+    def seen(self, key):
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            if key in self.keys:
+                return True
+            expires_at = now + self.window_seconds
+            self.keys[key] = expires_at
+            self.expirations.append((expires_at, key))
+            return False
+
+class SqliteDedupStore:
+    """Ventana temporal en un archivo SQLite, compartida por todos los procesos que lo usen"""
+
+    def __init__(self, path, window_seconds):
+        self.window_seconds = window_seconds
+        self.db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        self.lock = threading.Lock()
+        self.last_purge = 0.0
+
+    def seen(self, key):
+        now = time.time()
+        with self.lock:
+            if now - self.last_purge > 60:
+                self.last_purge = now
+                self.db.execute("DELETE FROM seen_events WHERE expires_at <= ?", (now,))
+            # Si la clave existe pero venció se reemplaza; si sigue vigente no se toca
+            cursor = self.db.execute(
+                "INSERT INTO seen_events (key, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at WHERE seen_events.expires_at <= ?",
+                (key, now + self.window_seconds, now)
+            )
+            return cursor.rowcount == 0
+
+class FirebaseDedupStore:
+    """Ventana temporal en Firebase Realtime Database, compartida entre instancias de Cloud Run.
+
+    Costo: seen() es una transacción sincrónica contra Firebase (al menos un round trip, más uno por
+    cada conflicto) y corre en el ack de /slack/events, así que esa latencia (decenas de ms o más,
+    según la región de la base) cuenta dentro de los 3 segundos que da Slack. Sólo conviene con
+    varias instancias; con una sola alcanzan 'memory' o 'sqlite'.
+
+    Las claves vencidas se borran en un thread aparte cada DEDUP_FIREBASE_PURGE_INTERVAL segundos,
+    nunca en el ack. La consulta ordena por valor: en las reglas de la base conviene indexar
+    DEDUP_FIREBASE_PATH con ".indexOn": ".value".
+    """
+
+    def __init__(self, path, window_seconds, purge_interval=DEDUP_FIREBASE_PURGE_INTERVAL):
+        self.path = path.rstrip('/')
+        self.window_seconds = window_seconds
+        self.purge_interval = purge_interval
+        self.purged = 0
+        self.purger = None
+        self.lock = threading.Lock()
+
+    def seen(self, key):
+        import firebase_service
+
+        self._start_purger()
+        now = time.time()
+        # Firebase no acepta . $ # [ ] / en las claves
+        safe_key = re.sub(r'[.$#\[\]/]', '_', key)
+        result = {'seen': False}
+
+        def claim(current):
+            if current and current > now:
+                result['seen'] = True
+                return current
+            result['seen'] = False
+            return now + self.window_seconds
+
+        firebase_service.get_reference(f"{self.path}/{safe_key}").transaction(claim)
+        return result['seen']
+
+    def purge(self):
+        """Borra hasta DEDUP_FIREBASE_PURGE_BATCH claves vencidas. Devuelve cuántas borró"""
+        import firebase_service
+
+        ref = firebase_service.get_reference(self.path)
+        expired = ref.order_by_value().end_at(time.time()).limit_to_first(DEDUP_FIREBASE_PURGE_BATCH).get() or {}
+        if expired:
+            # Un solo update multi-path; None borra la clave
+            ref.update({key: None for key in expired})
+        with self.lock:
+            self.purged += len(expired)
+        return len(expired)
+
+    def _purge_loop(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                # Si quedó una tanda completa seguramente hay más: se sigue sin esperar
+                while self.purge() >= DEDUP_FIREBASE_PURGE_BATCH:
+                    pass
+            except Exception as e:
+                logging.error("Error borrando claves vencidas de deduplicación en Firebase: %s", e)
+
+    def _start_purger(self):
+        if self.purger is not None or self.purge_interval <= 0:
+            return
+        with self.lock:
+            if self.purger is None:
+                self.purger = threading.Thread(target=self._purge_loop, name='dedup-firebase-purge', daemon=True)
+                self.purger.start()
+
+_store = None
+_store_lock = threading.Lock()
+_counters_lock = threading.Lock()
+_counters = {
+    'checks': 0,
+    'duplicates_suppressed': 0,
+    'retries_short_circuited': 0,
+    'backend_errors': 0
+}
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if DEDUP_BACKEND == 'sqlite':
+                    _store = SqliteDedupStore(DEDUP_DB, DEDUP_WINDOW_SECONDS)
+                elif DEDUP_BACKEND == 'firebase':
+                    _store = FirebaseDedupStore(DEDUP_FIREBASE_PATH, DEDUP_WINDOW_SECONDS)
+                else:
+                    _store = MemoryDedupStore(DEDUP_WINDOW_SECONDS, DEDUP_MAX_ENTRIES)
+    return _store
+
+def is_duplicate(event_id):
+    """True si el evento ya se procesó dentro de la ventana. Lo marca como visto si no"""
+    if not event_id:
+        return False
+    try:
+        duplicate = get_store().seen(event_id)
+    except Exception as e:
+        # Ante una falla del backend preferimos procesar de más antes que perder eventos
+        with _counters_lock:
+            _counters['backend_errors'] += 1
+        logging.error("Error consultando el store de deduplicación: %s", e)
+        duplicate = False
+
+    with _counters_lock:
+        _counters['checks'] += 1
+        if duplicate:
+            _counters['duplicates_suppressed'] += 1
+    return duplicate
+
+def record_retry_short_circuit():
+    with _counters_lock:
+        _counters['retries_short_circuited'] += 1
+
+def get_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    if isinstance(_store, FirebaseDedupStore):
+        counters['firebase_purged'] = _store.purged
+    return {
+        **counters,
+        'backend': DEDUP_BACKEND,
+        'window_seconds': DEDUP_WINDOW_SECONDS
+    }
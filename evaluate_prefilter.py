@@ -0,0 +1,100 @@
+"""
+Evaluación offline del prefiltro contra los veredictos registrados del LLM.
+
+Uso:
+    python evaluate_prefilter.py verdicts.jsonl
+    python evaluate_prefilter.py verdicts.jsonl --thresholds 0.3,0.5,0.7
+    python evaluate_prefilter.py verdicts.jsonl --train prefilter_model.json
+
+El archivo es el JSONL que escribe llm_evaluator cuando VERDICT_LOG_PATH está
+configurado (con PREFILTER_SHADOW, que es el default, para no sesgar la muestra).
+Con --train se ajusta una regresión logística sobre las mismas features y se
+guarda en el formato que lee PREFILTER_MODEL_PATH.
+"""
+import sys
+import json
+import math
+import random
+import argparse
+import prefilter
+
+def load_records(path):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records.append((record['text'], bool(record['es_compromiso'])))
+    return records
+
+def evaluate(records, threshold, model=None):
+    tp = fp = fn = tn = 0
+    for text, label in records:
+        predicted = prefilter.score(text, model) >= threshold
+        if predicted and label:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif label:
+            fn += 1
+        else:
+            tn += 1
+
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'threshold': threshold,
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+        'llm_calls_avoided': round((fn + tn) / len(records), 4) if records else 0.0,
+        'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn
+    }
+
+def train(records, epochs=200, learning_rate=0.1):
+    """Regresión logística por descenso de gradiente, sin dependencias externas"""
+    names = list(prefilter.DEFAULT_MODEL['weights'].keys())
+    weights = {name: 0.0 for name in names}
+    bias = 0.0
+    samples = [(prefilter.extract_features(text), 1.0 if label else 0.0) for text, label in records]
+
+    for _ in range(epochs):
+        random.shuffle(samples)
+        for features, label in samples:
+            z = bias + sum(weights[name] * features[name] for name in names)
+            error = 1.0 / (1.0 + math.exp(-z)) - label
+            bias -= learning_rate * error
+            for name in names:
+                weights[name] -= learning_rate * error * features[name]
+
+    return {'bias': round(bias, 4), 'weights': {name: round(w, 4) for name, w in weights.items()}}
+
+def main():
+    parser = argparse.ArgumentParser(description='Precision/recall del prefiltro contra veredictos del LLM')
+    parser.add_argument('verdicts', help='JSONL con los veredictos registrados (VERDICT_LOG_PATH)')
+    parser.add_argument('--thresholds', default=str(prefilter.PREFILTER_THRESHOLD),
+                        help='Umbrales separados por coma')
+    parser.add_argument('--train', metavar='OUTPUT', help='Entrenar un modelo lineal y guardarlo en OUTPUT')
+    args = parser.parse_args()
+
+    records = load_records(args.verdicts)
+    if not records:
+        print("No hay veredictos para evaluar")
+        return 1
+
+    positives = sum(1 for _, label in records if label)
+    print(f"Veredictos: {len(records)} ({positives} compromisos)")
+
+    model = None
+    if args.train:
+        model = train(records)
+        with open(args.train, 'w', encoding='utf-8') as f:
+            json.dump(model, f, indent=2)
+        print(f"Modelo guardado en {args.train}: {model}")
+
+    for threshold in (float(t) for t in args.thresholds.split(',')):
+        print(json.dumps(evaluate(records, threshold, model)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import metrics
+import async_runtime
+from collections import deque
+
+# Configuración de la cola de eventos de Slack
+EVENT_QUEUE_MAXSIZE = int(os.getenv('EVENT_QUEUE_MAXSIZE', '200'))
+EVENT_QUEUE_WORKERS = int(os.getenv('EVENT_QUEUE_WORKERS', '4'))
+# Qué hacer con la cola llena: 'drop' descarta el evento, 'block' espera hasta EVENT_QUEUE_BLOCK_TIMEOUT segundos
+EVENT_QUEUE_BACKPRESSURE = os.getenv('EVENT_QUEUE_BACKPRESSURE', 'drop')
+EVENT_QUEUE_BLOCK_TIMEOUT = float(os.getenv('EVENT_QUEUE_BLOCK_TIMEOUT', '0.5'))
+# Cantidad de muestras que se guardan para calcular percentiles
+STATS_WINDOW = int(os.getenv('EVENT_QUEUE_STATS_WINDOW', '1000'))
+# Con EXECUTION_MODE=async: corrutinas corriendo a la vez en el loop (las demás esperan, hasta EVENT_QUEUE_MAXSIZE)
+EVENT_QUEUE_ASYNC_CONCURRENCY = int(os.getenv('EVENT_QUEUE_ASYNC_CONCURRENCY', '200'))
+
+_queue = queue.Queue(maxsize=EVENT_QUEUE_MAXSIZE)
+_workers = []
+_workers_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_ack_latencies = deque(maxlen=STATS_WINDOW)
+_wait_times = deque(maxlen=STATS_WINDOW)
+# Corrutinas enviadas al loop que todavía no terminaron
+_async_pending = 0
+_async_limit = None
+_counters = {
+    'enqueued': 0,
+    'dropped': 0,
+    'processed': 0,
+    'failed': 0
+}
+
+def _ensure_workers():
+    # Los workers se crean en el primer submit para que sobrevivan al fork de gunicorn
+    if len(_workers) >= EVENT_QUEUE_WORKERS:
+        return
+    with _workers_lock:
+        while len(_workers) < EVENT_QUEUE_WORKERS:
+            worker = threading.Thread(
+                target=_worker_loop,
+                name=f"event-worker-{len(_workers)}",
+                daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+
+def _worker_loop():
+    while True:
+        enqueued_at, trace_id, func, args = _queue.get()
+        wait_time = time.perf_counter() - enqueued_at
+        with _stats_lock:
+            _wait_times.append(wait_time)
+        metrics.observe('queue_wait_seconds', wait_time, help_text='Espera en cola antes de procesar', queue='events')
+        metrics.set_trace_id(trace_id)
+        try:
+            func(*args)
+            with _stats_lock:
+                _counters['processed'] += 1
+        except Exception as e:
+            with _stats_lock:
+                _counters['failed'] += 1
+            logging.error("Error procesando evento en la cola: %s", str(e))
+            logging.exception("Exception details:")
+        finally:
+            _queue.task_done()
+
+async def _run_async(enqueued_at, trace_id, func, args):
+    global _async_pending, _async_limit
+    # El semáforo se crea en el loop que lo usa (hay uno solo, el de async_runtime)
+    if _async_limit is None:
+        _async_limit = asyncio.Semaphore(EVENT_QUEUE_ASYNC_CONCURRENCY)
+    try:
+        async with _async_limit:
+            wait_time = time.perf_counter() - enqueued_at
+            with _stats_lock:
+                _wait_times.append(wait_time)
+            metrics.observe('queue_wait_seconds', wait_time, help_text='Espera en cola antes de procesar', queue='events')
+            metrics.set_trace_id(trace_id)
+            try:
+                await func(*args)
+                with _stats_lock:
+                    _counters['processed'] += 1
+            except Exception as e:
+                with _stats_lock:
+                    _counters['failed'] += 1
+                logging.error("Error procesando evento en la cola: %s", str(e))
+                logging.exception("Exception details:")
+    finally:
+        with _stats_lock:
+            _async_pending -= 1
+
+def _submit_async(func, args):
+    global _async_pending
+    with _stats_lock:
+        full = _async_pending >= EVENT_QUEUE_ASYNC_CONCURRENCY + EVENT_QUEUE_MAXSIZE
+        if full:
+            _counters['dropped'] += 1
+        else:
+            _async_pending += 1
+            _counters['enqueued'] += 1
+    if full:
+        logging.warning("Cola de eventos llena (%s), evento descartado", EVENT_QUEUE_MAXSIZE)
+        return False
+    async_runtime.submit(_run_async(time.perf_counter(), metrics.get_trace_id(), func, args))
+    return True
+
+def submit(func, *args):
+    """Encola func(*args) para un worker. Devuelve False si el evento se descartó por backpressure.
+    Si func es una corrutina corre en el loop de async_runtime en lugar de en un thread"""
+    if asyncio.iscoroutinefunction(func):
+        return _submit_async(func, args)
+    _ensure_workers()
+    item = (time.perf_counter(), metrics.get_trace_id(), func, args)
+    try:
+        if EVENT_QUEUE_BACKPRESSURE == 'block':
+            _queue.put(item, timeout=EVENT_QUEUE_BLOCK_TIMEOUT)
+        else:
+            _queue.put_nowait(item)
+    except queue.Full:
+        with _stats_lock:
+            _counters['dropped'] += 1
+        logging.warning("Cola de eventos llena (%s), evento descartado", EVENT_QUEUE_MAXSIZE)
+        return False
+
+    with _stats_lock:
+        _counters['enqueued'] += 1
+    return True
+
+def record_ack_latency(seconds):
+    with _stats_lock:
+        _ack_latencies.append(seconds)
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+def get_stats():
+    with _stats_lock:
+        ack_latencies = list(_ack_latencies)
+        wait_times = list(_wait_times)
+        counters = dict(_counters)
+        async_pending = _async_pending
+
+    return {
+        **counters,
+        'queue_depth': _queue.qsize(),
+        'async_pending': async_pending,
+        'queue_maxsize': EVENT_QUEUE_MAXSIZE,
+        'workers': len(_workers),
+        'backpressure': EVENT_QUEUE_BACKPRESSURE,
+        'ack_latency_p50_ms': _ms(_percentile(ack_latencies, 50)),
+        'ack_latency_p99_ms': _ms(_percentile(ack_latencies, 99)),
+        'queue_wait_p50_ms': _ms(_percentile(wait_times, 50)),
+        'queue_wait_p99_ms': _ms(_percentile(wait_times, 99))
+    }
@@ -0,0 +1,328 @@
+"""
+Servidores falsos de Slack, Asana, OpenAI y Anthropic para correr el bot sin red.
+
+Un solo ThreadingHTTPServer atiende todas las APIs bajo prefijos distintos:
+
+    /slack/api/...        Web API de Slack (chat.postMessage, views.open, users.*)
+    /asana/api/1.0/...    API de Asana (workspaces, users, projects, tasks, subtasks, batch)
+    /openai/v1/...        chat/completions
+    /anthropic/v1/...     messages
+    /webhook              webhook de errores
+
+Cada servicio tiene una latencia y una tasa de errores configurables, y se cuentan
+las llamadas por servicio y endpoint. Lo usa load_test.py apuntando las URLs base
+de http_client (SLACK_API_URL, ASANA_API_URL, ...) a este servidor.
+"""
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+SERVICES = ('slack', 'asana', 'openai', 'anthropic', 'webhook')
+
+PREFIXES = (
+    ('/slack/api/', 'slack'),
+    ('/asana/api/1.0/', 'asana'),
+    ('/openai/v1/', 'openai'),
+    ('/anthropic/v1/', 'anthropic'),
+    ('/webhook', 'webhook')
+)
+
+# Latencias típicas (segundos) de cada API
+DEFAULT_LATENCY = {
+    'slack': 0.05,
+    'asana': 0.25,
+    'openai': 0.8,
+    'anthropic': 1.2,
+    'webhook': 0.05
+}
+
+WORKSPACE_GID = '1000000000000001'
+
+class FakeServices:
+    """Estado compartido de los servicios falsos: configuración, contadores y eventos observados"""
+
+    def __init__(self, latency=None, error_rate=None, users=50, commitment_ratio=1.0, seed=None, jitter=0.5,
+                 projects=None):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        # La latencia real de cada llamada varía ±jitter alrededor de la configurada
+        self.jitter = jitter
+        self.error_rate = {service: 0.0 for service in SERVICES}
+        self.error_rate.update(error_rate or {})
+        self.commitment_ratio = commitment_ratio
+        self.random = random.Random(seed)
+        self.users = [
+            {
+                'id': f"U{i:08d}",
+                'name': f"user{i}",
+                'real_name': f"Usuario {i}",
+                'profile': {'email': f"user{i}@example.com"}
+            }
+            for i in range(users)
+        ]
+        # gid → nombre de los proyectos que devuelve GET /projects
+        self.projects = dict(projects or {})
+        self.archived = set()
+        # gid de la tarea → gids de sus subtareas, en el orden en que las muestra Asana
+        self.subtasks = {}
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.next_gid = 2000000000000000
+        # Callbacks del load test: on_button(channel, thread_ts, message), on_confirmation(channel, thread_ts, text)
+        self.on_button = None
+        self.on_confirmation = None
+        self.on_view_open = None
+
+    def _new_gid(self):
+        with self.lock:
+            self.next_gid += 1
+            return str(self.next_gid)
+
+    def _sleep(self, service):
+        latency = self.latency.get(service, 0.0)
+        if latency > 0:
+            time.sleep(latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def handle(self, method, path, query, body):
+        """Devuelve (status, headers, body dict) para el request"""
+        service, endpoint = _route(path)
+        if service is None:
+            return 404, {}, {'error': 'not_found'}
+
+        with self.lock:
+            self.calls[(service, _normalize_endpoint(endpoint))] += 1
+            fail = self.random.random() < self.error_rate.get(service, 0.0)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self._sleep(service)
+            if fail:
+                with self.lock:
+                    self.errors[service] += 1
+                return 503, {'Retry-After': '1'}, {'error': 'injected_failure'}
+
+            handler = getattr(self, f"_{service}", None)
+            return handler(method, endpoint, query, body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    # --- Slack ---
+
+    def _slack(self, method, endpoint, query, body):
+        if endpoint == 'chat.postMessage':
+            ts = f"{time.time():.6f}"
+            if body.get('attachments') and self.on_button:
+                self.on_button(body['channel'], body.get('thread_ts'), body)
+            elif body.get('text') and self.on_confirmation:
+                self.on_confirmation(body['channel'], body.get('thread_ts'), body['text'])
+            return 200, {}, {'ok': True, 'channel': body.get('channel'), 'ts': ts}
+        if endpoint == 'views.open':
+            if self.on_view_open:
+                self.on_view_open(body.get('trigger_id'), body.get('view', {}))
+            return 200, {}, {'ok': True, 'view': {'id': f"V{self._new_gid()}"}}
+        if endpoint == 'users.list':
+            return 200, {}, {'ok': True, 'members': self.users, 'response_metadata': {'next_cursor': ''}}
+        if endpoint == 'users.info':
+            user_id = query.get('user', [''])[0]
+            user = next((u for u in self.users if u['id'] == user_id), None)
+            if user is None:
+                return 200, {}, {'ok': False, 'error': 'user_not_found'}
+            return 200, {}, {'ok': True, 'user': user}
+        return 200, {}, {'ok': False, 'error': 'unknown_method'}
+
+    # --- Asana ---
+
+    def _asana(self, method, endpoint, query, body):
+        if endpoint == 'workspaces':
+            return 200, {}, {'data': [{'gid': WORKSPACE_GID, 'name': 'Workspace'}]}
+        if endpoint == 'users/me':
+            return 200, {}, {'data': {'gid': '3999999999999999', 'name': 'Bot', 'email': 'bot@example.com',
+                                      'workspaces': [{'gid': WORKSPACE_GID, 'name': 'Workspace'}]}}
+        if re.fullmatch(r'workspaces/\d+/users', endpoint):
+            users = [{'gid': f"3{i:015d}", 'email': u['profile']['email'], 'name': u['real_name']}
+                     for i, u in enumerate(self.users)]
+            return 200, {}, {'data': users, 'next_page': None}
+        if endpoint == 'projects' and method == 'GET':
+            limit = int(query.get('limit', ['100'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+            with self.lock:
+                page = list(self.projects.items())[offset:offset + limit]
+                total = len(self.projects)
+            data = [{'gid': gid, 'name': name, 'archived': gid in self.archived, 'modified_at': '2024-01-01T00:00:00.000Z'}
+                    for gid, name in page]
+            next_page = {'offset': str(offset + limit)} if offset + limit < total else None
+            return 200, {}, {'data': data, 'next_page': next_page}
+        if endpoint == 'tasks' and method == 'POST':
+            return 201, {}, {'data': {'gid': self._new_gid(), **body.get('data', {})}}
+        if re.fullmatch(r'tasks/\d+/subtasks', endpoint) and method == 'POST':
+            parent_gid = endpoint.split('/')[1]
+            gid = self._new_gid()
+            with self.lock:
+                self.subtasks.setdefault(parent_gid, []).append(gid)
+            return 201, {}, {'data': {'gid': gid, **body.get('data', {})}}
+        if re.fullmatch(r'tasks/\d+/subtasks', endpoint) and method == 'GET':
+            parent_gid = endpoint.split('/')[1]
+            with self.lock:
+                gids = list(self.subtasks.get(parent_gid, []))
+            return 200, {}, {'data': [{'gid': gid} for gid in gids], 'next_page': None}
+        if re.fullmatch(r'tasks/\d+/setParent', endpoint) and method == 'POST':
+            return self._set_parent(endpoint.split('/')[1], body.get('data', {}))
+        if endpoint == 'batch':
+            actions = body.get('data', {}).get('actions', [])
+            results = [{'status_code': 201, 'body': {'data': {'gid': self._new_gid()}}} for _ in actions]
+            # Como Asana, las acciones corren en paralelo: las subtareas quedan en el orden en que terminan
+            created = [(action['relative_path'].split('/')[2], result['body']['data']['gid'])
+                       for action, result in zip(actions, results)]
+            with self.lock:
+                self.random.shuffle(created)
+                for parent_gid, gid in created:
+                    self.subtasks.setdefault(parent_gid, []).append(gid)
+            return 200, {}, {'data': results}
+        return 404, {}, {'errors': [{'message': f"Unknown endpoint {endpoint}"}]}
+
+    def _set_parent(self, gid, data):
+        with self.lock:
+            siblings = self.subtasks.setdefault(data['parent'], [])
+            if gid in siblings:
+                siblings.remove(gid)
+            if data.get('insert_after') in siblings:
+                siblings.insert(siblings.index(data['insert_after']) + 1, gid)
+            elif data.get('insert_before') in siblings:
+                siblings.insert(siblings.index(data['insert_before']), gid)
+            else:
+                siblings.append(gid)
+        return 200, {}, {'data': {'gid': gid}}
+
+    # --- LLMs ---
+
+    def _verdict(self):
+        if self.random.random() >= self.commitment_ratio:
+            return {'es_compromiso': False, 'asignado_a': None, 'descripcion': None, 'fecha_limite': None}
+        return {
+            'es_compromiso': True,
+            'asignado_a': self.random.choice(self.users)['id'],
+            'descripcion': f"Tarea sintética {self._new_gid()}",
+            'fecha_limite': None
+        }
+
+    def _llm_answer(self, prompt, batch):
+        if batch:
+            # El prompt de batch numera los mensajes ("1. ...") uno por línea
+            count = len(re.findall(r'^\s*\d+\. ', prompt, flags=re.MULTILINE))
+            return {'veredictos': [self._verdict() for _ in range(count)]}
+        return self._verdict()
+
+    def _openai(self, method, endpoint, query, body):
+        prompt = body['messages'][-1]['content']
+        response_format = body.get('response_format', {})
+        schema_name = response_format.get('json_schema', {}).get('name')
+        batch = schema_name == 'veredictos' or 'veredictos' in body['messages'][0]['content']
+        content = json.dumps(self._llm_answer(prompt, batch))
+        return 200, {}, {
+            'choices': [{'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': sum(len(m['content']) for m in body['messages']) // 4,
+                      'completion_tokens': len(content) // 4}
+        }
+
+    def _anthropic(self, method, endpoint, query, body):
+        prompt = body['messages'][0]['content']
+        tool = (body.get('tools') or [{}])[0]
+        answer = self._llm_answer(prompt, tool.get('name') == 'veredictos')
+        if tool:
+            content = [{'type': 'tool_use', 'id': f"toolu_{self._new_gid()}", 'name': tool['name'], 'input': answer}]
+        else:
+            content = [{'type': 'text', 'text': json.dumps(answer)}]
+        return 200, {}, {
+            'content': content,
+            'usage': {'input_tokens': (len(prompt) + len(body.get('system', ''))) // 4,
+                      'output_tokens': len(json.dumps(answer)) // 4}
+        }
+
+    def _webhook(self, method, endpoint, query, body):
+        return 200, {}, {'ok': True}
+
+    def reset_in_flight(self):
+        with self.lock:
+            self.max_in_flight = self.in_flight
+
+    def get_stats(self):
+        with self.lock:
+            calls = dict(self.calls)
+            errors = dict(self.errors)
+        by_service = Counter()
+        for (service, _), count in calls.items():
+            by_service[service] += count
+        return {
+            'max_in_flight': self.max_in_flight,
+            'calls': dict(by_service),
+            'calls_by_endpoint': {f"{service} {endpoint}": count for (service, endpoint), count in sorted(calls.items())},
+            'injected_errors': errors
+        }
+
+def _route(path):
+    for prefix, service in PREFIXES:
+        if path.startswith(prefix) or path == prefix.rstrip('/'):
+            return service, path[len(prefix):].strip('/')
+    return None, None
+
+def _normalize_endpoint(endpoint):
+    return re.sub(r'/\d+(?=/|$)', '/{id}', endpoint)
+
+def _make_handler(services):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            try:
+                body = json.loads(raw) if raw else {}
+            except json.JSONDecodeError:
+                body = {}
+            status, headers, payload = services.handle(self.command, parts.path, parse_qs(parts.query), body)
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class _Server(ThreadingHTTPServer):
+    # El backlog por defecto (5) corta conexiones cuando hay cientos de requests en vuelo
+    request_queue_size = 1024
+    daemon_threads = True
+
+def start(services, host='127.0.0.1', port=0):
+    """Levanta el servidor en un thread. Devuelve (server, base_url)"""
+    server = _Server((host, port), _make_handler(services))
+    threading.Thread(target=server.serve_forever, name='fake-services', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def env_for(base_url):
+    """Variables de entorno que apuntan el bot a los servicios falsos"""
+    return {
+        'SLACK_API_URL': f"{base_url}/slack/api",
+        'ASANA_API_URL': f"{base_url}/asana/api/1.0",
+        'OPENAI_API_URL': f"{base_url}/openai/v1",
+        'ANTHROPIC_API_URL': f"{base_url}/anthropic/v1",
+        'ERROR_WEBHOOK_URL': f"{base_url}/webhook"
+    }
@@ -1,13 +1,21 @@
-import firebase_admin, os
-from firebase_admin import credentials,db
+import os
 
-databaseURL = os.environ['databaseURL']
+# firebase_admin se importa recién al primer uso: es pesado y no hace falta para arrancar
 
-def acces_firebase_db():
+def _ensure_app():
+    import firebase_admin
+    from firebase_admin import credentials
     if not firebase_admin._apps:
 
         cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred, {'databaseURL': databaseURL, 
+        firebase_admin.initialize_app(cred, {'databaseURL': os.environ['databaseURL'], 
                                             'name':'fbapp'})
-    ref = db.reference('/acceso')
+
+def get_reference(path):
+    from firebase_admin import db
+    _ensure_app()
+    return db.reference(path)
+
+def acces_firebase_db():
+    ref = get_reference('/acceso')
     return ref.get()
\ No newline at end of file
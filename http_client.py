@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import rate_limiter
+import metrics
+import async_runtime
+
+# URLs base de cada API. Se pueden apuntar a servidores locales (ver load_test.py)
+SLACK_API_URL = os.getenv('SLACK_API_URL', 'https://slack.com/api')
+ASANA_API_URL = os.getenv('ASANA_API_URL', 'https://app.asana.com/api/1.0')
+OPENAI_API_URL = os.getenv('OPENAI_API_URL', 'https://api.openai.com/v1')
+ANTHROPIC_API_URL = os.getenv('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1')
+
+# Conexiones keep-alive por host. Por defecto igual a los threads de gunicorn,
+# así ningún thread espera por una conexión libre.
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', os.getenv('GUNICORN_THREADS', '8')))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_DEFAULT_READ_TIMEOUT = float(os.getenv('HTTP_DEFAULT_READ_TIMEOUT', '15'))
+
+# Timeouts (connect, read) por host
+HOST_TIMEOUTS = {
+    'slack.com': (HTTP_CONNECT_TIMEOUT, float(os.getenv('SLACK_READ_TIMEOUT', '10'))),
+    'hooks.slack.com': (HTTP_CONNECT_TIMEOUT, float(os.getenv('SLACK_WEBHOOK_READ_TIMEOUT', '5'))),
+    'app.asana.com': (HTTP_CONNECT_TIMEOUT, float(os.getenv('ASANA_READ_TIMEOUT', '15'))),
+    'api.openai.com': (HTTP_CONNECT_TIMEOUT, float(os.getenv('OPENAI_READ_TIMEOUT', '30'))),
+    'api.anthropic.com': (HTTP_CONNECT_TIMEOUT, float(os.getenv('CLAUDE_READ_TIMEOUT', '30')))
+}
+
+# Timeouts por endpoint (host + path), tienen prioridad sobre los del host
+ENDPOINT_TIMEOUTS = {
+    # El trigger_id del modal vence a los 3 segundos, no tiene sentido esperar más
+    'slack.com/api/views.open': (HTTP_CONNECT_TIMEOUT, float(os.getenv('SLACK_VIEWS_OPEN_READ_TIMEOUT', '2.5')))
+}
+
+# Reintentos ante 429 / sobrecarga del proveedor
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+# Un 429 significa que el request no se procesó: siempre se puede reintentar
+RATE_LIMITED_STATUS = 429
+# Con 503/529 el request pudo haberse procesado: sólo se reintenta si repetirlo no tiene efectos
+# (métodos idempotentes, o idempotent=True del llamador, ej. los LLM). Un POST /tasks no se repite
+OVERLOADED_STATUS = {503, 529}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session(host):
+    """Devuelve la sesión compartida (con su pool de conexiones) para el host"""
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _new_session()
+                _sessions[host] = session
+    return session
+
+def get_timeout(url):
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    endpoint = host + parts.path
+    if endpoint in ENDPOINT_TIMEOUTS:
+        return ENDPOINT_TIMEOUTS[endpoint]
+    return HOST_TIMEOUTS.get(host, (HTTP_CONNECT_TIMEOUT, HTTP_DEFAULT_READ_TIMEOUT))
+
+def metric_endpoint(url):
+    """Etiqueta de baja cardinalidad para el endpoint: host + path sin ids (ej. app.asana.com/api/1.0/tasks/{id})"""
+    parts = urlsplit(url)
+    if parts.hostname == 'hooks.slack.com':
+        return 'hooks.slack.com'
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', parts.path)
+    return (parts.hostname or '') + path
+
+def _retry_after(response, idempotent):
+    """Segundos a esperar si la respuesta indica rate limit (o sobrecarga y el request se puede repetir), o None"""
+    if response.status_code == RATE_LIMITED_STATUS or (idempotent and response.status_code in OVERLOADED_STATUS):
+        try:
+            return float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            return 0.0
+    # Slack a veces responde 200 con {"ok": false, "error": "ratelimited"}
+    if str(response.url).startswith(SLACK_API_URL) and 'json' in response.headers.get('Content-Type', ''):
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        if isinstance(body, dict) and body.get('error') == 'ratelimited':
+            return 0.0
+    return None
+
+def request(method, url, idempotent=None, max_wait=rate_limiter.RATE_LIMIT_MAX_WAIT, **kwargs):
+    """Igual que requests.request, pero reusando conexiones, siempre con timeout,
+    respetando los límites de cada API y reintentando ante 429 / Retry-After.
+
+    idempotent: si se puede reintentar ante 503/529 (por defecto según el método).
+    max_wait: espera máxima por el rate limiter; más que eso lanza rate_limiter.RateLimitExceeded.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    kwargs.setdefault('timeout', get_timeout(url))
+    session = get_session(urlsplit(url).hostname or '')
+    key = rate_limiter.bucket_key(url, kwargs.get('json'), slack_api_url=SLACK_API_URL)
+    bucket = rate_limiter.get_bucket(key)
+    
+    endpoint = metric_endpoint(url)
+    
+    attempt = 0
+    while True:
+        if bucket:
+            waited = bucket.acquire(max_wait)
+            if waited:
+                metrics.observe('rate_limit_wait_seconds', waited, help_text='Espera por token del rate limiter', endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            metrics.inc('outbound_errors_total', help_text='Requests salientes que fallaron sin respuesta',
+                        endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe('outbound_request_duration_seconds', time.perf_counter() - start,
+                            help_text='Duración de las llamadas a Slack, Asana y los LLM', endpoint=endpoint)
+        metrics.inc('outbound_requests_total', help_text='Requests salientes por endpoint y status',
+                    endpoint=endpoint, status=response.status_code)
+        
+        delay = _retry_delay(response, attempt, key, idempotent)
+        if delay is None:
+            return response
+        if bucket:
+            bucket.block_for(delay)
+        else:
+            time.sleep(delay)
+        attempt += 1
+
+def _retry_delay(response, attempt, key, idempotent):
+    """Segundos a esperar antes de reintentar, o None si la respuesta se devuelve tal cual"""
+    retry_after = _retry_after(response, idempotent)
+    if retry_after is None or attempt >= HTTP_MAX_RETRIES:
+        return None
+    
+    # Sin Retry-After usamos backoff exponencial con jitter
+    delay = retry_after if retry_after > 0 else rate_limiter.backoff_delay(attempt)
+    delay += rate_limiter.backoff_delay(0, base=0.25)
+    logging.warning("Rate limit en %s (%s), reintento %s en %.2fs", key, response.status_code, attempt + 1, delay)
+    return delay
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+async def request_async(method, url, idempotent=None, max_wait=rate_limiter.RATE_LIMIT_MAX_WAIT, **kwargs):
+    """Versión async de request() sobre el httpx.AsyncClient de async_runtime: mismos timeouts,
+    rate limits, reintentos y métricas. Sólo se puede llamar desde el loop de async_runtime"""
+    import httpx
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    connect, read = kwargs.pop('timeout', None) or get_timeout(url)
+    kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+    # requests acepta el body como str en data=, httpx lo espera en content=
+    if isinstance(kwargs.get('data'), (str, bytes)):
+        kwargs['content'] = kwargs.pop('data')
+    client = async_runtime.get_client()
+    key = rate_limiter.bucket_key(url, kwargs.get('json'), slack_api_url=SLACK_API_URL)
+    bucket = rate_limiter.get_bucket(key)
+    
+    endpoint = metric_endpoint(url)
+    
+    attempt = 0
+    while True:
+        if bucket:
+            waited = await bucket.acquire_async(max_wait)
+            if waited:
+                metrics.observe('rate_limit_wait_seconds', waited, help_text='Espera por token del rate limiter', endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            metrics.inc('outbound_errors_total', help_text='Requests salientes que fallaron sin respuesta',
+                        endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe('outbound_request_duration_seconds', time.perf_counter() - start,
+                            help_text='Duración de las llamadas a Slack, Asana y los LLM', endpoint=endpoint)
+        metrics.inc('outbound_requests_total', help_text='Requests salientes por endpoint y status',
+                    endpoint=endpoint, status=response.status_code)
+        
+        delay = _retry_delay(response, attempt, key, idempotent)
+        if delay is None:
+            return response
+        if bucket:
+            bucket.block_for(delay)
+        else:
+            await asyncio.sleep(delay)
+        attempt += 1
+
+async def get_async(url, **kwargs):
+    return await request_async('GET', url, **kwargs)
+
+async def post_async(url, **kwargs):
+    return await request_async('POST', url, **kwargs)
+
+def get_stats():
+    """Requests y conexiones abiertas por host; reused = requests que no abrieron conexión nueva"""
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+
+    for host, session in sessions.items():
+        requests_count = 0
+        connections = 0
+        # El mismo adapter está montado para http:// y https://
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_count += pool.num_requests
+                connections += pool.num_connections
+        stats[host] = {
+            'requests': requests_count,
+            'connections_opened': connections,
+            'reused': max(requests_count - connections, 0),
+            'pool_size': HTTP_POOL_SIZE
+        }
+    return stats
@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import asyncio
+import socket
+import logging
+import sqlite3
+import tempfile
+import threading
+import contextvars
+from collections import deque
+import metrics
+import async_runtime
+
+# Archivo SQLite de la cola. Para sobrevivir a reinicios tiene que estar en un volumen persistente.
+JOB_QUEUE_DB = os.getenv('JOB_QUEUE_DB', os.path.join(tempfile.gettempdir(), 'tracker_jobs.db'))
+JOB_QUEUE_WORKERS = int(os.getenv('JOB_QUEUE_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+# Backoff entre reintentos: JOB_RETRY_BASE * 2^(intento - 1) segundos
+JOB_RETRY_BASE = float(os.getenv('JOB_RETRY_BASE', '5'))
+# Un job 'running' sin novedades por más de este tiempo se considera abandonado y se reintenta.
+# Mientras el job corre, el proceso que lo tomó renueva el lease cada JOB_LEASE_SECONDS / 3
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '120'))
+# Cuánto se guardan los jobs terminados (para idempotencia)
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+POLL_INTERVAL = 1.0
+# Con EXECUTION_MODE=async: jobs corriendo a la vez en el event loop (reemplaza a JOB_QUEUE_WORKERS)
+JOB_QUEUE_ASYNC_CONCURRENCY = int(os.getenv('JOB_QUEUE_ASYNC_CONCURRENCY', '50'))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_local = threading.local()
+# Job que está corriendo en este thread / tarea async (para checkpoint())
+_current_job = contextvars.ContextVar('current_job', default=None)
+_handlers = {}
+# Jobs tomados por este proceso: el heartbeat les renueva el lease
+_running = set()
+_running_lock = threading.Lock()
+_heartbeat = None
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+_stats_lock = threading.Lock()
+_completed_at = deque(maxlen=10000)
+_counters = {
+    'enqueued': 0,
+    'duplicates': 0,
+    'completed': 0,
+    'retried': 0,
+    'dead_lettered': 0,
+    'not_retryable': 0,
+    'lease_renewals': 0
+}
+
+def _get_db():
+    db = getattr(_local, 'db', None)
+    if db is None:
+        db = sqlite3.connect(JOB_QUEUE_DB, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                worker_id TEXT,
+                last_error TEXT
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status_next_run ON jobs (status, next_run_at)")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                idempotency_key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                failed_at REAL NOT NULL
+            )
+        """)
+        _local.db = db
+    return db
+
+def register(kind, handler, on_dead=None):
+    """Registra el handler(payload) de un tipo de job. on_dead(payload, error) corre al agotar los reintentos.
+
+    Si el handler lanza una excepción con retryable = False (ej. un 4xx de Asana) el job va directo
+    a dead letters: reintentar no lo va a arreglar.
+    """
+    _handlers[kind] = (handler, on_dead)
+
+def checkpoint(**fields):
+    """Guarda fields en el payload del job que está corriendo. Si el job se reintenta, el handler los
+    recibe en el payload y puede saltear los pasos que ya hizo (ej. no volver a crear la tarea).
+    Fuera de un job no hace nada"""
+    job = _current_job.get()
+    if job is None:
+        return
+    job_id, payload = job
+    payload.update(fields)
+    _get_db().execute("UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                      (json.dumps(payload), time.time(), job_id))
+
+def enqueue(kind, payload, idempotency_key):
+    """Guarda el job en la cola. Devuelve False si ya existía un job con esa clave"""
+    now = time.time()
+    try:
+        _get_db().execute(
+            "INSERT INTO jobs (idempotency_key, kind, payload, status, next_run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+            (idempotency_key, kind, json.dumps(payload), now, now, now)
+        )
+    except sqlite3.IntegrityError:
+        with _stats_lock:
+            _counters['duplicates'] += 1
+        logging.warning("Job duplicado ignorado: %s", idempotency_key)
+        return False
+
+    with _stats_lock:
+        _counters['enqueued'] += 1
+    _wakeup.set()
+    return True
+
+def _claim_next():
+    db = _get_db()
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT id, kind, payload, attempts, idempotency_key, next_run_at FROM jobs "
+            "WHERE (status = 'pending' AND next_run_at <= ?) OR (status = 'running' AND updated_at < ?) "
+            "ORDER BY next_run_at LIMIT 1",
+            (now, now - JOB_LEASE_SECONDS)
+        ).fetchone()
+        if row:
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, worker_id = ? WHERE id = ?",
+                (now, WORKER_ID, row[0])
+            )
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return row
+
+def _complete(job_id):
+    now = time.time()
+    _get_db().execute("UPDATE jobs SET status = 'done', updated_at = ?, last_error = NULL WHERE id = ?", (now, job_id))
+    with _stats_lock:
+        _counters['completed'] += 1
+        _completed_at.append(now)
+
+def _fail(job_id, kind, payload, attempts, idempotency_key, error, retryable=True):
+    db = _get_db()
+    now = time.time()
+    if retryable and attempts < JOB_MAX_ATTEMPTS:
+        delay = JOB_RETRY_BASE * (2 ** (attempts - 1))
+        db.execute(
+            "UPDATE jobs SET status = 'pending', next_run_at = ?, updated_at = ?, last_error = ? WHERE id = ?",
+            (now + delay, now, error, job_id)
+        )
+        with _stats_lock:
+            _counters['retried'] += 1
+        logging.warning("Job %s (%s) falló, reintento %s/%s en %.0fs: %s", job_id, kind, attempts, JOB_MAX_ATTEMPTS,
+                        delay, error)
+        return False
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            "INSERT INTO dead_letters (job_id, idempotency_key, kind, payload, attempts, last_error, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, idempotency_key, kind, payload, attempts, error, now)
+        )
+        # El job queda como 'dead' para que la clave de idempotencia siga ocupada
+        db.execute("UPDATE jobs SET status = 'dead', updated_at = ?, last_error = ? WHERE id = ?", (now, error, job_id))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    with _stats_lock:
+        _counters['dead_lettered'] += 1
+        _counters['not_retryable'] += int(not retryable)
+    logging.error("Job %s (%s) movido a dead letters después de %s intentos%s: %s",
+                  job_id, kind, attempts, '' if retryable else ' (error no reintentable)', error)
+    return True
+
+def _purge_old_jobs():
+    _get_db().execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'dead') AND updated_at < ?",
+        (time.time() - JOB_RETENTION_SECONDS,)
+    )
+
+def _run_job(row):
+    job_id, kind, payload_json, attempts, idempotency_key, next_run_at = row
+    metrics.observe('queue_wait_seconds', max(time.time() - next_run_at, 0.0),
+                    help_text='Espera en cola antes de procesar', queue='jobs')
+    attempts += 1
+    handler, on_dead = _handlers.get(kind, (None, None))
+    payload = json.loads(payload_json)
+    if handler is None:
+        _fail(job_id, kind, payload_json, JOB_MAX_ATTEMPTS, idempotency_key, f"No hay handler para '{kind}'")
+        return
+
+    token = _current_job.set((job_id, payload))
+    _track(job_id)
+    try:
+        handler(payload)
+    except Exception as e:
+        logging.exception("Exception details:")
+        dead = _fail(job_id, kind, json.dumps(payload), attempts, idempotency_key, str(e), _is_retryable(e))
+        if dead and on_dead:
+            _call_on_dead(job_id, on_dead, payload, e)
+        return
+    finally:
+        _untrack(job_id)
+        _current_job.reset(token)
+
+    _complete(job_id)
+
+def _is_retryable(error):
+    return getattr(error, 'retryable', True)
+
+def _track(job_id):
+    with _running_lock:
+        _running.add(job_id)
+
+def _untrack(job_id):
+    with _running_lock:
+        _running.discard(job_id)
+
+def _renew_leases():
+    """Renueva el lease de los jobs que están corriendo en este proceso, para que otro worker no
+    los tome como abandonados aunque tarden más que JOB_LEASE_SECONDS"""
+    with _running_lock:
+        job_ids = list(_running)
+    if not job_ids:
+        return
+    placeholders = ','.join('?' * len(job_ids))
+    _get_db().execute(
+        f"UPDATE jobs SET updated_at = ? WHERE status = 'running' AND worker_id = ? AND id IN ({placeholders})",
+        (time.time(), WORKER_ID, *job_ids)
+    )
+    with _stats_lock:
+        _counters['lease_renewals'] += len(job_ids)
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            _renew_leases()
+        except sqlite3.Error as e:
+            logging.error("Error renovando el lease de los jobs: %s", e)
+
+def _call_on_dead(job_id, on_dead, payload, error):
+    try:
+        on_dead(payload, error)
+    except Exception:
+        logging.exception("Error en on_dead del job %s", job_id)
+
+async def _run_job_async(row):
+    """Como _run_job, para handlers async. SQLite y on_dead siguen siendo sync y van a un thread"""
+    job_id, kind, payload_json, attempts, idempotency_key, next_run_at = row
+    handler, on_dead = _handlers.get(kind, (None, None))
+    if not asyncio.iscoroutinefunction(handler):
+        await asyncio.to_thread(_run_job, row)
+        return
+
+    metrics.observe('queue_wait_seconds', max(time.time() - next_run_at, 0.0),
+                    help_text='Espera en cola antes de procesar', queue='jobs')
+    attempts += 1
+    payload = json.loads(payload_json)
+    # Cada job corre en su propia tarea: el contextvar no se mezcla con los demás
+    _current_job.set((job_id, payload))
+    _track(job_id)
+    try:
+        try:
+            await handler(payload)
+        except Exception as e:
+            logging.exception("Exception details:")
+            dead = await asyncio.to_thread(_fail, job_id, kind, json.dumps(payload), attempts, idempotency_key, str(e),
+                                           _is_retryable(e))
+            if dead and on_dead:
+                await asyncio.to_thread(_call_on_dead, job_id, on_dead, payload, e)
+            return
+        finally:
+            _untrack(job_id)
+
+        await asyncio.to_thread(_complete, job_id)
+    except sqlite3.Error as e:
+        # El job queda 'running' y se reintenta cuando venza el lease
+        logging.error("Error actualizando el job %s: %s", job_id, e)
+
+def _worker_loop():
+    last_purge = 0.0
+    while True:
+        try:
+            row = _claim_next()
+        except sqlite3.Error as e:
+            logging.error("Error leyendo la cola de jobs: %s", e)
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        if row is None:
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                _purge_old_jobs()
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        try:
+            _run_job(row)
+        except sqlite3.Error as e:
+            # El job queda 'running' y se reintenta cuando venza el lease
+            logging.error("Error actualizando el job %s: %s", row[0], e)
+
+def _async_dispatch_loop():
+    """Toma jobs de la cola y los corre en el loop de async_runtime, hasta JOB_QUEUE_ASYNC_CONCURRENCY a la vez"""
+    slots = threading.BoundedSemaphore(JOB_QUEUE_ASYNC_CONCURRENCY)
+    last_purge = 0.0
+    while True:
+        slots.acquire()
+        try:
+            row = _claim_next()
+        except sqlite3.Error as e:
+            slots.release()
+            logging.error("Error leyendo la cola de jobs: %s", e)
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        if row is None:
+            slots.release()
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                _purge_old_jobs()
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        future = async_runtime.submit(_run_job_async(row))
+        future.add_done_callback(lambda _: slots.release())
+
+def is_persistent():
+    """False si JOB_QUEUE_DB está en el directorio temporal (en Cloud Run /tmp es memoria y se pierde al reiniciar)"""
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    return os.path.commonpath([os.path.realpath(JOB_QUEUE_DB), temp_dir]) != temp_dir
+
+def _warn_if_not_persistent():
+    if is_persistent():
+        return
+    message = ("JOB_QUEUE_DB (%s) está en el directorio temporal: los jobs pendientes se pierden si la "
+               "instancia se reinicia. Configurar JOB_QUEUE_DB en un volumen persistente")
+    # K_SERVICE sólo existe en Cloud Run, donde /tmp es memoria
+    if os.getenv('K_SERVICE'):
+        logging.error(message, JOB_QUEUE_DB)
+    else:
+        logging.warning(message, JOB_QUEUE_DB)
+
+def start_workers():
+    """Arranca los workers. Los jobs pendientes de una ejecución anterior se retoman solos"""
+    global _heartbeat
+    with _workers_lock:
+        if _workers:
+            return
+        _warn_if_not_persistent()
+        pending = _get_db().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
+        if pending:
+            logging.info("Retomando %s jobs pendientes de la cola", pending)
+        _heartbeat = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+        _heartbeat.start()
+        if async_runtime.is_async():
+            # Un solo thread reparte los jobs; la espera de red ocurre en el event loop
+            worker = threading.Thread(target=_async_dispatch_loop, name="job-dispatcher", daemon=True)
+            worker.start()
+            _workers.append(worker)
+            return
+        for i in range(JOB_QUEUE_WORKERS):
+            worker = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+def get_stats():
+    db = _get_db()
+    by_status = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    dead_letters = db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+    now = time.time()
+    with _stats_lock:
+        counters = dict(_counters)
+        completed_last_minute = sum(1 for t in _completed_at if now - t < 60)
+    return {
+        **counters,
+        'pending': by_status.get('pending', 0),
+        'running': by_status.get('running', 0),
+        'dead_letters': dead_letters,
+        'completed_last_minute': completed_last_minute,
+        'workers': len(_workers),
+        'persistent': is_persistent(),
+        'async_concurrency': JOB_QUEUE_ASYNC_CONCURRENCY if async_runtime.is_async() else None
+    }
@@ -0,0 +1,397 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import metrics
+
+# Orden de preferencia de los proveedores (sólo se usan los registrados, es decir con API key)
+LLM_PROVIDERS = [name.strip() for name in os.getenv('LLM_PROVIDERS', 'openai,claude').split(',') if name.strip()]
+# Requests simultáneos por proveedor; LLM_MAX_CONCURRENCY_<NOMBRE> lo cambia para uno solo
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+# Tiempo máximo para obtener un veredicto, contando hedge y fallback
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '25'))
+# Hedging: si el proveedor no respondió en su p95, se lanza el mismo prompt al siguiente
+LLM_HEDGE = os.getenv('LLM_HEDGE', '1').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))
+# Delay mientras no hay suficientes muestras para calcular el percentil
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '3'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+# Circuit breaker: tras N fallas seguidas el proveedor no se usa por LLM_BREAKER_COOLDOWN segundos
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+# Threads para las llamadas sync (el hedge necesita dos llamadas a la vez)
+LLM_DISPATCH_WORKERS = int(os.getenv('LLM_DISPATCH_WORKERS', '32'))
+
+ACQUIRED = 'acquired'
+BREAKER_OPEN = 'open'
+BUSY = 'busy'
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+class Provider:
+    """Un proveedor de LLM con su latencia observada, su circuit breaker y su límite de concurrencia"""
+
+    def __init__(self, name, model, evaluate, evaluate_async=None, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.name = name
+        self.model = model
+        self.evaluate = evaluate
+        self.evaluate_async = evaluate_async
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+        self.slot_freed = threading.Condition(self.lock)
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'cancelled': 0,
+            'wins': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'fallbacks': 0,
+            'rejected_busy': 0,
+            'rejected_open': 0,
+            'breaker_opens': 0
+        }
+
+    def _state(self, now):
+        if not self.open_until:
+            return 'closed'
+        return 'open' if now < self.open_until else 'half_open'
+
+    def try_acquire(self):
+        with self.lock:
+            return self._try_acquire_locked()
+
+    def _try_acquire_locked(self):
+        state = self._state(time.monotonic())
+        if state == 'open' or (state == 'half_open' and self.trial_in_flight):
+            self.counters['rejected_open'] += 1
+            return BREAKER_OPEN
+        if self.in_flight >= self.max_concurrency:
+            self.counters['rejected_busy'] += 1
+            return BUSY
+        # Medio abierto: pasa un solo request de prueba
+        if state == 'half_open':
+            self.trial_in_flight = True
+        self.in_flight += 1
+        self.counters['calls'] += 1
+        return ACQUIRED
+
+    def acquire_blocking(self, timeout):
+        """Espera hasta timeout segundos por un lugar libre. Devuelve True si lo obtuvo"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                result = self._try_acquire_locked()
+                if result != BUSY:
+                    return result == ACQUIRED
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.slot_freed.wait(remaining)
+
+    def release(self, seconds, outcome):
+        """outcome: 'ok', 'error' o 'cancelled' (perdió la carrera del hedge, no cuenta para el breaker)"""
+        with self.lock:
+            self.in_flight -= 1
+            trial = self.trial_in_flight
+            self.trial_in_flight = False
+            if outcome == 'ok':
+                self.counters['successes'] += 1
+                self.latencies.append(seconds)
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+            elif outcome == 'error':
+                self.counters['failures'] += 1
+                self.consecutive_failures += 1
+                if trial or self.consecutive_failures >= LLM_BREAKER_FAILURES:
+                    if not trial:
+                        logging.warning("Circuit breaker abierto para %s por %.0fs", self.name, LLM_BREAKER_COOLDOWN)
+                    self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+                    self.counters['breaker_opens'] += 1
+            else:
+                self.counters['cancelled'] += 1
+            self.slot_freed.notify()
+        metrics.observe('llm_provider_duration_seconds', seconds, help_text='Duración de cada llamada a un proveedor de LLM',
+                        provider=self.name, outcome=outcome)
+
+    def hedge_delay(self):
+        with self.lock:
+            latencies = list(self.latencies)
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, _percentile(latencies, LLM_HEDGE_PERCENTILE))
+
+    def record(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self.lock:
+            latencies = list(self.latencies)
+            stats = {
+                **self.counters,
+                'model': self.model,
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                'breaker': self._state(now),
+                'consecutive_failures': self.consecutive_failures
+            }
+        stats['latency_p50_ms'] = _ms(_percentile(latencies, 50))
+        stats['latency_p95_ms'] = _ms(_percentile(latencies, 95))
+        stats['hedge_delay_ms'] = _ms(self.hedge_delay())
+        return stats
+
+def _ms(value):
+    return round(value * 1000, 1) if value is not None else None
+
+_providers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_counters = {
+    'requests': 0,
+    'answered': 0,
+    'unanswered': 0,
+    'timeouts': 0,
+    'all_unavailable': 0
+}
+_counters_lock = threading.Lock()
+
+def register(name, model, evaluate, evaluate_async=None):
+    """Registra un proveedor. evaluate(prompt) → dict o None; evaluate_async es la versión corrutina"""
+    max_concurrency = int(os.getenv(f'LLM_MAX_CONCURRENCY_{name.upper()}', str(LLM_MAX_CONCURRENCY)))
+    _providers[name] = Provider(name, model, evaluate, evaluate_async, max_concurrency)
+
+def providers():
+    """Proveedores registrados en el orden de LLM_PROVIDERS (los no listados van al final)"""
+    ordered = [_providers[name] for name in LLM_PROVIDERS if name in _providers]
+    return ordered + [provider for name, provider in _providers.items() if name not in LLM_PROVIDERS]
+
+def models():
+    return [provider.model for provider in providers()]
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_DISPATCH_WORKERS, thread_name_prefix='llm-dispatch')
+    return _executor
+
+def _is_valid(result):
+    return isinstance(result, dict)
+
+def _next_provider(remaining):
+    """Saca de remaining el primer proveedor que acepte el request, o None"""
+    while remaining:
+        provider = remaining.pop(0)
+        if provider.try_acquire() == ACQUIRED:
+            return provider
+    return None
+
+class _Race:
+    """Estado de un dispatch: qué proveedores quedan, cuándo hedgear y qué se lanzó"""
+
+    def __init__(self):
+        self.candidates = providers()
+        if not self.candidates:
+            raise Exception("No LLM API key configured")
+        self.remaining = list(self.candidates)
+        self.deadline = time.monotonic() + LLM_TIMEOUT
+        self.hedge_at = None
+
+    def launched(self, provider, kind):
+        if kind != 'primary':
+            provider.record('hedges' if kind == 'hedge' else 'fallbacks')
+        if LLM_HEDGE and self.remaining:
+            self.hedge_at = time.monotonic() + provider.hedge_delay()
+        else:
+            self.hedge_at = None
+
+    def timeout(self):
+        now = time.monotonic()
+        timeout = self.deadline - now
+        if self.hedge_at is not None:
+            timeout = min(timeout, self.hedge_at - now)
+        return max(timeout, 0.0)
+
+    def hedge_due(self):
+        return self.hedge_at is not None and time.monotonic() >= self.hedge_at
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+def _call(provider, prompt, validate):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = provider.evaluate(prompt)
+        if validate(result):
+            outcome = 'ok'
+        return result
+    except Exception as e:
+        logging.error("Error llamando a %s: %s", provider.name, e)
+        return None
+    finally:
+        provider.release(time.perf_counter() - start, outcome)
+
+def _won(provider, kind, result):
+    provider.record('wins')
+    if kind == 'hedge':
+        provider.record('hedge_wins')
+    _count('answered')
+    return result, provider.model
+
+def _give_up(race):
+    _count('timeouts' if race.expired() else 'unanswered')
+    return None, None
+
+def evaluate(prompt, validate=_is_valid):
+    """Manda el prompt al mejor proveedor disponible; si tarda más que su p95 lanza el mismo prompt
+    al siguiente (hedge), y si falla pasa al siguiente (fallback). Devuelve (resultado, modelo) del
+    primero que responda algo válido según validate, o (None, None)"""
+    _count('requests')
+    race = _Race()
+    pending = {}
+    executor = _get_executor()
+
+    def launch(kind):
+        provider = _next_provider(race.remaining)
+        if provider is None:
+            return False
+        pending[executor.submit(_call, provider, prompt, validate)] = (provider, kind)
+        race.launched(provider, kind)
+        return True
+
+    if not launch('primary'):
+        # Todos ocupados o con el breaker abierto: esperar lugar en el primero que no esté abierto
+        provider = next((p for p in race.candidates if p.acquire_blocking(race.deadline - time.monotonic())), None)
+        if provider is None:
+            _count('all_unavailable')
+            logging.warning("Ningún proveedor de LLM disponible")
+            return None, None
+        pending[executor.submit(_call, provider, prompt, validate)] = (provider, 'primary')
+        race.launched(provider, 'primary')
+
+    while pending:
+        if race.expired():
+            break
+        done, _ = wait(list(pending), timeout=race.timeout(), return_when=FIRST_COMPLETED)
+        for future in done:
+            provider, kind = pending.pop(future)
+            result = future.result()
+            if validate(result):
+                # Los que siguen en vuelo terminan solos (un request sync no se puede cancelar)
+                return _won(provider, kind, result)
+        if done and not pending:
+            launch('fallback')
+        elif not done and race.hedge_due():
+            race.hedge_at = None
+            launch('hedge')
+
+    return _give_up(race)
+
+async def _call_async(provider, prompt, validate):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = await provider.evaluate_async(prompt)
+        if validate(result):
+            outcome = 'ok'
+        return result
+    except asyncio.CancelledError:
+        outcome = 'cancelled'
+        raise
+    except Exception as e:
+        logging.error("Error llamando a %s: %s", provider.name, e)
+        return None
+    finally:
+        provider.release(time.perf_counter() - start, outcome)
+
+async def _acquire_async(candidates, deadline):
+    """Espera (sin bloquear el loop) a que algún proveedor sin breaker abierto tenga lugar"""
+    while time.monotonic() < deadline:
+        results = []
+        for provider in candidates:
+            result = provider.try_acquire()
+            if result == ACQUIRED:
+                return provider
+            results.append(result)
+        if BUSY not in results:
+            return None
+        await asyncio.sleep(0.05)
+    return None
+
+async def evaluate_async(prompt, validate=_is_valid):
+    """Versión async de evaluate. El perdedor de un hedge se cancela"""
+    _count('requests')
+    race = _Race()
+    pending = {}
+
+    def launch(kind):
+        provider = _next_provider(race.remaining)
+        if provider is None:
+            return False
+        task = asyncio.ensure_future(_call_async(provider, prompt, validate))
+        pending[task] = (provider, kind)
+        race.launched(provider, kind)
+        return True
+
+    try:
+        if not launch('primary'):
+            provider = await _acquire_async(race.candidates, race.deadline)
+            if provider is None:
+                _count('all_unavailable')
+                logging.warning("Ningún proveedor de LLM disponible")
+                return None, None
+            pending[asyncio.ensure_future(_call_async(provider, prompt, validate))] = (provider, 'primary')
+            race.launched(provider, 'primary')
+
+        while pending:
+            if race.expired():
+                break
+            done, _ = await asyncio.wait(list(pending), timeout=race.timeout(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider, kind = pending.pop(task)
+                result = task.result()
+                if validate(result):
+                    return _won(provider, kind, result)
+            if done and not pending:
+                launch('fallback')
+            elif not done and race.hedge_due():
+                race.hedge_at = None
+                launch('hedge')
+
+        return _give_up(race)
+    finally:
+        for task in pending:
+            task.cancel()
+
+def get_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        'hedging': LLM_HEDGE,
+        'providers': {provider.name: provider.get_stats() for provider in providers()}
+    }
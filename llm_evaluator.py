@@ -1,8 +1,15 @@
 import os
+import re
 import json
-import requests
+import asyncio
+import http_client
 import logging
+import threading
+import time
 from utils import send_slack
+import verdict_cache
+import metrics
+import llm_dispatcher
 #from dotenv import load_dotenv
 
 #load_dotenv()
@@ -10,107 +17,356 @@ from utils import send_slack
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
 
+# Modelos por proveedor. Clasificar un mensaje corto no necesita un modelo grande
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+CLAUDE_MODEL = os.getenv('CLAUDE_MODEL', 'claude-3-5-haiku-20241022')
+# Salida estructurada de OpenAI: 'json_schema' (structured outputs) o 'json_object' (modelos viejos)
+OPENAI_RESPONSE_FORMAT = os.getenv('OPENAI_RESPONSE_FORMAT', 'json_schema')
+# Tokens de salida: un veredicto ocupa ~40, se deja margen. En batch se multiplica por la cantidad de mensajes
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '120'))
+# Normalizar menciones, links y emoji de Slack antes de mandar el mensaje ('0' lo manda tal cual)
+LLM_NORMALIZE_MARKUP = os.getenv('LLM_NORMALIZE_MARKUP', '1') != '0'
+# Caracteres del mensaje que se mandan al LLM después de normalizar el markup de Slack (0 = sin límite)
+LLM_MAX_MESSAGE_CHARS = int(os.getenv('LLM_MAX_MESSAGE_CHARS', '600'))
+# Incrementar cuando cambie el prompt para no reusar veredictos viejos
+PROMPT_VERSION = '2'
+
+# JSONL opcional donde se registran los veredictos del LLM (lo usa evaluate_prefilter.py)
+VERDICT_LOG_PATH = os.getenv('VERDICT_LOG_PATH')
+_verdict_log_lock = threading.Lock()
+
+def log_verdict(message_text, model, verdict):
+    if not VERDICT_LOG_PATH:
+        return
+    record = {
+        'ts': time.time(),
+        'model': model,
+        'prompt_version': PROMPT_VERSION,
+        'text': message_text,
+        'es_compromiso': bool(verdict.get('es_compromiso'))
+    }
+    try:
+        with _verdict_log_lock:
+            with open(VERDICT_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except OSError as e:
+        logging.warning("No se pudo registrar el veredicto: %s", e)
+
+# Markup de Slack: <@U123|nombre>, <#C123|canal>, <https://url|texto>, <!here>, :emoji:
+_USER_MENTION = re.compile(r'<@([A-Z0-9]+)(?:\|([^>]+))?>')
+_CHANNEL_MENTION = re.compile(r'<#[A-Z0-9]+(?:\|([^>]*))?>')
+_LINK = re.compile(r'<(?:https?|mailto):[^|>]+(?:\|([^>]+))?>')
+_SPECIAL_MENTION = re.compile(r'<!(here|channel|everyone)(?:\|[^>]*)?>')
+_SUBTEAM_MENTION = re.compile(r'<!subteam\^[A-Z0-9]+(?:\|([^>]+))?>')
+_EMOJI = re.compile(r':[a-z0-9_+\-]+:')
+
+def compact_message(text):
+    """Texto del mensaje sin el markup de Slack que no aporta a la evaluación, truncado a LLM_MAX_MESSAGE_CHARS"""
+    if not LLM_NORMALIZE_MARKUP:
+        return _truncate(text)
+    text = _USER_MENTION.sub(lambda m: f"@{m.group(2) or m.group(1)}", text)
+    text = _CHANNEL_MENTION.sub(lambda m: f"#{m.group(1) or 'canal'}", text)
+    text = _LINK.sub(lambda m: m.group(1) or '[link]', text)
+    text = _SPECIAL_MENTION.sub(r'@\1', text)
+    text = _SUBTEAM_MENTION.sub(lambda m: m.group(1) or '@grupo', text)
+    text = _EMOJI.sub('', text)
+    return _truncate(re.sub(r'\s+', ' ', text).strip())
+
+def _truncate(text):
+    if LLM_MAX_MESSAGE_CHARS and len(text) > LLM_MAX_MESSAGE_CHARS:
+        return text[:LLM_MAX_MESSAGE_CHARS - 1] + '…'
+    return text
+
+VERDICT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'es_compromiso': {'type': 'boolean'},
+        'asignado_a': {'type': ['string', 'null']},
+        'descripcion': {'type': ['string', 'null']},
+        'fecha_limite': {'type': ['string', 'null']}
+    },
+    'required': ['es_compromiso', 'asignado_a', 'descripcion', 'fecha_limite'],
+    'additionalProperties': False
+}
+
+BATCH_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'veredictos': {'type': 'array', 'items': VERDICT_SCHEMA}
+    },
+    'required': ['veredictos'],
+    'additionalProperties': False
+}
+
+SYSTEM_PROMPT = (
+    "Detectás compromisos de trabajo en mensajes de Slack (alguien se compromete o asigna una tarea concreta). "
+    "Respondé sólo JSON: es_compromiso (bool), asignado_a (@usuario o nombre, o null), "
+    "descripcion (tarea breve en infinitivo, o null), fecha_limite (fecha mencionada, o null)."
+)
+
+def _single_prompt(message_text):
+    return {
+        'system': SYSTEM_PROMPT,
+        'user': compact_message(message_text),
+        'schema': VERDICT_SCHEMA,
+        'schema_name': 'veredicto',
+        'max_tokens': LLM_MAX_OUTPUT_TOKENS
+    }
+
+def _batch_prompt(message_texts):
+    numbered = "\n".join(f"{n}. {compact_message(text)}" for n, text in enumerate(message_texts, start=1))
+    return {
+        'system': SYSTEM_PROMPT + " Evaluá cada mensaje por separado: un veredicto por mensaje en 'veredictos', en el mismo orden.",
+        'user': numbered,
+        'schema': BATCH_SCHEMA,
+        'schema_name': 'veredictos',
+        'max_tokens': LLM_MAX_OUTPUT_TOKENS * len(message_texts)
+    }
+
+def _store_verdict(message_text, model, verdict):
+    if verdict is not None:
+        verdict_cache.put(message_text, model, PROMPT_VERSION, verdict)
+        log_verdict(message_text, model, verdict)
+
+def _batch_validator(count):
+    """Una respuesta de batch sólo sirve si trae un veredicto por mensaje"""
+    def validate(result):
+        batch = result.get('veredictos') if isinstance(result, dict) else None
+        return isinstance(batch, list) and len(batch) == count
+    return validate
+
+def _cached_verdict(message_text):
+    # Sirve el veredicto de cualquier proveedor configurado
+    return verdict_cache.get_any(message_text, llm_dispatcher.models(), PROMPT_VERSION)
+
+def _apply_batch(message_texts, pending, verdicts, result, model):
+    """Copia los veredictos del batch a verdicts. Devuelve False si el LLM no respetó el formato"""
+    if not _batch_validator(len(pending))(result):
+        logging.warning("Respuesta de batch inválida para %s mensajes, se evalúan por separado", len(pending))
+        return False
+    for i, verdict in zip(pending, result['veredictos']):
+        if isinstance(verdict, dict):
+            verdicts[i] = verdict
+            _store_verdict(message_texts[i], model, verdict)
+    return True
+
 def evaluate_commitment(message_text):
-    prompt = f"""
-    Este mensaje de Slack podría implicar un compromiso de trabajo. Si lo es, devolvé un JSON con este formato:
-    {{
-      "es_compromiso": true|false,
-      "asignado_a": "nombre o ID de usuario",
-      "descripcion": "tarea",
-      "fecha_limite": "fecha o null"
-    }}
+    cached = _cached_verdict(message_text)
+    if cached is not None:
+        return cached
+    return _evaluate_uncached(message_text)
+
+def _evaluate_uncached(message_text):
+    """Evalúa un mensaje que ya se sabe que no está en verdict_cache"""
+    # llm_dispatcher elige el proveedor, hace hedge y fallback
+    with metrics.span('llm_evaluate'):
+        verdict, model = llm_dispatcher.evaluate(_single_prompt(message_text))
+    _store_verdict(message_text, model, verdict)
+    return verdict
+
+def evaluate_commitments(message_texts):
+    """Evalúa varios mensajes de un mismo hilo o canal con un solo request al LLM.
+    Devuelve una lista de veredictos (o None) en el mismo orden que message_texts."""
+    verdicts = [_cached_verdict(text) for text in message_texts]
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
     
-    Mensaje: {message_text}
-    """
+    # El cache ya se consultó arriba: lo pendiente va directo al LLM
+    if len(pending) == 1:
+        verdicts[pending[0]] = _evaluate_uncached(message_texts[pending[0]])
+    elif pending:
+        with metrics.span('llm_evaluate_batch'):
+            result, model = llm_dispatcher.evaluate(_batch_prompt([message_texts[i] for i in pending]),
+                                                    validate=_batch_validator(len(pending)))
+        if not _apply_batch(message_texts, pending, verdicts, result, model):
+            # Si el LLM no respetó el formato, evaluar uno por uno
+            for i in pending:
+                verdicts[i] = _evaluate_uncached(message_texts[i])
     
-    if OPENAI_API_KEY:
-        return evaluate_with_openai(prompt)
-    elif CLAUDE_API_KEY:
-        return evaluate_with_claude(prompt)
-    else:
-        raise Exception("No LLM API key configured")
+    return verdicts
 
-def evaluate_with_openai(prompt):
+# En las versiones async, verdict_cache (SQLite) y el log de veredictos (JSONL) van a un thread:
+# no pueden frenar el event loop
+
+async def evaluate_commitment_async(message_text):
+    cached = await asyncio.to_thread(_cached_verdict, message_text)
+    if cached is not None:
+        return cached
+    return await _evaluate_uncached_async(message_text)
+
+async def _evaluate_uncached_async(message_text):
+    with metrics.span('llm_evaluate'):
+        verdict, model = await llm_dispatcher.evaluate_async(_single_prompt(message_text))
+    await asyncio.to_thread(_store_verdict, message_text, model, verdict)
+    return verdict
+
+async def evaluate_commitments_async(message_texts):
+    """Versión async de evaluate_commitments"""
+    verdicts = await asyncio.to_thread(lambda: [_cached_verdict(text) for text in message_texts])
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    
+    if len(pending) == 1:
+        verdicts[pending[0]] = await _evaluate_uncached_async(message_texts[pending[0]])
+    elif pending:
+        with metrics.span('llm_evaluate_batch'):
+            result, model = await llm_dispatcher.evaluate_async(_batch_prompt([message_texts[i] for i in pending]),
+                                                                validate=_batch_validator(len(pending)))
+        if not await asyncio.to_thread(_apply_batch, message_texts, pending, verdicts, result, model):
+            # Sin orden entre mensajes: los requests individuales pueden ir en paralelo
+            results = await asyncio.gather(*(_evaluate_uncached_async(message_texts[i]) for i in pending))
+            for i, verdict in zip(pending, results):
+                verdicts[i] = verdict
+    
+    return verdicts
+
+_usage_lock = threading.Lock()
+# proveedor → tokens y fallas de parseo
+_usage = {}
+
+def _record_usage(provider, input_tokens, output_tokens, parse_failed=False):
+    with _usage_lock:
+        usage = _usage.setdefault(provider, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'parse_failures': 0})
+        usage['calls'] += 1
+        usage['input_tokens'] += input_tokens or 0
+        usage['output_tokens'] += output_tokens or 0
+        usage['parse_failures'] += int(parse_failed)
+    metrics.inc('llm_tokens_total', input_tokens or 0, help_text='Tokens consumidos por proveedor y dirección',
+                provider=provider, direction='input')
+    metrics.inc('llm_tokens_total', output_tokens or 0, provider=provider, direction='output')
+    if parse_failed:
+        metrics.inc('llm_parse_failures_total', help_text='Respuestas del LLM que no eran el JSON esperado', provider=provider)
+
+def _parse_json_content(provider, content):
+    try:
+        return json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        logging.warning("Respuesta de %s no es JSON válido: %s", provider, str(content)[:200])
+        return None
+
+def _openai_request(prompt):
     headers = {
         'Authorization': f'Bearer {OPENAI_API_KEY}',
         'Content-Type': 'application/json'
     }
     
+    if OPENAI_RESPONSE_FORMAT == 'json_schema':
+        response_format = {
+            'type': 'json_schema',
+            'json_schema': {'name': prompt['schema_name'], 'schema': prompt['schema'], 'strict': True}
+        }
+    else:
+        response_format = {'type': 'json_object'}
+    
     data = {
-        'model': 'gpt-3.5-turbo',
+        'model': OPENAI_MODEL,
         'messages': [
             {
                 'role': 'system',
-                'content': 'Eres un asistente que evalúa si los mensajes contienen compromisos de trabajo. Responde solo con JSON válido.'
+                'content': prompt['system']
             },
             {
                 'role': 'user',
-                'content': prompt
+                'content': prompt['user']
             }
         ],
-        'temperature': 0.1
+        'response_format': response_format,
+        'max_tokens': prompt['max_tokens'],
+        'temperature': 0
     }
-    
-    response = requests.post(
-        'https://api.openai.com/v1/chat/completions',
-        headers=headers,
-        json=data
-    )
-    
+    return f'{http_client.OPENAI_API_URL}/chat/completions', headers, data
+
+def _openai_result(response):
     if response.status_code == 200:
         result = response.json()
-        content = result['choices'][0]['message']['content']
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # Intentar extraer JSON del contenido
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start != -1 and json_end != 0:
-                return json.loads(content[json_start:json_end])
-            return None
+        usage = result.get('usage', {})
+        verdict = _parse_json_content('openai', result['choices'][0]['message'].get('content'))
+        _record_usage('openai', usage.get('prompt_tokens'), usage.get('completion_tokens'), verdict is None)
+        return verdict
     else:
-        logging.error(f"Error calling OpenAI API: {response.status_code} - {response.text}")
+        logging.error("Error calling OpenAI API: %s - %s", response.status_code, response.text)
         send_slack(f"Error calling OpenAI API: {response.status_code} - {response.text}")
         return None
 
-def evaluate_with_claude(prompt):
+def evaluate_with_openai(prompt):
+    url, headers, data = _openai_request(prompt)
+    # Evaluar no tiene efectos: se puede reintentar ante 503/529 aunque sea POST
+    response = http_client.post(url, headers=headers, json=data, idempotent=True)
+    return _openai_result(response)
+
+async def evaluate_with_openai_async(prompt):
+    url, headers, data = _openai_request(prompt)
+    response = await http_client.post_async(url, headers=headers, json=data, idempotent=True)
+    return _openai_result(response)
+
+def _claude_request(prompt):
     headers = {
         'x-api-key': CLAUDE_API_KEY,
         'anthropic-version': '2023-06-01',
         'Content-Type': 'application/json'
     }
     
+    # Salida estructurada de Anthropic: una tool con el schema y tool_choice forzado
     data = {
-        'model': 'claude-3-opus-20240229',
-        'max_tokens': 1000,
+        'model': CLAUDE_MODEL,
+        'max_tokens': prompt['max_tokens'],
+        'system': prompt['system'],
         'messages': [
             {
                 'role': 'user',
-                'content': prompt + "\n\nIMPORTANTE: Responde SOLO con el JSON solicitado, sin texto adicional."
+                'content': prompt['user']
             }
         ],
-        'temperature': 0.1
+        'tools': [
+            {
+                'name': prompt['schema_name'],
+                'description': 'Registra el veredicto',
+                'input_schema': prompt['schema']
+            }
+        ],
+        'tool_choice': {'type': 'tool', 'name': prompt['schema_name']},
+        'temperature': 0
     }
-    
-    response = requests.post(
-        'https://api.anthropic.com/v1/messages',
-        headers=headers,
-        json=data
-    )
-    
+    return f'{http_client.ANTHROPIC_API_URL}/messages', headers, data
+
+def _claude_result(response):
     if response.status_code == 200:
         result = response.json()
-        content = result['content'][0]['text']
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start != -1 and json_end != 0:
-                return json.loads(content[json_start:json_end])
-            return None
+        usage = result.get('usage', {})
+        tool_use = next((block for block in result.get('content', []) if block.get('type') == 'tool_use'), None)
+        verdict = tool_use.get('input') if tool_use else None
+        if not isinstance(verdict, dict):
+            logging.warning("Respuesta de claude sin tool_use: %s", str(result.get('content'))[:200])
+            verdict = None
+        _record_usage('claude', usage.get('input_tokens'), usage.get('output_tokens'), verdict is None)
+        return verdict
     else:
-        logging.error(f"Error calling Claude API: {response.status_code} - {response.text}")
+        logging.error("Error calling Claude API: %s - %s", response.status_code, response.text)
         send_slack(f"Error calling Claude API: {response.status_code} - {response.text}")
-        return None
\ No newline at end of file
+        return None
+
+def evaluate_with_claude(prompt):
+    url, headers, data = _claude_request(prompt)
+    response = http_client.post(url, headers=headers, json=data, idempotent=True)
+    return _claude_result(response)
+
+async def evaluate_with_claude_async(prompt):
+    url, headers, data = _claude_request(prompt)
+    response = await http_client.post_async(url, headers=headers, json=data, idempotent=True)
+    return _claude_result(response)
+
+def get_stats():
+    with _usage_lock:
+        usage = {provider: dict(values) for provider, values in _usage.items()}
+    for values in usage.values():
+        values['parse_failure_rate'] = round(values['parse_failures'] / values['calls'], 4) if values['calls'] else None
+    return {
+        'prompt_version': PROMPT_VERSION,
+        'models': {'openai': OPENAI_MODEL, 'claude': CLAUDE_MODEL},
+        'openai_response_format': OPENAI_RESPONSE_FORMAT,
+        'usage': usage
+    }
+
+# Proveedores disponibles para llm_dispatcher, según las API keys configuradas
+if OPENAI_API_KEY:
+    llm_dispatcher.register('openai', OPENAI_MODEL, evaluate_with_openai, evaluate_with_openai_async)
+if CLAUDE_API_KEY:
+    llm_dispatcher.register('claude', CLAUDE_MODEL, evaluate_with_claude, evaluate_with_claude_async)
@@ -0,0 +1,393 @@
+"""
+Prueba de carga offline: levanta main.app contra servicios falsos (fake_services.py)
+y le manda eventos e interacciones de Slack firmados a una tasa fija.
+
+Uso:
+    python load_test.py
+    python load_test.py --rate 50 --duration 60
+    python load_test.py --latency openai=1.5,asana=0.4 --error-rate asana=0.05
+    python load_test.py --provider claude --output resultado.json
+
+Cada mensaje sintético recorre el flujo completo: evento → botón en el hilo →
+click (views.open) → búsqueda de proyectos (/slack/options) → submit del modal → tarea en Asana → confirmación en el hilo.
+Al final se imprime un JSON con req/s, percentiles del ack, latencias de punta a
+punta y la cantidad de llamadas salientes por servicio.
+
+Los mensajes se reparten entre --channels canales de channel_map.json: el límite
+de chat.postMessage de Slack es por canal y rate_limiter lo aplica también acá.
+
+Las variables de entorno que ya estén definidas (ej. THREAD_BATCH_DELAY,
+EVENT_QUEUE_WORKERS, JOB_QUEUE_WORKERS) se respetan, así se pueden comparar configuraciones.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import fake_services
+import config_store
+
+SIGNING_SECRET = 'load-test-signing-secret'
+
+COMMITMENT_TEMPLATES = (
+    "<@{user}> mañana te mando el informe {n}",
+    "Yo me encargo de subir el reporte {n} antes del lunes <@{user}>",
+    "<@{user}> lo reviso el viernes y te aviso ({n})"
+)
+NOISE_TEMPLATES = (
+    "hola a todos ({n})",
+    "<@{user}> gracias! {n}"
+)
+
+def parse_overrides(value):
+    """'openai=0.8,asana=0.2' → {'openai': 0.8, 'asana': 0.2}"""
+    overrides = {}
+    for item in filter(None, (value or '').split(',')):
+        service, _, number = item.partition('=')
+        if service not in fake_services.SERVICES:
+            raise argparse.ArgumentTypeError(f"Servicio desconocido: {service}")
+        overrides[service] = float(number)
+    return overrides
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': _ms(percentile(values, 50)),
+        'p90_ms': _ms(percentile(values, 90)),
+        'p99_ms': _ms(percentile(values, 99)),
+        'max_ms': _ms(max(values) if values else None)
+    }
+
+def _ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+def sign(body, timestamp):
+    base = f"v0:{timestamp}:{body}".encode('utf-8')
+    return 'v0=' + hmac.new(SIGNING_SECRET.encode('utf-8'), base, hashlib.sha256).hexdigest()
+
+class LoadTest:
+    def __init__(self, app_url, services, args):
+        import requests
+        self.requests = requests
+        self.app_url = app_url
+        self.services = services
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.pool = ThreadPoolExecutor(max_workers=args.concurrency)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.acks = {'events': [], 'interactions': [], 'options': []}
+        self.statuses = {}
+        self.sent_at = {}
+        self.submitted_at = {}
+        self.event_to_button = []
+        self.click_to_modal = []
+        self.clicked_at = {}
+        self.submit_to_confirmation = []
+        self.counter = 0
+        self.channels = list(config_store.get_config().channel_map)[:args.channels]
+        self.last_activity = time.time()
+
+        services.on_button = self.on_button
+        services.on_view_open = self.on_view_open
+        services.on_confirmation = self.on_confirmation
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.requests.Session()
+            self.local.session = session
+        return session
+
+    def _post(self, kind, path, body, content_type):
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': content_type,
+            'X-Slack-Request-Timestamp': timestamp,
+            'X-Slack-Signature': sign(body, timestamp)
+        }
+        start = time.perf_counter()
+        try:
+            response = self._session().post(self.app_url + path, data=body.encode('utf-8'), headers=headers, timeout=10)
+            status = response.status_code
+        except self.requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.acks[kind].append(elapsed)
+            key = f"{kind}:{status}"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    # --- Eventos ---
+
+    def send_event(self):
+        with self.lock:
+            self.counter += 1
+            n = self.counter
+        user = self.random.choice(self.services.users)['id']
+        templates = NOISE_TEMPLATES if self.random.random() < self.args.noise_ratio else COMMITMENT_TEMPLATES
+        ts = f"{time.time():.6f}{n % 10}"
+        payload = {
+            'type': 'event_callback',
+            'event_id': f"Ev{n:010d}",
+            'event': {
+                'type': 'message',
+                'channel': self.channels[n % len(self.channels)],
+                'user': user,
+                'text': self.random.choice(templates).format(user=user, n=n),
+                'ts': ts
+            }
+        }
+        with self.lock:
+            self.sent_at[ts] = time.time()
+        self._post('events', '/slack/events', json.dumps(payload), 'application/json')
+
+    # --- Callbacks de los servicios falsos (corren en threads del servidor falso) ---
+
+    def on_button(self, channel, thread_ts, message):
+        now = time.time()
+        with self.lock:
+            self.last_activity = now
+            sent_at = self.sent_at.get(thread_ts)
+            if sent_at:
+                self.event_to_button.append(now - sent_at)
+        if self.random.random() < self.args.click_ratio:
+            self.pool.submit(self.click_button, channel, thread_ts, message)
+
+    def click_button(self, channel, thread_ts, message):
+        action = message['attachments'][0]['actions'][0]
+        payload = {
+            'type': 'interactive_message',
+            'callback_id': 'create_asana_task',
+            'trigger_id': f"trigger-{thread_ts}",
+            'channel': {'id': channel},
+            'user': {'id': self.random.choice(self.services.users)['id']},
+            'actions': [{'name': action['name'], 'type': 'button', 'value': action['value']}]
+        }
+        with self.lock:
+            self.clicked_at[payload['trigger_id']] = time.time()
+        self._post('interactions', '/slack/interactions', urlencode({'payload': json.dumps(payload)}),
+                   'application/x-www-form-urlencoded')
+
+    def on_view_open(self, trigger_id, view):
+        now = time.time()
+        with self.lock:
+            self.last_activity = now
+            clicked_at = self.clicked_at.pop(trigger_id, None)
+            if clicked_at:
+                self.click_to_modal.append(now - clicked_at)
+        # private_metadata es la referencia del compromiso (commitment_store.reference): trae el hilo
+        self.pool.submit(self.submit_view, view, json.loads(view['private_metadata'])['thread_ts'])
+
+    def submit_view(self, view, thread_ts):
+        project = next(block['element'] for block in view['blocks'] if block['block_id'] == 'project_block')
+        if project['type'] == 'external_select':
+            # Como al tipear en el selector: una consulta por letra
+            for query in ('p', 'pr', 'pro'):
+                self.search_projects(view, query)
+        selected = project.get('initial_option') or (project.get('options') or [{'value': '1'}])[0]
+        title = next(block['element'] for block in view['blocks'] if block['block_id'] == 'title_block')
+        subtasks = [f"Paso {i}" for i in range(self.args.subtasks)]
+        payload = {
+            'type': 'view_submission',
+            'view': {
+                'id': f"V{time.time_ns()}{self.random.randrange(1000)}",
+                'callback_id': view['callback_id'],
+                'private_metadata': view['private_metadata'],
+                'state': {
+                    'values': {
+                        'project_block': {'project_select': {'selected_option': selected}},
+                        'title_block': {'title_input': {'value': title.get('initial_value') or 'Tarea'}},
+                        'description_block': {'description_input': {'value': 'Creada por load_test.py'}},
+                        'assignee_block': {'assignee_select': {'selected_user': self.random.choice(self.services.users)['id']}},
+                        'due_date_block': {'due_date_picker': {'selected_date': None}},
+                        'subtasks_block': {'subtasks_input': {'value': '\n'.join(subtasks) or None}}
+                    }
+                }
+            }
+        }
+        with self.lock:
+            self.submitted_at[thread_ts] = time.time()
+        self._post('interactions', '/slack/interactions', urlencode({'payload': json.dumps(payload)}),
+                   'application/x-www-form-urlencoded')
+
+    def search_projects(self, view, query):
+        payload = {
+            'type': 'block_suggestion',
+            'action_id': 'project_select',
+            'block_id': 'project_block',
+            'value': query,
+            'view': {'private_metadata': view['private_metadata']}
+        }
+        self._post('options', '/slack/options', urlencode({'payload': json.dumps(payload)}),
+                   'application/x-www-form-urlencoded')
+
+    def on_confirmation(self, channel, thread_ts, text):
+        now = time.time()
+        with self.lock:
+            self.last_activity = now
+            submitted_at = self.submitted_at.pop(thread_ts, None)
+            if submitted_at and text.startswith('✅'):
+                self.submit_to_confirmation.append(now - submitted_at)
+
+    # --- Ejecución ---
+
+    def run(self):
+        total = int(self.args.rate * self.args.duration)
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / self.args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Open loop: un ack lento no frena el envío de los siguientes eventos
+            self.pool.submit(self.send_event)
+        send_seconds = time.perf_counter() - start
+
+        # Esperar a que el pipeline quede quieto: nada pendiente y sin actividad por un rato
+        # (los botones pueden tardar THREAD_BATCH_DELAY + la latencia del LLM)
+        deadline = time.time() + self.args.drain
+        while time.time() < deadline:
+            with self.lock:
+                pending = len(self.submitted_at) + len(self.clicked_at)
+                idle = time.time() - self.last_activity
+                acked = len(self.acks['events'])
+            if acked >= total and pending == 0 and idle > self.args.quiet:
+                break
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+        self.pool.shutdown(wait=False)
+
+        with self.lock:
+            requests_done = sum(len(values) for values in self.acks.values())
+            return {
+                'events_sent': total,
+                'send_rate_per_second': round(total / send_seconds, 2) if send_seconds else None,
+                'events_acked_per_second': round(len(self.acks['events']) / send_seconds, 2) if send_seconds else None,
+                'requests_per_second': round(requests_done / elapsed, 2) if elapsed else None,
+                'statuses': dict(sorted(self.statuses.items())),
+                'ack_latency': {kind: summarize(values) for kind, values in self.acks.items()},
+                'event_to_button': summarize(self.event_to_button),
+                'click_to_modal': summarize(self.click_to_modal),
+                'submit_to_confirmation': summarize(self.submit_to_confirmation),
+                'tasks_pending_at_end': len(self.submitted_at)
+            }
+
+def configure_env(base_url, args):
+    data_dir = tempfile.mkdtemp(prefix='tracker-load-')
+    defaults = {
+        'SLACK_SIGNING_SECRET': SIGNING_SECRET,
+        'SLACK_BOT_TOKEN': 'xoxb-load-test',
+        'ASANA_PERSONAL_ACCESS_TOKEN': 'load-test',
+        'CLOUD_LOGGING': '0',
+        'DEDUP_BACKEND': 'memory',
+        'JOB_QUEUE_DB': os.path.join(data_dir, 'jobs.db'),
+        'COMMITMENT_STORE_DB': os.path.join(data_dir, 'commitments.db'),
+        'PROJECT_CATALOG_SNAPSHOT': os.path.join(data_dir, 'projects.json'),
+        # El servidor falso atiende /slack/options: probar también la búsqueda de proyectos
+        'PROJECT_SELECT_MODE': 'external',
+        **fake_services.env_for(base_url)
+    }
+    defaults['CLAUDE_API_KEY' if args.provider == 'claude' else 'OPENAI_API_KEY'] = 'load-test'
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    # La selección de proveedor mira OPENAI_API_KEY primero
+    if args.provider == 'claude':
+        os.environ.pop('OPENAI_API_KEY', None)
+
+def wait_ready(startup, timeout=30):
+    deadline = time.time() + timeout
+    while not startup.is_ready() and time.time() < deadline:
+        time.sleep(0.1)
+    return startup.get_components()
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de main.app contra servicios falsos')
+    parser.add_argument('--rate', type=float, default=20, help='Eventos de Slack por segundo')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos enviando eventos')
+    parser.add_argument('--drain', type=float, default=60, help='Segundos máximos esperando que termine el pipeline')
+    parser.add_argument('--quiet', type=float, default=5, help='Segundos sin actividad para dar por terminado el pipeline')
+    parser.add_argument('--concurrency', type=int, default=64, help='Requests simultáneos del cliente')
+    parser.add_argument('--channels', type=int, default=10, help='Canales de Slack entre los que se reparten los mensajes')
+    parser.add_argument('--noise-ratio', type=float, default=0.3, help='Proporción de mensajes que no son compromisos')
+    parser.add_argument('--commitment-ratio', type=float, default=1.0, help='Proporción de veredictos positivos del LLM falso')
+    parser.add_argument('--click-ratio', type=float, default=1.0, help='Proporción de botones que se clickean')
+    parser.add_argument('--subtasks', type=int, default=2, help='Subtareas por tarea')
+    parser.add_argument('--latency', type=parse_overrides, default={}, help='Latencia por servicio, ej. openai=0.8,asana=0.2')
+    parser.add_argument('--error-rate', type=parse_overrides, default={}, help='Tasa de errores 503 por servicio, ej. asana=0.05')
+    parser.add_argument('--provider', choices=('openai', 'claude'), default='openai')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='Archivo donde guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    services = fake_services.FakeServices(latency=args.latency, error_rate=args.error_rate,
+                                          commitment_ratio=args.commitment_ratio, seed=args.seed,
+                                          # El catálogo sincronizado trae los mismos proyectos que asana_pj.json
+                                          projects=config_store.get_config().project_names)
+    fake_server, base_url = fake_services.start(services)
+    configure_env(base_url, args)
+
+    # main lee la configuración al importarse: recién acá, con el entorno ya armado
+    import main as app_module
+    import startup
+    from werkzeug.serving import make_server
+    # Los logs por request distorsionan la medición: sólo warnings salvo que se pida otra cosa
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    app_server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, name='app-server', daemon=True).start()
+    app_url = f"http://127.0.0.1:{app_server.server_port}"
+
+    components = wait_ready(startup)
+    # Las llamadas del warmup (users.list, etc.) no cuentan como carga
+    time.sleep(1)
+    baseline = services.get_stats()['calls']
+
+    result = LoadTest(app_url, services, args).run()
+    outbound = services.get_stats()
+    outbound['calls'] = {service: count - baseline.get(service, 0) for service, count in outbound['calls'].items()}
+    app_stats = app_module.get_all_stats()
+
+    report = {
+        'config': {
+            'rate': args.rate,
+            'duration': args.duration,
+            'provider': args.provider,
+            'latency': services.latency,
+            'error_rate': services.error_rate,
+            'thread_batch_delay': app_stats['thread_batcher']['delay_seconds']
+        },
+        'startup_components': components,
+        **result,
+        'outbound': outbound,
+        'app': {name: app_stats[name] for name in ('event_queue', 'thread_batcher', 'job_queue', 'prefilter', 'verdict_cache', 'modal_cache', 'project_search', 'project_catalog')}
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+    app_server.shutdown()
+    fake_server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
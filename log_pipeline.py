@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+import metrics
+
+# Máximo de records esperando al handler real; si se llena se descartan (nunca bloquea el request)
+LOG_QUEUE_MAXSIZE = int(os.getenv('LOG_QUEUE_MAXSIZE', '10000'))
+# Fracción de payloads que se loguean (del resto sólo queda el tipo)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.1'))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+# LOG_PAYLOAD_DEBUG=1 loguea todos los payloads completos (igual se ocultan los secretos)
+LOG_PAYLOAD_DEBUG = os.getenv('LOG_PAYLOAD_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# response_url permite publicar en el canal sin token: es tan sensible como uno
+SECRET_KEY_RE = re.compile(r'token|secret|signature|authorization|password|api[-_]?key|cookie|response_url',
+                           re.IGNORECASE)
+REDACTED = '[REDACTED]'
+
+_stats_lock = threading.Lock()
+_listener = None
+_counters = {
+    'records': 0,
+    'dropped': 0,
+    'enqueue_seconds': 0.0,
+    'enqueue_max_seconds': 0.0,
+    'payloads_logged': 0,
+    'payloads_sampled_out': 0,
+    'payloads_truncated': 0
+}
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el thread del request y descarta si la cola está llena"""
+
+    def prepare(self, record):
+        # El formateo (lazy, con record.args) lo hace el listener en su thread.
+        # El trace id se toma acá porque el listener corre en otro contexto.
+        trace_id = metrics.get_trace_id()
+        if trace_id:
+            record.json_fields = {**getattr(record, 'json_fields', {}), 'trace_id': trace_id}
+        return record
+
+    def enqueue(self, record):
+        start = time.perf_counter()
+        try:
+            self.queue.put_nowait(record)
+            dropped = False
+        except queue.Full:
+            dropped = True
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            _counters['records'] += 1
+            _counters['enqueue_seconds'] += elapsed
+            _counters['enqueue_max_seconds'] = max(_counters['enqueue_max_seconds'], elapsed)
+            if dropped:
+                _counters['dropped'] += 1
+
+def install():
+    """Pone los handlers actuales del root logger detrás de una cola atendida por un thread aparte"""
+    global _listener
+    root = logging.getLogger()
+    if _listener or not root.handlers:
+        return
+
+    handlers = list(root.handlers)
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    _listener.start()
+
+def redact(value):
+    """Copia del valor con los campos sensibles ocultos"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if isinstance(key, str) and SECRET_KEY_RE.search(key) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+def redact_headers(headers):
+    return redact(dict(headers))
+
+def payload_for_log(payload):
+    """Versión del payload apta para loguear: sin secretos, muestreada y truncada"""
+    if not LOG_PAYLOAD_DEBUG and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        with _stats_lock:
+            _counters['payloads_sampled_out'] += 1
+        return {'sampled_out': True, 'type': payload.get('type') if isinstance(payload, dict) else None}
+
+    serialized = json.dumps(redact(payload), separators=(',', ':'), ensure_ascii=False)
+    with _stats_lock:
+        _counters['payloads_logged'] += 1
+        truncated = not LOG_PAYLOAD_DEBUG and len(serialized) > LOG_PAYLOAD_MAX_CHARS
+        if truncated:
+            _counters['payloads_truncated'] += 1
+    if truncated:
+        return {'truncated': True, 'size': len(serialized), 'payload': serialized[:LOG_PAYLOAD_MAX_CHARS]}
+    return {'payload': serialized}
+
+def fields(**values):
+    """extra= para logging con campos estructurados (Cloud Logging los pone en jsonPayload)"""
+    return {'json_fields': values}
+
+def get_stats():
+    with _stats_lock:
+        counters = dict(_counters)
+    records = counters.pop('records')
+    enqueue_seconds = counters.pop('enqueue_seconds')
+    enqueue_max_seconds = counters.pop('enqueue_max_seconds')
+    return {
+        **counters,
+        'records': records,
+        'enqueue_avg_us': round(enqueue_seconds / records * 1e6, 2) if records else None,
+        'enqueue_max_us': round(enqueue_max_seconds * 1e6, 2),
+        'queued': _listener.queue.qsize() if _listener else 0,
+        'installed': _listener is not None
+    }
@@ -1,24 +1,53 @@
+import startup
+startup.enable_import_profile()
+
 import os
 import json
 import hashlib
 import hmac
 import time
-import threading
+import asyncio
 import logging
-import requests
 import traceback
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 #from dotenv import load_dotenv
-from llm_evaluator import evaluate_commitment
-from slack_helpers import post_message_with_button, post_thread_message, get_user_info, open_task_dialog
-from asana_client import create_asana_task
+from llm_evaluator import evaluate_commitments, evaluate_commitments_async
+from slack_helpers import (post_message_with_button, post_thread_message, get_user_info, open_task_dialog,
+                           post_message_with_button_async, post_thread_message_async, post_ephemeral_message)
+from asana_client import create_asana_task, create_asana_task_async
 from channel_map import get_asana_project_id
-import google.cloud.logging
-from utils import send_slack
+from utils import send_slack, get_error_webhook
+import event_queue
+import asana_users
+import http_client
+import rate_limiter
+import config_store
+import verdict_cache
+import prefilter
+import thread_batcher
+import job_queue
+import dedup_store
+import slack_users
+import alerts
+import log_pipeline
+import metrics
+import async_runtime
+import llm_dispatcher
+import llm_evaluator
+import commitment_store
+import modal_cache
+import project_search
+import project_catalog
+import asana_invariants
 
-# Inicializa el cliente de Cloud Logging
-logging_client = google.cloud.logging.Client(project='gothic-calling-325317')
-logging_client.setup_logging()
+def setup_cloud_logging():
+    # Inicializa el cliente de Cloud Logging
+    import google.cloud.logging
+    logging_client = google.cloud.logging.Client(project='gothic-calling-325317')
+    logging_client.setup_logging()
+    # Los handlers de Cloud Logging pasan a correr en un thread aparte
+    log_pipeline.install()
+    log_startup_info()
 
 
 #load_dotenv()
@@ -27,15 +56,47 @@ app = Flask(__name__)
 
 SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
 SLACK_SIGNING_SECRET = os.getenv('SLACK_SIGNING_SECRET')
+# Secreto compartido para los endpoints internos (/stats, /metrics, recargas y sincronizaciones),
+# que se manda en el header X-Admin-Token (o Authorization: Bearer). Sin ADMIN_TOKEN responden 404
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def log_startup_info():
+    logging.info("=== STARTING SLACK-ASANA INTEGRATION ===", extra=log_pipeline.fields(
+        bot_token_configured=bool(SLACK_BOT_TOKEN),
+        signing_secret_configured=bool(SLACK_SIGNING_SECRET)
+    ))
+
+# Todo lo que hace red corre en background para que gunicorn sirva el primer request enseguida
+# (CLOUD_LOGGING=0 lo desactiva, ej. para load_test.py). Lo que falla se reintenta con backoff.
+# Sólo la configuración frena el readiness: sin channel_map ni proyectos el modal no sirve. El resto
+# degrada sin cortar el servicio (logs a stderr, alertas sin webhook) o se resuelve en el primer uso
+if os.getenv('CLOUD_LOGGING', '1') != '0':
+    startup.run_in_background('cloud_logging', setup_cloud_logging, required=False)
+startup.run_in_background('error_webhook', get_error_webhook, required=False)
+startup.run_in_background('config', config_store.get_config)
+startup.run_in_background('project_search', project_search.get_index, required=False)
+
+# Sin Asana al arrancar el servicio igual puede recibir eventos: se resuelve en el primer uso
+startup.run_in_background('asana_invariants', asana_invariants.warm, required=False)
 
-logging.info(f"=== STARTING SLACK-ASANA INTEGRATION ===")
-logging.info(f"SLACK_BOT_TOKEN configured: {'Yes' if SLACK_BOT_TOKEN else 'No'}")
-logging.info(f"SLACK_SIGNING_SECRET configured: {'Yes' if SLACK_SIGNING_SECRET else 'No'}")
-logging.info(f"Bot token starts with: {SLACK_BOT_TOKEN[:10]}..." if SLACK_BOT_TOKEN else "No bot token")
-logging.info(f"="*40)
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Trace id del request; se propaga a los workers de las colas
+    g.trace_id = metrics.new_trace_id(request.headers.get('X-Cloud-Trace-Context'))
 
-# Cache para evitar procesar eventos duplicados
-processed_events = set()
+@app.after_request
+def record_ack_latency(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    metrics.observe('http_request_duration_seconds', elapsed, help_text='Duración de los requests HTTP entrantes',
+                    endpoint=request.endpoint or 'unknown', status=response.status_code)
+    # Tiempo que tarda Slack en recibir el 200 de /slack/events
+    if request.endpoint == 'slack_events':
+        event_queue.record_ack_latency(elapsed)
+    response.headers['X-Trace-Id'] = g.trace_id
+    return response
 
 @app.route('/')
 def home():
@@ -43,13 +104,116 @@ def home():
 
 @app.route('/health')
 def health():
+    # Liveness: si el proceso responde está vivo, aunque la inicialización en background no haya terminado
     return jsonify({
         'status': 'healthy', 
         'service': 'slack-asana-integration',
         'bot_token_configured': bool(SLACK_BOT_TOKEN),
-        'signing_secret_configured': bool(SLACK_SIGNING_SECRET)
+        'signing_secret_configured': bool(SLACK_SIGNING_SECRET),
+        'ready': startup.is_ready(),
+        'components': startup.get_components(),
+        **({'startup_profile': startup.get_profile()} if startup.STARTUP_PROFILE else {})
     })
 
+@app.route('/health/ready')
+def health_ready():
+    # Readiness: 503 hasta que terminen las inicializaciones requeridas (ver run_in_background)
+    ready = startup.is_ready()
+    return jsonify({'ready': ready, 'components': startup.get_components()}), 200 if ready else 503
+
+def _check_admin():
+    """Valida el X-Admin-Token de un endpoint interno. Devuelve None si es válido, o la respuesta de error"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    token = request.headers.get('X-Admin-Token', '')
+    # Prometheus sólo sabe mandar credenciales como "Authorization: Bearer ..."
+    authorization = request.headers.get('Authorization', '')
+    if not token and authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        logging.warning("Token de admin inválido", extra=log_pipeline.fields(endpoint=request.endpoint))
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+def get_all_stats():
+    return {
+        'event_queue': event_queue.get_stats(),
+        'asana_users': asana_users.get_stats(),
+        'http': http_client.get_stats(),
+        'rate_limits': rate_limiter.get_stats(),
+        'config': config_store.get_stats(),
+        'verdict_cache': verdict_cache.get_stats(),
+        'prefilter': prefilter.get_stats(),
+        'thread_batcher': thread_batcher.get_stats(),
+        'job_queue': job_queue.get_stats(),
+        'dedup': dedup_store.get_stats(),
+        'slack_users': slack_users.get_stats(),
+        'alerts': alerts.get_stats(),
+        'logging': log_pipeline.get_stats(),
+        'async_runtime': async_runtime.get_stats(),
+        'llm': llm_dispatcher.get_stats(),
+        'llm_usage': llm_evaluator.get_stats(),
+        'commitments': commitment_store.get_stats(),
+        'modal_cache': modal_cache.get_stats(),
+        'project_search': project_search.get_stats(),
+        'project_catalog': project_catalog.get_stats(),
+        'asana_invariants': asana_invariants.get_stats()
+    }
+
+@app.route('/stats')
+def stats():
+    # Expone claves de rate limit, hosts internos y contadores: sólo con el token de admin
+    rejection = _check_admin()
+    if rejection:
+        return rejection
+    return jsonify(get_all_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Mismos datos que /stats; el scraper manda el token (ej. authorization.credentials en Prometheus)
+    rejection = _check_admin()
+    if rejection:
+        return rejection
+    body = metrics.render() + metrics.render_gauges(get_all_stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/config/reload', methods=['POST'])
+def reload_config():
+    rejection = _check_admin()
+    if rejection:
+        return rejection
+    try:
+        config_store.reload()
+    except Exception as e:
+        logging.error("Error recargando configuración: %s", e)
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'ok', **config_store.get_stats()})
+
+@app.route('/projects/sync', methods=['POST'])
+def sync_projects():
+    rejection = _check_admin()
+    if rejection:
+        return rejection
+    try:
+        changes = project_catalog.sync()
+    except Exception as e:
+        logging.error("Error sincronizando el catálogo de proyectos: %s", e)
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'ok', 'changes': changes, **project_catalog.get_stats()})
+
+@app.route('/asana/refresh', methods=['POST'])
+def refresh_asana_invariants():
+    rejection = _check_admin()
+    if rejection:
+        return rejection
+    try:
+        asana_invariants.refresh()
+        asana_invariants.warm()
+    except Exception as e:
+        logging.error("Error refrescando las invariantes de Asana: %s", e)
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'ok', **asana_invariants.get_stats()})
+
 @app.route('/test', methods=['GET', 'POST'])
 def test():
     print(f"TEST endpoint hit - Method: {request.method}")
@@ -67,21 +231,110 @@ def verify_slack_signature(request_body, timestamp, signature):
     ).hexdigest()
     return hmac.compare_digest(request_hash, signature)
 
-def process_asana_task_creation(task_data):
-    """Procesa la creación de tarea en Asana en un thread separado"""
+def _verify_slack_request():
+    """Valida el timestamp y la firma de un request de Slack. Devuelve None si es válido, o la respuesta de error"""
+    timestamp = request.headers.get('X-Slack-Request-Timestamp', '')
+    signature = request.headers.get('X-Slack-Signature', '')
+    
+    # Slack manda segundos enteros; int() también rechaza 'nan' e 'inf'
     try:
-        # Usar el proyecto seleccionado por el usuario, o el del canal como fallback
-        asana_project_id = task_data.get('project_id')
-        if not asana_project_id:
-            asana_project_id = get_asana_project_id(task_data['channel'])
-        
-        # Obtener email del usuario seleccionado
-        user_info = get_user_info(task_data['selected_user_id'])
-        user_email = user_info.get('profile', {}).get('email')
-        user_name = user_info.get('real_name', user_info.get('name', 'Usuario'))
-        
-        print(f"Usuario seleccionado: {user_name} - Email: {user_email}")
-        print(f"Proyecto seleccionado: {asana_project_id}")
+        request_time = int(timestamp)
+    except ValueError:
+        logging.error("ERROR: Missing or invalid request timestamp")
+        return jsonify({'error': 'Missing or invalid request timestamp'}), 400
+    
+    if abs(time.time() - request_time) > 60 * 5:
+        logging.error("ERROR: Request timestamp too old")
+        send_slack("ERROR: Request timestamp too old", priority=alerts.PRIORITY_LOW)
+        return jsonify({'error': 'Request timestamp too old'}), 400
+    
+    with metrics.span('verify_signature'):
+        valid_signature = verify_slack_signature(request.get_data(as_text=True), timestamp, signature)
+    if not valid_signature:
+        logging.error("ERROR: Invalid signature")
+        send_slack("ERROR: Invalid signature", priority=alerts.PRIORITY_LOW)
+        return jsonify({'error': 'Invalid signature'}), 403
+    return None
+
+def process_asana_task_creation(task_data):
+    """Crea la tarea en Asana (corre en un worker de job_queue, que reintenta si falla)"""
+    metrics.set_trace_id(task_data.get('trace_id'))
+    with metrics.span('asana_task_creation'):
+        _create_task_and_confirm(task_data)
+    _observe_confirmation(task_data)
+
+async def process_asana_task_creation_async(task_data):
+    """Versión de process_asana_task_creation para EXECUTION_MODE=async"""
+    metrics.set_trace_id(task_data.get('trace_id'))
+    with metrics.span('asana_task_creation'):
+        await _create_task_and_confirm_async(task_data)
+    _observe_confirmation(task_data)
+
+def _observe_confirmation(task_data):
+    if task_data.get('submitted_at'):
+        metrics.observe('submission_to_confirmation_seconds', time.time() - task_data['submitted_at'],
+                        help_text='Desde el submit del modal hasta la confirmación en el hilo')
+
+def _resolve_task_user(task_data):
+    """(proyecto, email, nombre y gid de Asana del usuario asignado) para la tarea"""
+    # Usar el proyecto seleccionado por el usuario, o el del canal como fallback
+    asana_project_id = task_data.get('project_id')
+    if not asana_project_id:
+        asana_project_id = get_asana_project_id(task_data['channel'])
+    
+    # Obtener email del usuario seleccionado
+    user_info = get_user_info(task_data['selected_user_id'])
+    user_email = user_info.get('profile', {}).get('email')
+    user_name = user_info.get('real_name', user_info.get('name', 'Usuario'))
+    
+    # Sin llamadas de red si el usuario ya está en la tabla Slack→Asana
+    assignee_gid = slack_users.get_asana_gid(task_data['selected_user_id'])
+    
+    logging.info("Creando tarea en Asana", extra=log_pipeline.fields(
+        user_name=user_name,
+        assignee_gid=assignee_gid,
+        project_id=asana_project_id
+    ))
+    return asana_project_id, user_email, assignee_gid
+
+def _confirmation_text(task_data, task_result, user_email):
+    confirmation_text = f"✅ Tarea creada: '{task_data['title']}' → [ver en Asana]({task_result['url']})"
+    
+    if task_result['assignee_found']:
+        confirmation_text += f"\nAsignada a: <@{task_data['selected_user_id']}>"
+    else:
+        confirmation_text += f"\n⚠️ No se pudo asignar a <@{task_data['selected_user_id']}> (email no encontrado en Asana: {user_email})"
+    
+    if task_data['due_date']:
+        confirmation_text += f"\nFecha límite: {task_data['due_date']}"
+    
+    if task_result.get('subtasks_incomplete'):
+        confirmation_text += "\n⚠️ El proceso se interrumpió mientras se creaban las subtareas: revisá que estén todas"
+    
+    if task_result.get('subtask_failures'):
+        failed = ", ".join(f"'{name}'" for name in task_result['subtask_failures'])
+        confirmation_text += f"\n⚠️ No se pudieron crear estas subtareas: {failed}"
+    
+    return confirmation_text
+
+def _task_created(task_data, task_result, user_email):
+    """Registra la tarea apenas existe, antes de cualquier otro paso: si el job se reintenta
+    (falló la confirmación, venció el lease) no se vuelve a crear"""
+    job_queue.checkpoint(task_result=task_result, user_email=user_email)
+    commitment_store.mark_task_created(task_data.get('commitment_id'), task_result['gid'])
+
+def _existing_task(task_data):
+    """(resultado, email) de la tarea si ya se creó en un intento anterior del job, o (None, None)"""
+    task_result = task_data.get('task_result')
+    if task_result is not None:
+        logging.info("La tarea ya se había creado en un intento anterior, sólo falta confirmar",
+                     extra=log_pipeline.fields(task_gid=task_result['gid']))
+    return task_result, task_data.get('user_email')
+
+def _create_task_and_confirm(task_data):
+    task_result, user_email = _existing_task(task_data)
+    if task_result is None:
+        asana_project_id, user_email, assignee_gid = _resolve_task_user(task_data)
         
         # Crear tarea con título y descripción
         task_result = create_asana_task(
@@ -90,69 +343,150 @@ def process_asana_task_creation(task_data):
             project_id=asana_project_id,
             due_on=task_data['due_date'],
             description=task_data['description'],
-            subtasks=task_data['subtasks']
+            subtasks=task_data['subtasks'],
+            assignee_gid=assignee_gid,
+            on_created=lambda result: _task_created(task_data, result, user_email)
         )
-        
-        # Construir mensaje de confirmación
-        confirmation_text = f"✅ Tarea creada: '{task_data['title']}' → [ver en Asana]({task_result['url']})"
-        
-        if task_result['assignee_found']:
-            confirmation_text += f"\nAsignada a: <@{task_data['selected_user_id']}>"
-        else:
-            confirmation_text += f"\n⚠️ No se pudo asignar a <@{task_data['selected_user_id']}> (email no encontrado en Asana: {user_email})"
-        
-        if task_data['due_date']:
-            confirmation_text += f"\nFecha límite: {task_data['due_date']}"
-        
+        _task_created(task_data, task_result, user_email)
+    
+    if not task_data.get('confirmed'):
         post_thread_message(
             channel=task_data['channel'],
             thread_ts=task_data['thread_ts'],
-            text=confirmation_text
+            text=_confirmation_text(task_data, task_result, user_email)
         )
+        job_queue.checkpoint(confirmed=True)
+
+async def _create_task_and_confirm_async(task_data):
+    task_result, user_email = _existing_task(task_data)
+    if task_result is None:
+        # Los perfiles salen de caches sync que casi nunca hacen red: se resuelven en un thread
+        asana_project_id, user_email, assignee_gid = await asyncio.to_thread(_resolve_task_user, task_data)
         
-    except Exception as e:
-        logging.error(f"Error creando tarea: {str(e)}")
-        logging.exception("Exception details:")
-        post_thread_message(
+        task_result = await create_asana_task_async(
+            name=task_data['title'],
+            assignee_email=user_email,
+            project_id=asana_project_id,
+            due_on=task_data['due_date'],
+            description=task_data['description'],
+            subtasks=task_data['subtasks'],
+            assignee_gid=assignee_gid,
+            on_created=lambda result: _task_created(task_data, result, user_email)
+        )
+        await asyncio.to_thread(_task_created, task_data, task_result, user_email)
+    
+    if not task_data.get('confirmed'):
+        await post_thread_message_async(
             channel=task_data['channel'],
             thread_ts=task_data['thread_ts'],
-            text=f"❌ Error al crear la tarea: {str(e)}"
+            text=_confirmation_text(task_data, task_result, user_email)
+        )
+        await asyncio.to_thread(job_queue.checkpoint, confirmed=True)
+
+def notify_task_failure(task_data, error):
+    """Avisa en el hilo cuando la creación de la tarea agotó los reintentos"""
+    logging.error("Error creando tarea: %s", error)
+    post_thread_message(
+        channel=task_data['channel'],
+        thread_ts=task_data['thread_ts'],
+        text=f"❌ Error al crear la tarea: {str(error)}"
+    )
+    send_slack(f"Error creando tarea: {str(error)}", priority=alerts.PRIORITY_HIGH)
+
+# EXECUTION_MODE=async: los jobs y los eventos corren como corrutinas en el loop de async_runtime
+job_queue.register(
+    'create_asana_task',
+    process_asana_task_creation_async if async_runtime.is_async() else process_asana_task_creation,
+    on_dead=notify_task_failure
+)
+job_queue.start_workers()
+slack_users.start_background_refresh()
+project_catalog.start_background_sync()
+
+def _commitments_to_offer(events, verdicts):
+    """(evento, compromiso) por cada botón a publicar"""
+    # Evitar varios botones para el mismo compromiso repetido en el hilo
+    offered = set()
+    for event, commitment_data in zip(events, verdicts):
+        if not (commitment_data and commitment_data.get('es_compromiso')):
+            continue
+        
+        commitment_key = (
+            event.get('thread_ts', event['ts']),
+            str(commitment_data.get('asignado_a', '')).strip().lower(),
+            str(commitment_data.get('descripcion', '')).strip().lower()
+        )
+        if commitment_key in offered:
+            continue
+        offered.add(commitment_key)
+        yield event, commitment_data
+
+def _observe_button(event):
+    if event.get('_received_at'):
+        metrics.observe('event_to_button_seconds', time.time() - event['_received_at'],
+                        help_text='Desde que llega el evento de Slack hasta que se publica el botón')
+
+def handle_message_batch(events):
+    """Evalúa los mensajes de un hilo (o del canal) con un solo request al LLM y ofrece crear las tareas (corre en un worker de la cola)"""
+    verdicts = evaluate_commitments([event['text'] for event in events])
+    
+    for event, commitment_data in _commitments_to_offer(events, verdicts):
+        thread_ts = event.get('thread_ts', event['ts'])
+        commitment = commitment_store.save(event['channel'], thread_ts, event['ts'], event['text'], commitment_data)
+        # La vista del modal queda lista antes de que alguien pueda hacer click
+        modal_cache.prepare(commitment)
+        post_message_with_button(channel=event['channel'], thread_ts=thread_ts,
+                                 commitment_ref=commitment_store.reference(commitment))
+        _observe_button(event)
+
+async def handle_message_batch_async(events):
+    """Versión de handle_message_batch para EXECUTION_MODE=async"""
+    verdicts = await evaluate_commitments_async([event['text'] for event in events])
+    
+    for event, commitment_data in _commitments_to_offer(events, verdicts):
+        thread_ts = event.get('thread_ts', event['ts'])
+        commitment = await asyncio.to_thread(
+            commitment_store.save, event['channel'], thread_ts, event['ts'], event['text'], commitment_data
         )
-        send_slack(f"Error creando tarea: {str(e)}")
+        await asyncio.to_thread(modal_cache.prepare, commitment)
+        await post_message_with_button_async(channel=event['channel'], thread_ts=thread_ts,
+                                             commitment_ref=commitment_store.reference(commitment))
+        _observe_button(event)
+
+MESSAGE_BATCH_HANDLER = handle_message_batch_async if async_runtime.is_async() else handle_message_batch
 
 @app.route('/slack/events', methods=['POST'])
 def slack_events():
-    logging.info("=== SLACK EVENTS ENDPOINT HIT ===")
-    logging.info(f"Headers: {dict(request.headers)}")
-    logging.info(f"Content-Type: {request.content_type}")
+    logging.info("Slack event received", extra=log_pipeline.fields(
+        headers=log_pipeline.redact_headers(request.headers),
+        content_type=request.content_type
+    ))
     
     if request.content_type != 'application/json':
-        logging.error(f"ERROR: Invalid content type: {request.content_type}")
-        send_slack(f"ERROR: Invalid content type: {request.content_type}")
+        logging.error("ERROR: Invalid content type: %s", request.content_type)
+        send_slack(f"ERROR: Invalid content type: {request.content_type}", priority=alerts.PRIORITY_LOW)
         return jsonify({'error': 'Content-Type must be application/json'}), 400
     
-    timestamp = request.headers.get('X-Slack-Request-Timestamp', '')
-    signature = request.headers.get('X-Slack-Signature', '')
-    
-    if abs(time.time() - float(timestamp)) > 60 * 5:
-        logging.error("ERROR: Request timestamp too old")
-        send_slack("ERROR: Request timestamp too old")
-        return jsonify({'error': 'Request timestamp too old'}), 400
-    
-    # Obtener el body raw para verificación
-    request_body = request.get_data(as_text=True)
+    rejection = _verify_slack_request()
+    if rejection:
+        return rejection
     
-    if not verify_slack_signature(request_body, timestamp, signature):
-        logging.error("ERROR: Invalid signature")
-        send_slack("ERROR: Invalid signature")
-        return jsonify({'error': 'Invalid signature'}), 403
+    # Un reintento de Slack significa que el evento original ya llegó: no volver a procesarlo
+    if request.headers.get('X-Slack-Retry-Num'):
+        dedup_store.record_retry_short_circuit()
+        logging.info("Reintento de Slack ignorado", extra=log_pipeline.fields(
+            retry_num=request.headers.get('X-Slack-Retry-Num'),
+            retry_reason=request.headers.get('X-Slack-Retry-Reason')
+        ))
+        return jsonify({'status': 'ok'}), 200, {'X-Slack-No-Retry': '1'}
     
     # Parsear el JSON después de verificar la firma
     try:
-        data = json.loads(request_body)
+        with metrics.span('parse_json'):
+            data = json.loads(request.get_data(as_text=True))
     except json.JSONDecodeError:
         logging.error("ERROR: Invalid JSON")
-        send_slack("ERROR: Invalid JSON")
+        send_slack("ERROR: Invalid JSON", priority=alerts.PRIORITY_LOW)
         return jsonify({'error': 'Invalid JSON'}), 400
     
     if data.get('type') == 'url_verification':
@@ -162,15 +496,14 @@ def slack_events():
         event = data['event']
         event_id = data.get('event_id')
         
-        # Evitar procesar eventos duplicados
-        if event_id in processed_events:
+        # Evitar procesar eventos duplicados (también entre procesos/instancias según DEDUP_BACKEND)
+        if dedup_store.is_duplicate(event_id):
             return jsonify({'status': 'ok'})
         
-        processed_events.add(event_id)
-        
-        # Limpiar cache después de 1000 eventos
-        if len(processed_events) > 1000:
-            processed_events.clear()
+        # Mantener el cache de perfiles al día
+        if event.get('type') in ('user_change', 'team_join'):
+            slack_users.handle_event(event)
+            return jsonify({'status': 'ok'})
         
         if (event.get('type') == 'message' and 
             not event.get('bot_id') and 
@@ -178,78 +511,77 @@ def slack_events():
             
             text = event['text']
             
-            if '@' in text:
-                commitment_data = evaluate_commitment(text)
-                
-                if commitment_data and commitment_data.get('es_compromiso'):
-                    channel = event['channel']
-                    thread_ts = event.get('thread_ts', event['ts'])
-                    
-                    post_message_with_button(
-                        channel=channel,
-                        thread_ts=thread_ts,
-                        original_message=text,
-                        commitment_data=commitment_data,
-                        message_ts=event['ts']
-                    )
+            # Prefiltro local: sólo los mensajes con chances de ser compromiso llegan al LLM
+            if '@' in text and prefilter.should_evaluate(text):
+                # La evaluación con el LLM corre en background para responder a Slack en < 3s,
+                # agrupando los mensajes del mismo hilo o canal en un solo request
+                event['_received_at'] = time.time()
+                thread_batcher.add(event, MESSAGE_BATCH_HANDLER)
     
     return jsonify({'status': 'ok'})
 
 @app.route('/slack/interactions', methods=['POST'])
 def slack_interactions():
-    logging.info("=== INTERACTION ENDPOINT HIT ===")
-    timestamp = request.headers.get('X-Slack-Request-Timestamp', '')
-    signature = request.headers.get('X-Slack-Signature', '')
-    
-    if abs(time.time() - float(timestamp)) > 60 * 5:
-        logging.error("ERROR: Request timestamp too old")
-        return jsonify({'error': 'Request timestamp too old'}), 400
-    
-    if not verify_slack_signature(request.get_data(as_text=True), timestamp, signature):
-        logging.error("ERROR: Invalid signature")
-        send_slack("ERROR: Invalid signature")
-        return jsonify({'error': 'Invalid signature'}), 403
+    logging.info("Slack interaction received")
+    rejection = _verify_slack_request()
+    if rejection:
+        return rejection
     
     payload = json.loads(request.form.get('payload'))
-    logging.info(f"Received interaction type: {payload.get('type')}")
-    logging.info(f"Full payload: {json.dumps(payload, separators=(',', ':'))}")
+    logging.info("Interaction payload", extra=log_pipeline.fields(
+        interaction_type=payload.get('type'),
+        **log_pipeline.payload_for_log(payload)
+    ))
     
     if payload['type'] == 'interactive_message':
         action = payload['actions'][0]
         
         if action['name'] == 'create_asana_task':
-            print("=== BUTTON CLICKED: create_asana_task ===")
-            action_value = json.loads(action['value'])
-            commitment_data = action_value['commitment_data']
+            commitment = commitment_store.resolve(action['value'])
             channel = payload['channel']['id']
-            thread_ts = action_value.get('thread_ts')
             trigger_id = payload['trigger_id']
+            if commitment is None:
+                logging.error("Compromiso no encontrado para el botón: %s", action['value'])
+                send_slack(f"Compromiso no encontrado para el botón: {action['value']}")
+                # Sólo pasa con botones que llevan el ID solo (anteriores a commitment_store.reference)
+                try:
+                    post_ephemeral_message(channel, payload['user']['id'],
+                                           "⚠️ No encontré este compromiso: el botón es de una versión anterior. "
+                                           "Creá la tarea directamente en Asana.")
+                except Exception as e:
+                    logging.error("No se pudo avisar que el compromiso no existe: %s", e)
+                return '', 200
+            thread_ts = commitment.get('thread_ts')
             
-            logging.info(f"Channel: {channel}")
-            logging.info(f"Thread TS: {thread_ts}")
-            logging.info(f"Trigger ID: {trigger_id}")
-            logging.info(f"Commitment data: {commitment_data}")
+            logging.info("Button clicked: create_asana_task", extra=log_pipeline.fields(
+                channel=channel,
+                thread_ts=thread_ts
+            ))
             
             # Abrir el diálogo modal
             try:
-                logging.info("Attempting to open dialog...")
-                result = open_task_dialog(
-                    trigger_id=trigger_id,
-                    commitment_data=commitment_data,
-                    original_message=action_value['original_message'],
-                    channel=channel,
-                    thread_ts=thread_ts
-                )
-                logging.info(f"Dialog open result: {result}")
+                if commitment['id']:
+                    # Vista precalculada al publicar el botón: sólo falta el trigger_id
+                    result = modal_cache.open_modal(trigger_id, commitment)
+                else:
+                    # Botón publicado antes de commitment_store: se arma la vista en el momento
+                    result = open_task_dialog(
+                        trigger_id=trigger_id,
+                        commitment_data=commitment['commitment_data'],
+                        original_message=commitment['original_message'],
+                        channel=channel,
+                        thread_ts=thread_ts
+                    )
+                metrics.observe('click_to_modal_seconds', time.perf_counter() - g.request_start,
+                                help_text='Desde que llega el click del botón hasta que responde views.open',
+                                source='precomputed' if commitment['id'] else 'legacy')
                 if not result.get('ok'):
-                    logging.error(f"Error opening dialog: {result}")
-                    logging.error(f"Error details: {result.get('error', 'No error details')}")
+                    logging.error("Error opening dialog: %s", result.get('error', 'No error details'))
                 else:
-                    logging.info("Dialog opened successfully!")
+                    logging.info("Dialog opened successfully")
                 
             except Exception as e:
-                logging.error(f"Exception opening dialog: {str(e)}")
-                logging.exception("Exception details:")
+                logging.exception("Exception opening dialog: %s", e)
                 send_slack(f"Exception opening dialog: {str(e)}")
                 #print(f"Traceback: {traceback.format_exc()}")
             
@@ -265,7 +597,17 @@ def slack_interactions():
         view = payload['view']
         
         if view['callback_id'] == 'create_asana_task_modal':
-            metadata = json.loads(view['private_metadata'])
+            metadata = commitment_store.resolve(view['private_metadata'])
+            if metadata is None:
+                logging.error("Compromiso no encontrado para el modal: %s", view['private_metadata'])
+                send_slack(f"Compromiso no encontrado para el modal: {view['private_metadata']}")
+                # Dejar el modal abierto con el error en vez de cerrarlo como si la tarea se fuera a crear
+                return jsonify({
+                    'response_action': 'errors',
+                    'errors': {
+                        'title_block': "No encontré el hilo de este compromiso: creá la tarea directamente en Asana"
+                    }
+                })
             
             # Obtener TODOS los valores del formulario
             values = view['state']['values']
@@ -279,18 +621,42 @@ def slack_interactions():
                 'title': values['title_block']['title_input']['value'],
                 'description': values['description_block']['description_input']['value'],
                 'subtasks': values['subtasks_block']['subtasks_input']['value'] if values['subtasks_block']['subtasks_input'].get('value') else None,
-                'project_id': values['project_block']['project_select']['selected_option']['value']
+                'project_id': values['project_block']['project_select']['selected_option']['value'],
+                'commitment_id': metadata.get('id'),
+                'submitted_at': time.time(),
+                'trace_id': metrics.get_trace_id()
             }
             
-            # Iniciar thread para procesar la tarea
-            thread = threading.Thread(target=process_asana_task_creation, args=(task_data,))
-            thread.daemon = True
-            thread.start()
+            # El proyecto elegido sube en el selector para la próxima vez
+            project_search.record_use(task_data['project_id'], task_data['channel'])
+            
+            # Encolar la creación de la tarea; la clave evita duplicados si Slack reenvía el submit
+            job_queue.enqueue('create_asana_task', task_data, idempotency_key=f"view:{view['id']}")
             
             # Responder inmediatamente a Slack para cerrar el modal
             return '', 200
     
     return jsonify({'status': 'ok'})
 
+@app.route('/slack/options', methods=['POST'])
+def slack_options():
+    """Opciones del selector de proyectos del modal (external_select). Slack espera la respuesta en menos de 3s"""
+    rejection = _verify_slack_request()
+    if rejection:
+        return rejection
+    
+    payload = json.loads(request.form.get('payload'))
+    if payload.get('type') != 'block_suggestion' or payload.get('action_id') != 'project_select':
+        return jsonify({'options': []})
+    
+    # El canal del compromiso define qué proyectos van primero
+    metadata = payload.get('view', {}).get('private_metadata')
+    commitment = commitment_store.resolve(metadata) if metadata else None
+    channel = commitment.get('channel') if commitment else None
+    
+    return jsonify({'options': project_search.search(payload.get('value', ''), channel)})
+
 #if __name__ == '__main__':
-#    app.run(debug=True, port=5000)
\ No newline at end of file
+#    app.run(debug=True, port=5000)
+
+startup.mark_app_loaded()
@@ -0,0 +1,133 @@
+import re
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+METRIC_PREFIX = 'tracker_'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+# (nombre, labels) → [contadores por bucket..., suma, cantidad]
+_histograms = {}
+# (nombre, labels) → valor
+_counters = {}
+_help = {}
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+def new_trace_id(incoming=None):
+    """Fija el trace id del request actual. Reusa el de Cloud Run (X-Cloud-Trace-Context) si viene"""
+    trace_id = incoming.split('/')[0] if incoming else uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    return trace_id
+
+def get_trace_id():
+    return _trace_id.get()
+
+def set_trace_id(trace_id):
+    """Para los threads de background: continúa el trace del request que originó el trabajo"""
+    _trace_id.set(trace_id)
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def observe(name, seconds, help_text=None, **labels):
+    key = (name, _labels_key(labels))
+    with _lock:
+        if help_text:
+            _help.setdefault(name, help_text)
+        values = _histograms.get(key)
+        if values is None:
+            values = [0] * len(DEFAULT_BUCKETS) + [0.0, 0]
+            _histograms[key] = values
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+def inc(name, value=1, help_text=None, **labels):
+    key = (name, _labels_key(labels))
+    with _lock:
+        if help_text:
+            _help.setdefault(name, help_text)
+        _counters[key] = _counters.get(key, 0) + value
+
+@contextmanager
+def span(stage, **labels):
+    """Mide la duración de una etapa del hot path en stage_duration_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('stage_errors_total', help_text='Etapas que terminaron con excepción', stage=stage, **labels)
+        raise
+    finally:
+        observe('stage_duration_seconds', time.perf_counter() - start,
+                help_text='Duración de cada etapa del procesamiento', stage=stage, **labels)
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in items)
+    return '{' + ','.join(escaped) + '}'
+
+def _metric_name(name):
+    return METRIC_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def render():
+    """Histogramas y contadores en formato de texto de Prometheus"""
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        counters = dict(_counters)
+        help_texts = dict(_help)
+
+    lines = []
+    for name in sorted({name for name, _ in histograms}):
+        metric = _metric_name(name)
+        if name in help_texts:
+            lines.append(f"# HELP {metric} {help_texts[name]}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (hist_name, labels), values in sorted(histograms.items()):
+            if hist_name != name:
+                continue
+            for bound, count in zip(DEFAULT_BUCKETS, values):
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {values[-1]}")
+
+    for name in sorted({name for name, _ in counters}):
+        metric = _metric_name(name)
+        if name in help_texts:
+            lines.append(f"# HELP {metric} {help_texts[name]}")
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    return '\n'.join(lines) + '\n'
+
+def _flatten(prefix, value, out):
+    if isinstance(value, bool):
+        out[prefix] = int(value)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}_{key}", item, out)
+
+def render_gauges(stats):
+    """Los valores numéricos de /stats como gauges (ej. tracker_event_queue_queue_depth)"""
+    flat = {}
+    for section, values in stats.items():
+        _flatten(section, values, flat)
+    lines = []
+    for name, value in sorted(flat.items()):
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
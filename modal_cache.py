@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+import commitment_store
+from config_store import get_config
+from slack_helpers import build_task_view, open_view
+
+# Vistas del modal ya serializadas, por compromiso (un compromiso = un canal + mensaje)
+MODAL_CACHE_SIZE = int(os.getenv('MODAL_CACHE_SIZE', '5000'))
+
+_lock = threading.Lock()
+# commitment_id → (versión de config_store con la que se armó, JSON de la vista)
+_views = OrderedDict()
+_counters = {
+    'prepared': 0,
+    'hits': 0,
+    'misses': 0,
+    'stale': 0
+}
+
+def _build(commitment):
+    config = get_config()
+    view = build_task_view(
+        commitment['commitment_data'],
+        commitment['original_message'],
+        commitment['channel'],
+        commitment['thread_ts'],
+        commitment_store.reference(commitment),
+        config=config
+    )
+    return config.version, json.dumps(view)
+
+def _remember(commitment_id, entry):
+    with _lock:
+        _views[commitment_id] = entry
+        _views.move_to_end(commitment_id)
+        while len(_views) > MODAL_CACHE_SIZE:
+            _views.popitem(last=False)
+
+def prepare(commitment):
+    """Arma y guarda la vista del modal al publicar el botón, para que el click sólo tenga que enviarla"""
+    try:
+        _remember(commitment['id'], _build(commitment))
+    except Exception as e:
+        # Sin vista precalculada el click la arma en el momento
+        logging.warning("No se pudo precalcular el modal de %s: %s", commitment['id'], e)
+        return
+    with _lock:
+        _counters['prepared'] += 1
+
+def get_view_json(commitment):
+    """JSON de la vista para el compromiso: la precalculada si sigue vigente, si no se arma y se guarda"""
+    version = get_config().version
+    with _lock:
+        entry = _views.get(commitment['id'])
+        if entry is not None and entry[0] == version:
+            _views.move_to_end(commitment['id'])
+            _counters['hits'] += 1
+            return entry[1]
+        # Cambió la configuración (proyectos o mapeo de canales): la vista guardada ya no sirve
+        _counters['stale' if entry is not None else 'misses'] += 1
+
+    entry = _build(commitment)
+    _remember(commitment['id'], entry)
+    return entry[1]
+
+def open_modal(trigger_id, commitment):
+    """Abre el modal del compromiso: sólo agrega el trigger_id a la vista precalculada"""
+    return open_view(trigger_id, get_view_json(commitment))
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+        size = len(_views)
+    lookups = counters['hits'] + counters['misses'] + counters['stale']
+    return {
+        **counters,
+        'size': size,
+        'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None
+    }
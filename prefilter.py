@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+
+# Sólo los mensajes con score >= PREFILTER_THRESHOLD se mandan al LLM
+PREFILTER_THRESHOLD = float(os.getenv('PREFILTER_THRESHOLD', '0.5'))
+# En modo shadow se calcula el score pero no se descarta nada (sirve para juntar veredictos).
+# Queda prendido por defecto hasta tener pesos validados con evaluate_prefilter.py
+PREFILTER_SHADOW = os.getenv('PREFILTER_SHADOW', '1').lower() in ('1', 'true', 'yes')
+# JSON opcional con un modelo lineal entrenado: {"bias": float, "weights": {feature: float}}
+PREFILTER_MODEL_PATH = os.getenv('PREFILTER_MODEL_PATH')
+
+MENTION_RE = re.compile(r'<@[UW][A-Z0-9]+(?:\|[^>]+)?>|@\w+')
+COMMITMENT_RE = re.compile(
+    r'\b(me encargo|me ocupo|se encarga|lo (hago|veo|reviso|armo|mando|paso|subo|resuelvo|preparo|termino|'
+    r'cierro|arreglo|miro|chequeo)|yo (me|lo|la|te)|voy a|vamos a|te paso|te mando|te env[ií]o|te lo|'
+    r'queda a cargo|qued[aá]s a cargo|me comprometo|dejame que)\b',
+    re.IGNORECASE
+)
+REQUEST_RE = re.compile(
+    r'\b(pod[eé]s|podr[ií]as|necesit\w*|encarg\w*|ocup[aá]\w*|hac[eé]\w*|mand[aá]\w*|pas[aá]\w*|'
+    r'revis\w*|arm[aá]\w*|prepar\w*|sub[ií]\w*|fijate|ser[ií]a bueno que|hay que)\b',
+    re.IGNORECASE
+)
+DEADLINE_RE = re.compile(
+    r'\b(para el (lunes|martes|mi[eé]rcoles|jueves|viernes|s[aá]bado|domingo)|para ma[ñn]ana|para hoy|'
+    r'hoy|ma[ñn]ana|esta semana|la semana que viene|antes del?|cuando puedas|asap|fin de mes|'
+    r'(el )?(lunes|martes|mi[eé]rcoles|jueves|viernes))\b',
+    re.IGNORECASE
+)
+DATE_RE = re.compile(r'\b\d{1,2}[/-]\d{1,2}([/-]\d{2,4})?\b|\b\d{1,2} de [a-z]+\b', re.IGNORECASE)
+ACK_ONLY_RE = re.compile(
+    r'^\W*(gracias|genial|ok|oka|dale|joya|buen[ií]simo|perfecto|jaja\w*|listo|de nada)\W*$',
+    re.IGNORECASE
+)
+
+DEFAULT_MODEL = {
+    'bias': -2.0,
+    'weights': {
+        'has_mention': 1.0,
+        'mention_first': 0.5,
+        'commitment_verb': 2.0,
+        'request_verb': 1.5,
+        'deadline': 1.5,
+        'date': 1.0,
+        'short': -1.5,
+        'ack_only': -3.0
+    }
+}
+
+_lock = threading.Lock()
+_model = None
+_counters = {
+    'evaluated': 0,
+    'passed': 0,
+    'llm_calls_avoided': 0,
+    'shadow_would_skip': 0
+}
+
+def _get_model():
+    global _model
+    if _model is None:
+        model = DEFAULT_MODEL
+        if PREFILTER_MODEL_PATH:
+            try:
+                with open(PREFILTER_MODEL_PATH, 'r', encoding='utf-8') as f:
+                    model = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error("No se pudo cargar el modelo del prefiltro, se usan los pesos por defecto: %s", e)
+        _model = model
+    return _model
+
+def extract_features(text):
+    without_mentions = MENTION_RE.sub('', text).strip()
+    commitment = COMMITMENT_RE.search(text)
+    request = REQUEST_RE.search(text)
+    return {
+        'has_mention': 1.0 if MENTION_RE.search(text) else 0.0,
+        'mention_first': 1.0 if MENTION_RE.match(text.strip()) else 0.0,
+        'commitment_verb': 1.0 if commitment else 0.0,
+        'request_verb': 1.0 if request else 0.0,
+        'deadline': 1.0 if DEADLINE_RE.search(text) else 0.0,
+        'date': 1.0 if DATE_RE.search(text) else 0.0,
+        # Sólo penaliza lo corto sin verbo: "Lo subo hoy" es corto pero es un compromiso
+        'short': 1.0 if len(without_mentions) < 20 and not (commitment or request) else 0.0,
+        'ack_only': 1.0 if ACK_ONLY_RE.match(without_mentions) else 0.0
+    }
+
+def score(text, model=None):
+    """Probabilidad (0-1) de que el mensaje sea un compromiso, sin llamadas de red"""
+    model = model or _get_model()
+    weights = model['weights']
+    z = model['bias'] + sum(weights.get(name, 0.0) * value for name, value in extract_features(text).items())
+    return 1.0 / (1.0 + math.exp(-z))
+
+def should_evaluate(text):
+    """True si el mensaje tiene que pasar por el LLM"""
+    passed = score(text) >= PREFILTER_THRESHOLD
+    with _lock:
+        _counters['evaluated'] += 1
+        if passed:
+            _counters['passed'] += 1
+        elif PREFILTER_SHADOW:
+            _counters['shadow_would_skip'] += 1
+        else:
+            _counters['llm_calls_avoided'] += 1
+    return passed or PREFILTER_SHADOW
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        'threshold': PREFILTER_THRESHOLD,
+        'shadow': PREFILTER_SHADOW,
+        'custom_model': bool(PREFILTER_MODEL_PATH)
+    }
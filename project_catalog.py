@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import http_client
+import metrics
+import log_pipeline
+import config_store
+
+ASANA_PAT = os.getenv('ASANA_PERSONAL_ACCESS_TOKEN')
+
+# Cada cuántos segundos se sincroniza el catálogo de proyectos de Asana (0 desactiva: se usa asana_pj.json)
+PROJECT_CATALOG_SYNC_INTERVAL = int(os.getenv('PROJECT_CATALOG_SYNC_INTERVAL', '600'))
+# Snapshot local del catálogo para arrancar sin esperar a Asana
+PROJECT_CATALOG_SNAPSHOT = os.getenv('PROJECT_CATALOG_SNAPSHOT',
+                                     os.path.join(tempfile.gettempdir(), 'tracker_projects.json'))
+PROJECT_CATALOG_PAGE_SIZE = 100
+
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+# gid → (nombre, modified_at), sólo proyectos no archivados
+_projects = {}
+_synced_at = None
+_syncer = None
+_counters = {
+    'syncs': 0,
+    'sync_errors': 0,
+    'snapshot_loads': 0,
+    'pages': 0,
+    'added': 0,
+    'renamed': 0,
+    'removed': 0,
+    'last_sync_ms': None
+}
+
+def _fetch_projects():
+    """Todos los proyectos del workspace (archivados incluidos) con los campos mínimos, paginando"""
+    from asana_client import get_workspace_gid
+
+    headers = {
+        'Authorization': f'Bearer {ASANA_PAT}'
+    }
+    params = {
+        'workspace': get_workspace_gid(),
+        'opt_fields': 'name,archived,modified_at',
+        'limit': PROJECT_CATALOG_PAGE_SIZE
+    }
+
+    projects = []
+    pages = 0
+    while True:
+        response = http_client.get(
+            f'{http_client.ASANA_API_URL}/projects',
+            headers=headers,
+            params=params
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error listing Asana projects: {response.status_code} - {response.text}")
+
+        body = response.json()
+        projects.extend(body['data'])
+        pages += 1
+
+        next_page = body.get('next_page')
+        if not next_page or not next_page.get('offset'):
+            break
+        params['offset'] = next_page['offset']
+
+    return projects, pages
+
+def diff(current, fetched):
+    """(agregados, renombrados, quitados) entre el catálogo actual y los proyectos traídos de Asana.
+    Un proyecto archivado o que ya no aparece se quita"""
+    active = {
+        project['gid']: (project['name'], project.get('modified_at'))
+        for project in fetched
+        if not project.get('archived') and project.get('name')
+    }
+    added = {gid: entry for gid, entry in active.items() if gid not in current}
+    renamed = {gid: entry for gid, entry in active.items() if gid in current and current[gid][0] != entry[0]}
+    removed = [gid for gid in current if gid not in active]
+    return active, added, renamed, removed
+
+def _publish(projects):
+    """Swap del snapshot de config_store y del índice de búsqueda; los lectores no esperan"""
+    import project_search
+
+    config_store.set_projects({gid: name for gid, (name, _) in projects.items()})
+    # Armar el índice acá y no en el primer pedido de opciones
+    project_search.get_index()
+
+def _load_snapshot():
+    try:
+        with open(PROJECT_CATALOG_SNAPSHOT, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        return snapshot['synced_at'], {gid: tuple(entry) for gid, entry in snapshot['projects'].items()}
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logging.warning("Snapshot del catálogo de proyectos inválido, se ignora: %s", e)
+        return None
+
+def _save_snapshot(projects, synced_at):
+    tmp_path = PROJECT_CATALOG_SNAPSHOT + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'synced_at': synced_at, 'projects': projects}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, PROJECT_CATALOG_SNAPSHOT)
+    except OSError as e:
+        logging.warning("No se pudo guardar el snapshot del catálogo de proyectos: %s", e)
+
+def load_snapshot():
+    """Publica el catálogo guardado en disco, si hay. Devuelve True si se cargó"""
+    global _projects, _synced_at
+    snapshot = _load_snapshot()
+    if not snapshot or not snapshot[1]:
+        return False
+    with _lock:
+        _synced_at, _projects = snapshot
+        _counters['snapshot_loads'] += 1
+    _publish(snapshot[1])
+    logging.info("Catálogo de proyectos cargado del snapshot: %s proyectos", len(snapshot[1]))
+    return True
+
+def sync():
+    """Trae los proyectos de Asana y aplica sólo las diferencias. Devuelve la cantidad de cambios"""
+    global _projects, _synced_at
+    # Una sola sincronización a la vez (background y /projects/sync)
+    with _sync_lock:
+        start = time.perf_counter()
+        try:
+            fetched, pages = _fetch_projects()
+            active, added, renamed, removed = diff(_projects, fetched)
+            if not active and (_projects or config_store.get_stats()['projects']):
+                # Una respuesta vacía es más probablemente un error que un workspace sin proyectos:
+                # no pisar el catálogo anterior ni, en frío y sin snapshot, los proyectos de asana_pj.json
+                raise Exception("Asana no devolvió proyectos activos, se mantiene el catálogo anterior")
+        except Exception:
+            with _lock:
+                _counters['sync_errors'] += 1
+            metrics.inc('project_catalog_sync_errors_total', help_text='Sincronizaciones del catálogo de proyectos que fallaron')
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('project_catalog_sync_seconds', elapsed,
+                            help_text='Duración de la sincronización del catálogo de proyectos de Asana')
+
+        changes = len(added) + len(renamed) + len(removed)
+        synced_at = time.time()
+        with _lock:
+            # modified_at se actualiza siempre; el snapshot de config_store sólo si cambió algo visible
+            _projects = active
+            _synced_at = synced_at
+            _counters['syncs'] += 1
+            _counters['pages'] += pages
+            _counters['added'] += len(added)
+            _counters['renamed'] += len(renamed)
+            _counters['removed'] += len(removed)
+            _counters['last_sync_ms'] = round(elapsed * 1000, 1)
+        for kind, count in (('added', len(added)), ('renamed', len(renamed)), ('removed', len(removed))):
+            if count:
+                metrics.inc('project_catalog_changes_total', count, help_text='Cambios aplicados al catálogo de proyectos',
+                            kind=kind)
+
+        if changes or config_store.get_stats()['project_source'] != 'catalog':
+            _publish(active)
+        _save_snapshot(active, synced_at)
+        logging.info("Catálogo de proyectos sincronizado", extra=log_pipeline.fields(
+            projects=len(active),
+            added=len(added),
+            renamed=len(renamed),
+            removed=len(removed),
+            pages=pages,
+            sync_ms=round(elapsed * 1000, 1)
+        ))
+        return changes
+
+def _sync_loop():
+    try:
+        load_snapshot()
+    except Exception as e:
+        logging.error("Error cargando el snapshot del catálogo de proyectos: %s", e)
+    while True:
+        try:
+            sync()
+        except Exception as e:
+            logging.error("Error sincronizando el catálogo de proyectos: %s", e)
+        time.sleep(PROJECT_CATALOG_SYNC_INTERVAL)
+
+def start_background_sync():
+    """Publica el snapshot en disco al arrancar y sincroniza con Asana cada PROJECT_CATALOG_SYNC_INTERVAL"""
+    global _syncer
+    if PROJECT_CATALOG_SYNC_INTERVAL <= 0 or not ASANA_PAT:
+        return
+    with _lock:
+        if _syncer:
+            return
+        _syncer = threading.Thread(target=_sync_loop, name='project-catalog-sync', daemon=True)
+        _syncer.start()
+
+def get_stats():
+    with _lock:
+        return {
+            **_counters,
+            'projects': len(_projects),
+            'age_seconds': round(time.time() - _synced_at) if _synced_at else None,
+            'enabled': PROJECT_CATALOG_SYNC_INTERVAL > 0 and bool(ASANA_PAT)
+        }
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+import bisect
+import heapq
+import threading
+import unicodedata
+import metrics
+from config_store import get_config, MAX_PROJECT_OPTIONS, MAX_OPTION_TEXT
+
+# Proyectos de uso reciente que se recuerdan para el ranking
+PROJECT_SEARCH_RECENT_SIZE = int(os.getenv('PROJECT_SEARCH_RECENT_SIZE', '500'))
+# Vida media (segundos) del peso de un uso reciente en el ranking
+PROJECT_SEARCH_RECENCY_HALF_LIFE = float(os.getenv('PROJECT_SEARCH_RECENCY_HALF_LIFE', str(7 * 24 * 3600)))
+
+# Calidad del match, de mejor a peor
+MATCH_PREFIX = 0
+MATCH_WORD_PREFIX = 1
+MATCH_SUBSTRING = 2
+
+def normalize(text):
+    """Minúsculas, sin acentos y con un solo espacio entre palabras"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', stripped.lower())).strip()
+
+class ProjectIndex:
+    """Índice de búsqueda armado a partir de un snapshot de config_store. No se modifica: se reemplaza entero"""
+
+    def __init__(self, project_names, channel_map, version):
+        self.version = version
+        # Orden alfabético: también es el desempate del ranking
+        entries = sorted(project_names.items(), key=lambda item: normalize(item[1]))
+        self.gids = [gid for gid, _ in entries]
+        self.names = [name for _, name in entries]
+        self.normalized = [normalize(name) for _, name in entries]
+        self.position = {gid: i for i, gid in enumerate(self.gids)}
+        # Opciones de Slack ya armadas, una por proyecto
+        self.options = [
+            {"text": {"type": "plain_text", "text": name[:MAX_OPTION_TEXT]}, "value": gid}
+            for gid, name in entries
+        ]
+        # Todos los nombres en un solo string: la búsqueda de subcadenas la hace str.find en C
+        self.joined = '\n'.join(self.normalized)
+        self.starts = []
+        offset = 0
+        for name in self.normalized:
+            self.starts.append(offset)
+            offset += len(name) + 1
+        # Palabras de todos los nombres, ordenadas, para buscar prefijos con bisect
+        words = sorted((word, i) for i, name in enumerate(self.normalized) for word in set(name.split()))
+        self.words = [word for word, _ in words]
+        self.word_projects = [i for _, i in words]
+        # Proyectos asociados a cada canal en channel_map.json
+        self.channel_projects = {}
+        for channel, gid in channel_map.items():
+            if gid in self.position:
+                self.channel_projects.setdefault(channel, set()).add(self.position[gid])
+
+    def _word_prefix_matches(self, token):
+        start = bisect.bisect_left(self.words, token)
+        matches = set()
+        for i in range(start, len(self.words)):
+            if not self.words[i].startswith(token):
+                break
+            matches.add(self.word_projects[i])
+        return matches
+
+    def match(self, query):
+        """{posición del proyecto: calidad del match} para la consulta ya normalizada"""
+        if not query:
+            return {}
+        tokens = query.split()
+        # Todas las palabras de la consulta tienen que ser prefijo de alguna palabra del nombre
+        candidates = None
+        for token in sorted(tokens, key=len, reverse=True):
+            found = self._word_prefix_matches(token)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                break
+        matches = {
+            i: MATCH_PREFIX if self.normalized[i].startswith(query) else MATCH_WORD_PREFIX
+            for i in candidates or ()
+        }
+        # Subcadenas dentro de palabras ("tion" en "automation"): sólo si faltan resultados
+        if len(matches) < MAX_PROJECT_OPTIONS:
+            position = self.joined.find(query)
+            while position != -1:
+                i = bisect.bisect_right(self.starts, position) - 1
+                matches.setdefault(i, MATCH_SUBSTRING)
+                # Siguiente nombre: un mismo proyecto cuenta una sola vez
+                next_start = self.starts[i + 1] if i + 1 < len(self.starts) else len(self.joined)
+                position = self.joined.find(query, next_start)
+        return matches
+
+_lock = threading.Lock()
+_index = None
+# gid → (último uso, usos con decaimiento) y (canal, gid) → lo mismo
+_recent = {}
+_recent_by_channel = {}
+_counters = {
+    'queries': 0,
+    'builds': 0,
+    'last_build_ms': None
+}
+
+def get_index():
+    """Índice para la configuración vigente; se rearma sólo si cambió la versión de config_store"""
+    global _index
+    config = get_config()
+    index = _index
+    if index is not None and index.version == config.version:
+        return index
+    with _lock:
+        if _index is None or _index.version != config.version:
+            start = time.perf_counter()
+            _index = ProjectIndex(config.project_names, config.channel_map, config.version)
+            _counters['builds'] += 1
+            _counters['last_build_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return _index
+
+def _decayed(entry, now):
+    if entry is None:
+        return 0.0
+    last_used, weight = entry
+    return weight * 0.5 ** ((now - last_used) / PROJECT_SEARCH_RECENCY_HALF_LIFE)
+
+def _bump(table, key, now):
+    table[key] = (now, _decayed(table.get(key), now) + 1.0)
+    if len(table) > PROJECT_SEARCH_RECENT_SIZE:
+        # Se descarta el de menor peso: pasa pocas veces y la tabla es chica
+        del table[min(table, key=lambda k: _decayed(table[k], now))]
+
+def record_use(project_id, channel=None):
+    """Registra que se creó una tarea en el proyecto (desde el canal), para subirlo en el ranking"""
+    now = time.time()
+    with _lock:
+        _bump(_recent, project_id, now)
+        if channel:
+            _bump(_recent_by_channel, (channel, project_id), now)
+
+def search(query, channel=None, limit=MAX_PROJECT_OPTIONS, index=None):
+    """Opciones de Slack para la consulta: primero los proyectos del canal, después los más usados y los mejores matches"""
+    start = time.perf_counter()
+    index = index or get_index()
+    normalized = normalize(query or '')
+    now = time.time()
+    affinity = index.channel_projects.get(channel, set())
+    with _lock:
+        recent = {gid: _decayed(entry, now) for gid, entry in _recent.items()}
+        recent_here = {gid: _decayed(entry, now) for (ch, gid), entry in _recent_by_channel.items() if ch == channel}
+
+    if normalized:
+        matches = index.match(normalized)
+    else:
+        # Sin texto: proyectos del canal y usados recientemente, y después el resto en orden alfabético
+        matches = dict.fromkeys(affinity, MATCH_PREFIX)
+        matches.update((index.position[gid], MATCH_PREFIX) for gid in recent if gid in index.position)
+        for i in range(min(len(index.gids), limit)):
+            matches.setdefault(i, MATCH_SUBSTRING)
+
+    def rank(i):
+        gid = index.gids[i]
+        return (i not in affinity, -recent_here.get(gid, 0.0), matches[i], -recent.get(gid, 0.0), i)
+
+    ranked = heapq.nsmallest(limit, matches, key=rank)
+    with _lock:
+        _counters['queries'] += 1
+    metrics.observe('project_search_seconds', time.perf_counter() - start,
+                    help_text='Búsqueda de proyectos para el selector del modal')
+    return [index.options[i] for i in ranked]
+
+def option_for(project_id):
+    """Opción de Slack para el proyecto (para initial_option), o None"""
+    index = get_index()
+    position = index.position.get(project_id)
+    return index.options[position] if position is not None else None
+
+def get_stats():
+    index = _index
+    with _lock:
+        counters = dict(_counters)
+        recent = len(_recent)
+    return {
+        **counters,
+        'projects': len(index.gids) if index else 0,
+        'words': len(index.words) if index else 0,
+        'recent_projects': recent
+    }
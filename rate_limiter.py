@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import random
+import threading
+from urllib.parse import urlsplit
+
+# Máximo de segundos que un request espera por un token antes de fallar con RateLimitExceeded
+# (los llamadores que no pueden perder el request pasan un max_wait mayor)
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '20'))
+
+def _per_minute(env_name, default):
+    return float(os.getenv(env_name, str(default))) / 60.0
+
+# Tiers de Slack (requests por minuto): https://api.slack.com/docs/rate-limits
+SLACK_TIER_1 = 1
+SLACK_TIER_2 = 20
+SLACK_TIER_3 = 50
+SLACK_TIER_4 = 100
+
+# (requests por segundo, ráfaga máxima) por método de Slack
+SLACK_METHOD_LIMITS = {
+    # chat.postMessage es ~1 mensaje por segundo por canal, se limita por canal
+    'chat.postMessage': (_per_minute('SLACK_POST_MESSAGE_PER_MINUTE', 60), 3),
+    'users.info': (_per_minute('SLACK_USERS_INFO_PER_MINUTE', SLACK_TIER_4), 20),
+    'users.list': (_per_minute('SLACK_USERS_LIST_PER_MINUTE', SLACK_TIER_2), 5),
+    'views.open': (_per_minute('SLACK_VIEWS_OPEN_PER_MINUTE', SLACK_TIER_4), 20)
+}
+SLACK_DEFAULT_LIMIT = (SLACK_TIER_3 / 60.0, 10)
+
+# (requests por segundo, ráfaga máxima) por host
+HOST_LIMITS = {
+    'hooks.slack.com': (1.0, 5),
+    'app.asana.com': (_per_minute('ASANA_RATE_PER_MINUTE', 150), 15),
+    'api.openai.com': (_per_minute('OPENAI_RATE_PER_MINUTE', 500), 20),
+    'api.anthropic.com': (_per_minute('CLAUDE_RATE_PER_MINUTE', 50), 5)
+}
+
+class RateLimitExceeded(Exception):
+    """El request tendría que esperar más de max_wait por un token. wait: los segundos que faltaban"""
+
+    def __init__(self, key, wait, max_wait):
+        super().__init__(f"Rate limit en {key}: se necesitaría esperar {wait:.1f}s (máximo {max_wait:.1f}s)")
+        self.key = key
+        self.wait = wait
+
+class TokenBucket:
+    """Token bucket thread-safe. rate en tokens por segundo, capacity es la ráfaga máxima"""
+
+    def __init__(self, rate, capacity, key=''):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.retry_after_hits = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Reserva un token y devuelve los segundos que hay que esperar antes de usarlo.
+        Si la espera supera max_wait no reserva nada y lanza RateLimitExceeded"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Los tokens pueden quedar negativos: cada request reserva su turno
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, self.blocked_until - now, 0.0)
+            if wait > max_wait:
+                self.tokens += 1
+                self.rejected += 1
+                raise RateLimitExceeded(self.key, wait, max_wait)
+            if wait > 0:
+                self.throttled += 1
+                self.waited_seconds += wait
+        return wait
+
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Toma un token, esperando si hace falta. Devuelve los segundos esperados"""
+        wait = self.reserve(max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Como acquire, pero sin bloquear el event loop"""
+        wait = self.reserve(max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def block_for(self, seconds):
+        """Frena a todos los que usan este bucket (ej. al recibir Retry-After)"""
+        with self.lock:
+            self.retry_after_hits += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def get_stats(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return {
+                'tokens': round(self.tokens, 2),
+                'capacity': self.capacity,
+                'rate_per_minute': round(self.rate * 60, 2),
+                'throttled': self.throttled,
+                'retry_after_hits': self.retry_after_hits,
+                'rejected': self.rejected,
+                'waited_seconds': round(self.waited_seconds, 3)
+            }
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def bucket_key(url, json_body=None, slack_api_url='https://slack.com/api'):
+    """Nombre del bucket para el request: por método en Slack (y por canal en chat.postMessage), por host en el resto"""
+    if url.startswith(slack_api_url + '/'):
+        method = urlsplit(url).path.rsplit('/', 1)[-1]
+        if method == 'chat.postMessage' and isinstance(json_body, dict) and json_body.get('channel'):
+            return f"slack:{method}:{json_body['channel']}"
+        return f"slack:{method}"
+    return urlsplit(url).hostname or ''
+
+def _limits_for(key):
+    if key.startswith('slack:'):
+        method = key.split(':')[1]
+        return SLACK_METHOD_LIMITS.get(method, SLACK_DEFAULT_LIMIT)
+    return HOST_LIMITS.get(key)
+
+def get_bucket(key):
+    """Devuelve el bucket para la clave, o None si el destino no tiene límite configurado"""
+    bucket = _buckets.get(key)
+    if bucket is None:
+        limits = _limits_for(key)
+        if limits is None:
+            return None
+        with _buckets_lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(*limits, key=key)
+                _buckets[key] = bucket
+    return bucket
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Backoff exponencial con full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def get_stats():
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {key: bucket.get_stats() for key, bucket in buckets.items()}
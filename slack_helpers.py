@@ -1,20 +1,32 @@
 import os
 import json
-import requests
+import http_client
 import logging
+import log_pipeline
 from utils import send_slack
+from config_store import get_config
+import slack_users
+import project_search
 #from dotenv import load_dotenv
 
 #load_dotenv()
 
 SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
+# 'static': la lista fija de los primeros 100 proyectos. 'external': selector con búsqueda contra
+# /slack/options; sólo activarlo después de configurar la "Options Load URL" de la app de Slack,
+# sin ella el selector queda vacío y el modal no se puede enviar
+PROJECT_SELECT_MODE = os.getenv('PROJECT_SELECT_MODE', 'static')
+# Espera máxima por el rate limiter para los mensajes que el usuario tiene que ver (botón y
+# confirmaciones). Más que RATE_LIMIT_MAX_WAIT: mejor llegar tarde que perderlos
+SLACK_POST_MAX_WAIT = float(os.getenv('SLACK_POST_MAX_WAIT', '300'))
 
-def post_message_with_button(channel, thread_ts, original_message, commitment_data, message_ts):
-    headers = {
+def _bot_headers():
+    return {
         'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
         'Content-Type': 'application/json'
     }
-    
+
+def _button_message(channel, thread_ts, commitment_ref):
     attachments = [
         {
             "text": "📝 Este mensaje parece un compromiso. ¿Querés crear una tarea en Asana?",
@@ -27,118 +39,99 @@ def post_message_with_button(channel, thread_ts, original_message, commitment_da
                     "name": "create_asana_task",
                     "text": "✅ Crear tarea en Asana",
                     "type": "button",
-                    "value": json.dumps({
-                        "commitment_data": commitment_data,
-                        "original_message": original_message,
-                        "thread_ts": thread_ts,
-                        "message_ts": message_ts
-                    })
+                    # El compromiso queda en commitment_store; el botón lleva el ID y el hilo
+                    # (commitment_store.reference) para no depender de la instancia que lo guardó
+                    "value": commitment_ref
                 }
             ]
         }
     ]
     
-    data = {
+    return {
         'channel': channel,
         'thread_ts': thread_ts,
         'attachments': attachments
     }
-    
-    response = requests.post(
-        'https://slack.com/api/chat.postMessage',
-        headers=headers,
-        json=data
-    )
-    
+
+def _check_response(response, error_prefix):
     if response.status_code != 200 or not response.json().get('ok'):
-        logging.error(f"Error posting message with button: {response.json()}")
-        send_slack(f"Error posting message with button: {response.json()}")
+        logging.error(error_prefix, extra=log_pipeline.fields(status=response.status_code,
+                                                               response=log_pipeline.redact(response.json())))
+        send_slack(f"{error_prefix}: {response.json()}")
     
     return response.json()
 
+def post_message_with_button(channel, thread_ts, commitment_ref):
+    response = http_client.post(
+        f'{http_client.SLACK_API_URL}/chat.postMessage',
+        headers=_bot_headers(),
+        json=_button_message(channel, thread_ts, commitment_ref),
+        max_wait=SLACK_POST_MAX_WAIT
+    )
+    return _check_response(response, "Error posting message with button")
+
+async def post_message_with_button_async(channel, thread_ts, commitment_ref):
+    response = await http_client.post_async(
+        f'{http_client.SLACK_API_URL}/chat.postMessage',
+        headers=_bot_headers(),
+        json=_button_message(channel, thread_ts, commitment_ref),
+        max_wait=SLACK_POST_MAX_WAIT
+    )
+    return _check_response(response, "Error posting message with button")
+
 def post_thread_message(channel, thread_ts, text):
-    headers = {
-        'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    
-    data = {
-        'channel': channel,
-        'thread_ts': thread_ts,
-        'text': text
-    }
-    
-    response = requests.post(
-        'https://slack.com/api/chat.postMessage',
-        headers=headers,
-        json=data
+    response = http_client.post(
+        f'{http_client.SLACK_API_URL}/chat.postMessage',
+        headers=_bot_headers(),
+        json={'channel': channel, 'thread_ts': thread_ts, 'text': text},
+        max_wait=SLACK_POST_MAX_WAIT
     )
-    
-    if response.status_code != 200 or not response.json().get('ok'):
-        logging.error(f"Error posting thread message: {response.json()}")
-        send_slack(f"Error posting thread message: {response.json()}")
-    
-    return response.json()
+    return _check_response(response, "Error posting thread message")
 
-def get_user_info(user_id):
-    headers = {
-        'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
-    params = {
-        'user': user_id
-    }
-    
-    response = requests.get(
-        'https://slack.com/api/users.info',
-        headers=headers,
-        params=params
+async def post_thread_message_async(channel, thread_ts, text):
+    response = await http_client.post_async(
+        f'{http_client.SLACK_API_URL}/chat.postMessage',
+        headers=_bot_headers(),
+        json={'channel': channel, 'thread_ts': thread_ts, 'text': text},
+        max_wait=SLACK_POST_MAX_WAIT
     )
-    
-    if response.status_code == 200 and response.json().get('ok'):
-        return response.json().get('user', {})
-    else:
-        logging.error(f"Error getting user info: {response.json()}")
-        send_slack(f"Error getting user info: {response.json()}")
-        return {}
+    return _check_response(response, "Error posting thread message")
 
-def open_task_dialog(trigger_id, commitment_data, original_message, channel, thread_ts):
-    headers = {
-        'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    msg_url = f"https://nomadicseo.slack.com/archives/{channel}/p{thread_ts.replace('.','')}"
-    # Cargar proyectos de Asana
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    asana_projects_path = os.path.join(current_dir, 'asana_pj.json')
-    
-    try:
-        with open(asana_projects_path, 'r', encoding='utf-8') as f:
-            asana_projects = json.load(f)
-    except:
-        asana_projects = {}
-    
-    # Crear opciones para el selector de proyectos
-    full_project_options = [
-    {
-        "text": {
-            "type": "plain_text",
-            "text": project_name[:75]
-        },
-        "value": project_id
-    }
-    for project_name, project_id in sorted(asana_projects.items())
-]
+def post_ephemeral_message(channel, user, text):
+    """Mensaje que sólo ve user (ej. avisar que un botón ya no sirve)"""
+    response = http_client.post(
+        f'{http_client.SLACK_API_URL}/chat.postEphemeral',
+        headers=_bot_headers(),
+        json={'channel': channel, 'user': user, 'text': text}
+    )
+    return _check_response(response, "Error posting ephemeral message")
+
+def get_user_info(user_id):
+    # Perfil desde el cache de slack_users (users.info sólo si no está o venció)
+    return slack_users.get_user(user_id)
 
-    project_options = full_project_options[:100]  # Slack permite como máximo 100 opciones
+def build_task_view(commitment_data, original_message, channel, thread_ts, commitment_ref=None, config=None):
+    """Vista del modal de creación de tarea, con el proyecto del canal preseleccionado"""
+    msg_url = f"https://nomadicseo.slack.com/archives/{channel}/p{thread_ts.replace('.','')}"
+    config = config or get_config()
     
     # Obtener el proyecto por defecto basado en el canal
-    from channel_map import get_asana_project_id
-    try:
-        default_project_id = get_asana_project_id(channel)
-    except:
-        default_project_id = None
+    default_project_id = config.channel_map.get(channel)
+    
+    if PROJECT_SELECT_MODE == 'external':
+        # Las opciones las pide Slack a /slack/options a medida que se escribe
+        project_select = {
+            "type": "external_select",
+            "min_query_length": 0
+        }
+        initial_option = project_search.option_for(default_project_id)
+    else:
+        # Opciones de proyectos ya ordenadas y truncadas por config_store
+        project_select = {
+            "type": "static_select",
+            "options": list(config.project_options)
+        }
+        initial_option = config.option_by_project.get(default_project_id)
     
     view = {
         "type": "modal",
@@ -155,7 +148,8 @@ def open_task_dialog(trigger_id, commitment_data, original_message, channel, thr
             "type": "plain_text",
             "text": "Cancelar"
         },
-        "private_metadata": json.dumps({
+        # La referencia del compromiso; los botones publicados antes de commitment_store no la tienen
+        "private_metadata": commitment_ref or json.dumps({
             "commitment_data": commitment_data,
             "original_message": original_message,
             "channel": channel,
@@ -170,14 +164,13 @@ def open_task_dialog(trigger_id, commitment_data, original_message, channel, thr
                     "text": "Proyecto de Asana"
                 },
                 "element": {
-                    "type": "static_select",
+                    **project_select,
                     "action_id": "project_select",
                     "placeholder": {
                         "type": "plain_text",
-                        "text": "Seleccionar proyecto"
+                        "text": "Buscar proyecto" if PROJECT_SELECT_MODE == 'external' else "Seleccionar proyecto"
                     },
-                    "options": project_options,
-                    **({"initial_option": next((opt for opt in project_options if opt["value"] == default_project_id), None)} if default_project_id and any(opt["value"] == default_project_id for opt in project_options) else {})
+                    **({"initial_option": initial_option} if initial_option else {})
                 }
             },
             {
@@ -190,7 +183,8 @@ def open_task_dialog(trigger_id, commitment_data, original_message, channel, thr
                 "element": {
                     "type": "plain_text_input",
                     "action_id": "title_input",
-                    "initial_value": commitment_data['descripcion'],
+                    # El LLM puede devolver descripcion null: Slack rechaza initial_value null
+                    **({"initial_value": commitment_data['descripcion']} if commitment_data.get('descripcion') else {}),
                     "placeholder": {
                         "type": "plain_text",
                         "text": "Ingresa el título"
@@ -208,7 +202,8 @@ def open_task_dialog(trigger_id, commitment_data, original_message, channel, thr
                     "type": "plain_text_input",
                     "action_id": "description_input",
                     "multiline": True,
-                    "initial_value": f"Mensaje original: {original_message} en {msg_url}",
+                    # Sin el mensaje original (compromiso guardado en otra instancia) queda el link
+                    "initial_value": f"Mensaje original: {original_message} en {msg_url}" if original_message else f"Mensaje original: {msg_url}",
                     "placeholder": {
                         "type": "plain_text",
                         "text": "Agrega una descripción detallada"
@@ -274,25 +269,29 @@ def open_task_dialog(trigger_id, commitment_data, original_message, channel, thr
         ]
     }
     
-    data = {
-        "trigger_id": trigger_id,
-        "view": view
-    }
+    return view
+
+def open_view(trigger_id, view_json):
+    """views.open con la vista ya serializada: sólo se arma el envoltorio con el trigger_id"""
+    body = f'{{"trigger_id": {json.dumps(trigger_id)}, "view": {view_json}}}'
     
-    logging.info(f"Opening modal with trigger_id: {trigger_id}")
-    #logging.info("Modal data being sent: " + json.dumps(data, separators=(',', ':')))
+    logging.info("Opening modal")
     
-    response = requests.post(
-        'https://slack.com/api/views.open',
-        headers=headers,
-        json=data
+    response = http_client.post(
+        f'{http_client.SLACK_API_URL}/views.open',
+        headers=_bot_headers(),
+        data=body.encode('utf-8')
     )
     
-    logging.info(f"Response status code: {response.status_code}")
-    logging.info(f"Response body: {response.json()}")
+    logging.info("views.open response: %s", response.status_code)
     
     if response.status_code != 200 or not response.json().get('ok'):
-        logging.error(f"Error opening dialog: {response.json()}")
+        logging.error("Error opening dialog", extra=log_pipeline.fields(status=response.status_code,
+                                                                         response=log_pipeline.redact(response.json())))
         send_slack(f"Error opening dialog: {response.json()}")
     
-    return response.json()
\ No newline at end of file
+    return response.json()
+
+def open_task_dialog(trigger_id, commitment_data, original_message, channel, thread_ts, commitment_ref=None):
+    view = build_task_view(commitment_data, original_message, channel, thread_ts, commitment_ref)
+    return open_view(trigger_id, json.dumps(view))
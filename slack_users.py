@@ -0,0 +1,196 @@
+import os
+import time
+import logging
+import threading
+import http_client
+import asana_users
+from utils import send_slack
+
+SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
+
+# Segundos que un perfil cacheado se considera vigente
+SLACK_USERS_TTL = int(os.getenv('SLACK_USERS_TTL', str(24 * 3600)))
+# Cada cuánto se recarga el directorio completo con users.list (0 desactiva la carga en background)
+SLACK_USERS_REFRESH_INTERVAL = int(os.getenv('SLACK_USERS_REFRESH_INTERVAL', str(6 * 3600)))
+SLACK_USERS_PAGE_SIZE = 200
+
+_lock = threading.Lock()
+# user_id → (perfil, fetched_at)
+_profiles = {}
+# user_id de Slack → gid de Asana
+_asana_gids = {}
+_refresher = None
+_counters = {
+    'hits': 0,
+    'misses': 0,
+    'fetches': 0,
+    'bulk_loads': 0,
+    'events_applied': 0,
+    'join_hits': 0,
+    'join_misses': 0
+}
+
+def _store_profile(user, fetched_at):
+    user_id = user['id']
+    email = (user.get('profile', {}).get('email') or '').lower()
+    with _lock:
+        previous = _profiles.get(user_id)
+        _profiles[user_id] = (user, fetched_at)
+        # Si cambió el email la asociación con Asana ya no vale
+        if previous and (previous[0].get('profile', {}).get('email') or '').lower() != email:
+            _asana_gids.pop(user_id, None)
+
+def warm():
+    """Carga todos los usuarios del workspace con users.list paginado"""
+    headers = {
+        'Authorization': f'Bearer {SLACK_BOT_TOKEN}'
+    }
+    params = {
+        'limit': SLACK_USERS_PAGE_SIZE
+    }
+
+    loaded = 0
+    fetched_at = time.time()
+    while True:
+        response = http_client.get(
+            f'{http_client.SLACK_API_URL}/users.list',
+            headers=headers,
+            params=params
+        )
+        body = response.json()
+        if response.status_code != 200 or not body.get('ok'):
+            raise Exception(f"Error listing Slack users: {body}")
+
+        for user in body.get('members', []):
+            if not user.get('deleted') and not user.get('is_bot'):
+                _store_profile(user, fetched_at)
+                loaded += 1
+
+        cursor = body.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            break
+        params['cursor'] = cursor
+
+    with _lock:
+        _counters['bulk_loads'] += 1
+    logging.info("Directorio de usuarios de Slack cargado: %s usuarios", loaded)
+    _precompute_asana_gids()
+
+def _precompute_asana_gids():
+    """Arma la tabla user_id de Slack → gid de Asana con el directorio de Asana ya cargado"""
+    with _lock:
+        emails = {
+            user_id: (user.get('profile', {}).get('email') or '').lower()
+            for user_id, (user, _) in _profiles.items()
+        }
+
+    joined = {}
+    for user_id, email in emails.items():
+        if email:
+            gid = asana_users.get_gid_by_email(email, reload_on_miss=False)
+            if gid:
+                joined[user_id] = gid
+
+    with _lock:
+        _asana_gids.update(joined)
+    logging.info("Tabla Slack→Asana precalculada: %s usuarios", len(joined))
+
+def _fetch_user(user_id):
+    headers = {
+        'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+
+    params = {
+        'user': user_id
+    }
+
+    response = http_client.get(
+        f'{http_client.SLACK_API_URL}/users.info',
+        headers=headers,
+        params=params
+    )
+
+    with _lock:
+        _counters['fetches'] += 1
+    if response.status_code == 200 and response.json().get('ok'):
+        return response.json().get('user', {})
+    else:
+        logging.error("Error getting user info: %s", response.json())
+        send_slack(f"Error getting user info: {response.json()}")
+        return {}
+
+def get_user(user_id):
+    """Devuelve el perfil de Slack del usuario, desde el cache si está vigente"""
+    with _lock:
+        entry = _profiles.get(user_id)
+        if entry and time.time() - entry[1] < SLACK_USERS_TTL:
+            _counters['hits'] += 1
+            return entry[0]
+        _counters['misses'] += 1
+
+    user = _fetch_user(user_id)
+    if user:
+        _store_profile(user, time.time())
+    return user
+
+def get_asana_gid(user_id):
+    """gid de Asana del usuario de Slack, o None. Sin llamadas de red si ya está en la tabla"""
+    with _lock:
+        gid = _asana_gids.get(user_id)
+        _counters['join_hits' if gid else 'join_misses'] += 1
+    if gid:
+        return gid
+
+    email = get_user(user_id).get('profile', {}).get('email')
+    try:
+        gid = asana_users.get_gid_by_email(email) if email else None
+    except Exception as e:
+        # create_asana_task vuelve a intentar por email
+        logging.error("Error buscando el usuario %s en Asana: %s", user_id, e)
+        gid = None
+    if gid:
+        with _lock:
+            _asana_gids[user_id] = gid
+    return gid
+
+def handle_event(event):
+    """Mantiene el cache al día con los eventos user_change y team_join"""
+    user = event.get('user')
+    if not isinstance(user, dict) or not user.get('id'):
+        return
+    if user.get('deleted'):
+        with _lock:
+            _profiles.pop(user['id'], None)
+            _asana_gids.pop(user['id'], None)
+    else:
+        _store_profile(user, time.time())
+    with _lock:
+        _counters['events_applied'] += 1
+
+def _refresh_loop():
+    while True:
+        try:
+            warm()
+        except Exception as e:
+            logging.error("Error cargando usuarios de Slack: %s", e)
+        time.sleep(SLACK_USERS_REFRESH_INTERVAL)
+
+def start_background_refresh():
+    """Carga el directorio en background al arrancar y lo refresca cada SLACK_USERS_REFRESH_INTERVAL"""
+    global _refresher
+    if SLACK_USERS_REFRESH_INTERVAL <= 0 or not SLACK_BOT_TOKEN:
+        return
+    with _lock:
+        if _refresher:
+            return
+        _refresher = threading.Thread(target=_refresh_loop, name='slack-users-refresh', daemon=True)
+        _refresher.start()
+
+def get_stats():
+    with _lock:
+        return {
+            **_counters,
+            'profiles': len(_profiles),
+            'asana_join_size': len(_asana_gids)
+        }
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import logging
+import builtins
+import threading
+
+# STARTUP_PROFILE=1 mide el tiempo de import de cada módulo y de cada paso de inicialización
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+# Reintentos de una inicialización que falló: STARTUP_RETRY_BASE * 2^(intento - 1) segundos, hasta STARTUP_RETRY_MAX
+STARTUP_RETRY_BASE = float(os.getenv('STARTUP_RETRY_BASE', '2'))
+STARTUP_RETRY_MAX = float(os.getenv('STARTUP_RETRY_MAX', '60'))
+
+BOOT_TIME = time.perf_counter()
+
+_lock = threading.Lock()
+# nombre → {'status': 'pending'|'ready'|'failed', 'required': bool, 'attempts': int, 'seconds': float, 'error': str}
+_components = {}
+_import_times = {}
+_original_import = builtins.__import__
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        # Tiempo inclusivo: incluye los imports que hace el módulo
+        _import_times.setdefault(name, time.perf_counter() - start)
+
+def enable_import_profile():
+    """Instala el hook que mide los imports. Hay que llamarlo antes de importar el resto"""
+    if STARTUP_PROFILE:
+        builtins.__import__ = _timed_import
+
+def _finish_import_profile():
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+def run_in_background(name, func, required=True):
+    """Corre una inicialización en un thread aparte y registra su estado para el readiness.
+
+    Si falla se reintenta con backoff hasta que salga bien: una falla al arrancar (ej. Asana caído)
+    no deja la instancia sin readiness para siempre. required=False: el componente se muestra en
+    /health pero no frena el readiness (ej. los que también se resuelven en el primer uso).
+    """
+    with _lock:
+        _components[name] = {'status': 'pending', 'required': required, 'attempts': 0}
+
+    def run():
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                func()
+                status = {'status': 'ready'}
+            except Exception as e:
+                delay = min(STARTUP_RETRY_BASE * (2 ** (attempts - 1)), STARTUP_RETRY_MAX)
+                status = {'status': 'failed', 'error': str(e), 'retry_in': delay}
+                logging.error("Error inicializando %s (intento %s, reintento en %.0fs): %s", name, attempts, delay, e)
+            status.update(required=required, attempts=attempts, seconds=round(time.perf_counter() - start, 3))
+            with _lock:
+                _components[name] = status
+            if status['status'] == 'ready':
+                break
+            time.sleep(delay)
+        if is_ready():
+            _on_ready()
+
+    threading.Thread(target=run, name=f"init-{name}", daemon=True).start()
+
+def _on_ready():
+    _finish_import_profile()
+    if STARTUP_PROFILE:
+        logging.info("Startup profile: %s", get_profile())
+
+def is_ready():
+    """True cuando terminaron bien todas las inicializaciones requeridas"""
+    with _lock:
+        return all(component['status'] == 'ready' for component in _components.values() if component['required'])
+
+def get_components():
+    with _lock:
+        return {name: dict(component) for name, component in _components.items()}
+
+def get_profile(top=25):
+    """Tiempos de import (los más lentos) y de cada inicialización, en ms"""
+    imports = sorted(_import_times.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'imports_ms': {name: round(seconds * 1000, 1) for name, seconds in imports},
+        'init_ms': {
+            name: round(component['seconds'] * 1000, 1)
+            for name, component in get_components().items() if 'seconds' in component
+        }
+    }
+
+def mark_app_loaded():
+    """Registra cuánto tardó en importarse la app (lo que bloquea a gunicorn antes de servir)"""
+    _import_times.setdefault('<app loaded>', time.perf_counter() - BOOT_TIME)
+    if STARTUP_PROFILE:
+        logging.warning("App cargada en %.0fms", (time.perf_counter() - BOOT_TIME) * 1000)
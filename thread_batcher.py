@@ -0,0 +1,76 @@
+import os
+import logging
+import threading
+import event_queue
+import metrics
+
+# Segundos que se esperan mensajes del mismo hilo (o del mismo canal, si no son respuestas) antes de evaluarlos juntos (0 desactiva)
+THREAD_BATCH_DELAY = float(os.getenv('THREAD_BATCH_DELAY', '2'))
+# Máximo de mensajes por request al LLM; al llegar se evalúa sin esperar el delay
+THREAD_BATCH_MAX_SIZE = int(os.getenv('THREAD_BATCH_MAX_SIZE', '10'))
+
+_lock = threading.Lock()
+# (canal, thread_ts o None para los mensajes sueltos del canal) → {'events': [...], 'timer': threading.Timer}
+_pending = {}
+_counters = {
+    'messages': 0,
+    'batches': 0,
+    'dropped': 0
+}
+
+def add(event, handler):
+    """Agrupa el evento con los demás del mismo hilo; handler(events) corre en la cola de eventos.
+
+    Los mensajes que no son respuestas se agrupan por canal: cada uno sigue teniendo
+    su propio ts, así que el handler contesta en el hilo de cada mensaje.
+    """
+    if THREAD_BATCH_DELAY <= 0:
+        _dispatch([event], handler)
+        return
+
+    key = (event['channel'], event.get('thread_ts'))
+    with _lock:
+        batch = _pending.get(key)
+        if batch is None:
+            timer = threading.Timer(THREAD_BATCH_DELAY, _flush, args=(key,))
+            timer.daemon = True
+            batch = {'events': [], 'handler': handler, 'timer': timer, 'trace_id': metrics.get_trace_id()}
+            _pending[key] = batch
+            timer.start()
+        batch['events'].append(event)
+        full = len(batch['events']) >= THREAD_BATCH_MAX_SIZE
+
+    if full:
+        batch['timer'].cancel()
+        _flush(key)
+
+def _flush(key):
+    with _lock:
+        batch = _pending.pop(key, None)
+    if batch:
+        # El timer corre en otro thread: seguir el trace del primer mensaje del batch
+        metrics.set_trace_id(batch['trace_id'])
+        _dispatch(batch['events'], batch['handler'])
+
+def _dispatch(events, handler):
+    # La llamada al LLM corre en los workers de la cola, no en el thread del timer
+    if event_queue.submit(handler, events):
+        with _lock:
+            _counters['messages'] += len(events)
+            _counters['batches'] += 1
+    else:
+        with _lock:
+            _counters['dropped'] += len(events)
+        logging.warning("Batch de %s mensajes descartado por la cola de eventos", len(events))
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+        pending_threads = len(_pending)
+    return {
+        **counters,
+        'pending_threads': pending_threads,
+        'llm_requests_saved': counters['messages'] - counters['batches'],
+        'delay_seconds': THREAD_BATCH_DELAY,
+        'max_size': THREAD_BATCH_MAX_SIZE
+    }
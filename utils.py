@@ -1,9 +1,28 @@
-import firebase_service, requests, json, logging
+import firebase_service, http_client, json, logging, threading, os
+import alerts
 
-ACCESO = firebase_service.acces_firebase_db()
-error_webhook = ACCESO['error_webhook']
+# La config de /acceso se lee de Firebase recién cuando se necesita (o en el warmup de main),
+# así importar este módulo no hace llamadas de red
+_acceso = None
+_acceso_lock = threading.Lock()
 
-def send_slack(text):
+def get_acceso():
+  global _acceso
+  if _acceso is None:
+    with _acceso_lock:
+      if _acceso is None:
+        _acceso = firebase_service.acces_firebase_db()
+  return _acceso
+
+def get_error_webhook():
+  # ERROR_WEBHOOK_URL evita leer Firebase (útil para correr localmente o en benchmarks)
+  return os.getenv('ERROR_WEBHOOK_URL') or get_acceso()['error_webhook']
+
+def post_to_webhook(text):
   slack_data = {'text': "[TRACKER-BOT] " + text}
-  response = requests.post(error_webhook, data=json.dumps(slack_data), headers={'Content-Type': 'application/json'})
-  logging.info(response.status_code)
\ No newline at end of file
+  response = http_client.post(get_error_webhook(), data=json.dumps(slack_data), headers={'Content-Type': 'application/json'})
+  logging.info(response.status_code)
+
+def send_slack(text, priority=alerts.PRIORITY_NORMAL):
+  # No bloquea: alerts agrupa los errores repetidos y los manda en batch desde otro thread
+  alerts.dispatch(text, priority)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Tier en memoria (LRU con TTL)
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', '5000'))
+VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', str(7 * 24 * 3600)))
+# Tier persistente opcional: ruta a un archivo SQLite compartido entre reinicios
+VERDICT_CACHE_DB = os.getenv('VERDICT_CACHE_DB')
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_db = None
+_counters = {
+    'memory_hits': 0,
+    'persistent_hits': 0,
+    'misses': 0,
+    'stores': 0
+}
+
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def make_key(text, model, prompt_version):
+    raw = f"{model}\n{prompt_version}\n{normalize_text(text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _get_db():
+    global _db
+    if not VERDICT_CACHE_DB:
+        return None
+    if _db is None:
+        _db = sqlite3.connect(VERDICT_CACHE_DB, check_same_thread=False)
+        _db.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        _db.commit()
+    return _db
+
+def _remember(key, verdict, created_at):
+    _memory[key] = (verdict, created_at)
+    _memory.move_to_end(key)
+    while len(_memory) > VERDICT_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+def get(text, model, prompt_version):
+    """Devuelve el veredicto cacheado para el mensaje, o None"""
+    return get_any(text, (model,), prompt_version)
+
+def get_any(text, models, prompt_version):
+    """Como get, pero acepta el veredicto de cualquiera de los modelos (en orden). Cuenta un solo miss"""
+    now = time.time()
+
+    with _lock:
+        for model in models:
+            verdict = _lookup(make_key(text, model, prompt_version), now)
+            if verdict is not None:
+                return verdict
+        _counters['misses'] += 1
+        return None
+
+def _lookup(key, now):
+    # Se llama con _lock tomado
+    entry = _memory.get(key)
+    if entry and now - entry[1] < VERDICT_CACHE_TTL:
+        _memory.move_to_end(key)
+        _counters['memory_hits'] += 1
+        return dict(entry[0])
+    if entry:
+        del _memory[key]
+
+    try:
+        db = _get_db()
+        row = db.execute(
+            "SELECT verdict, created_at FROM verdicts WHERE key = ?", (key,)
+        ).fetchone() if db else None
+    except sqlite3.Error as e:
+        logging.error("Error leyendo cache de veredictos: %s", e)
+        row = None
+
+    if row and now - row[1] < VERDICT_CACHE_TTL:
+        verdict = json.loads(row[0])
+        _remember(key, verdict, row[1])
+        _counters['persistent_hits'] += 1
+        return dict(verdict)
+
+    return None
+
+def put(text, model, prompt_version, verdict):
+    key = make_key(text, model, prompt_version)
+    now = time.time()
+
+    with _lock:
+        _remember(key, dict(verdict), now)
+        _counters['stores'] += 1
+        try:
+            db = _get_db()
+            if db:
+                db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, verdict, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(verdict), now)
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            logging.error("Error guardando en cache de veredictos: %s", e)
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+        size = len(_memory)
+
+    hits = counters['memory_hits'] + counters['persistent_hits']
+    lookups = hits + counters['misses']
+    return {
+        **counters,
+        'memory_size': size,
+        'persistent': bool(VERDICT_CACHE_DB),
+        'hit_rate': round(hits / lookups, 4) if lookups else None,
+        'llm_calls_saved': hits
+    }